@@ -0,0 +1,322 @@
+"""
+Нагрузочный тест запущенного сервиса.
+
+Конкурентные асинхронные клиенты в течение заданного времени бронируют
+места, запрашивают карту мест и расписание кинотеатра. Результат - p50/p95/p99
+задержки, запросы в секунду и доля конфликтов бронирования по каждому
+сценарию - печатается и сохраняется в JSON; с --compare сравнивается
+с предыдущим запуском, при деградации код возврата 1.
+
+    $ python -m benchmarks.seed --reset
+    $ uvicorn src.main:app --workers 4
+    $ python -m benchmarks.load --concurrency 64 --duration 60 --output base.json
+    $ python -m benchmarks.load --compare base.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+import httpx
+from tests.create_functions import create_film_show_with_dependencies
+
+SCENARIOS = ("create_booking", "seats", "schedule")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds")
+    parser.add_argument(
+        "--mix",
+        default="create_booking=5,seats=3,schedule=2",
+        help="scenario weights",
+    )
+    parser.add_argument(
+        "--shows", type=int, default=500, help="film shows taking the traffic"
+    )
+    parser.add_argument(
+        "--hot-share",
+        type=float,
+        default=0.2,
+        help="share of bookings sent to the premiere show, they conflict",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="JSON file for the results")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.2,
+        help="allowed relative p95 growth and RPS drop",
+    )
+    return parser.parse_args(argv)
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name}, expected one of {SCENARIOS}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def percentile(values: List[float], percent: float) -> float:
+    # Nearest-rank percentile of sorted values
+    if not values:
+        return 0.0
+    rank = max(math.ceil(percent / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+class Recorder:
+    """Задержки, коды ответов и конфликты по сценариям"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.conflicts: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.enabled = False
+
+    def record(self, scenario: str, latency: float, response: httpx.Response):
+        if not self.enabled:
+            return
+        self.latencies[scenario].append(latency)
+        self.statuses[scenario][response.status_code] += 1
+        if response.status_code == 400 and "busy" in response.text:
+            self.conflicts[scenario] += 1
+
+    def error(self, scenario: str):
+        if self.enabled:
+            self.errors[scenario] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        result = {}
+        for scenario in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies[scenario])
+            requests = len(latencies)
+            result[scenario] = {
+                "requests": requests,
+                "rps": round(requests / elapsed, 1),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+                "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+                "conflict_rate": (
+                    round(self.conflicts[scenario] / requests, 4) if requests else 0.0
+                ),
+                "errors": self.errors[scenario],
+                "statuses": {
+                    str(code): count
+                    for code, count in sorted(self.statuses[scenario].items())
+                },
+            }
+        latencies = sorted(
+            value for items in self.latencies.values() for value in items
+        )
+        requests = len(latencies)
+        result["total"] = {
+            "requests": requests,
+            "rps": round(requests / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "conflict_rate": (
+                round(sum(self.conflicts.values()) / requests, 4) if requests else 0.0
+            ),
+            "errors": sum(self.errors.values()),
+        }
+        return result
+
+
+async def discover(client: httpx.AsyncClient, count: int) -> List[dict]:
+    """Будущие сеансы с размерами залов, по которым пойдет нагрузка"""
+    shows = []
+    cursor = None
+    params = {"start_date": str(date.today() + timedelta(days=1)), "limit": 1000}
+    while len(shows) < count:
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get("/film-show/", params=params)
+        response.raise_for_status()
+        shows += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    shows = shows[:count]
+    cinemas = {}
+    for show in shows:
+        seats = (await client.get(f"/film-show/{show['id']}/seats")).json()
+        show["rows"], show["places_in_row"] = seats["rows"], seats["places_in_row"]
+        if show["id_hall"] not in cinemas:
+            hall = (await client.get(f"/cinema-hall/{show['id_hall']}")).json()
+            cinemas[show["id_hall"]] = hall["id_cinema"]
+        show["id_cinema"] = cinemas[show["id_hall"]]
+    return shows
+
+
+def create_premiere(base_url: str) -> dict:
+    # Small hall all the clients compete for, it is where conflicts come from
+    with httpx.Client(base_url=base_url) as client:
+        id_cinema, _, _, id_film_show = create_film_show_with_dependencies(
+            client, show_dt=datetime.now() + timedelta(days=2)
+        )
+        show = client.get(f"/film-show/{id_film_show}").json()
+        seats = client.get(f"/film-show/{id_film_show}/seats").json()
+    show["rows"], show["places_in_row"] = seats["rows"], seats["places_in_row"]
+    show["id_cinema"] = id_cinema
+    return show
+
+
+async def worker(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    rnd: random.Random,
+    weights: Dict[str, float],
+    shows: List[dict],
+    premiere: dict,
+    hot_share: float,
+    deadline: float,
+):
+    scenarios, scenario_weights = list(weights), list(weights.values())
+    while time.perf_counter() < deadline:
+        scenario = rnd.choices(scenarios, scenario_weights)[0]
+        show = premiere if rnd.random() < hot_share else rnd.choice(shows)
+        if scenario == "create_booking":
+            request = client.post(
+                "/booking/",
+                json={
+                    "id_film_show": show["id"],
+                    "row": rnd.randint(1, show["rows"]),
+                    "place": rnd.randint(1, show["places_in_row"]),
+                },
+            )
+        elif scenario == "seats":
+            request = client.get(f"/film-show/{show['id']}/seats")
+        else:
+            request = client.get(
+                f"/cinema/{show['id_cinema']}/schedule",
+                params={"date": show["show_date"]},
+            )
+        start = time.perf_counter()
+        try:
+            response = await request
+        except httpx.HTTPError:
+            recorder.error(scenario)
+            continue
+        recorder.record(scenario, time.perf_counter() - start, response)
+        if response.status_code >= 500:
+            recorder.error(scenario)
+
+
+async def run(args) -> dict:
+    rnd = random.Random(args.seed)
+    weights = parse_mix(args.mix)
+    recorder = Recorder()
+    premiere = create_premiere(args.base_url)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.base_url, limits=limits, timeout=30
+    ) as client:
+        shows = await discover(client, args.shows) or [premiere]
+        start = time.perf_counter()
+        deadline = start + args.warmup + args.duration
+        workers = [
+            asyncio.ensure_future(
+                worker(
+                    client,
+                    recorder,
+                    random.Random(rnd.random()),
+                    weights,
+                    shows,
+                    premiere,
+                    args.hot_share,
+                    deadline,
+                )
+            )
+            for _ in range(args.concurrency)
+        ]
+        await asyncio.sleep(args.warmup)
+        recorder.enabled = True
+        measured = time.perf_counter()
+        await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - measured
+    return {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "base_url": args.base_url,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": weights,
+            "shows": len(shows),
+            "hot_share": args.hot_share,
+            "seed": args.seed,
+            "python": platform.python_version(),
+        },
+        "scenarios": recorder.summary(elapsed),
+    }
+
+
+def print_results(results: dict):
+    print(
+        f"{'scenario':<16}{'requests':>10}{'rps':>10}{'p50 ms':>10}"
+        f"{'p95 ms':>10}{'p99 ms':>10}{'conflicts':>11}{'errors':>8}"
+    )
+    for name, item in results["scenarios"].items():
+        print(
+            f"{name:<16}{item['requests']:>10}{item['rps']:>10}{item['p50_ms']:>10}"
+            f"{item['p95_ms']:>10}{item['p99_ms']:>10}"
+            f"{item.get('conflict_rate', 0):>11.2%}{item['errors']:>8}"
+        )
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> List[str]:
+    """Сценарии, у которых p95 вырос или RPS упал больше допустимого"""
+    regressions = []
+    print(f"\n{'scenario':<16}{'p95 ms':>22}{'rps':>22}")
+    for name, item in results["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if not base:
+            continue
+        print(
+            f"{name:<16}{base['p95_ms']:>10} -> {item['p95_ms']:<8}"
+            f"{base['rps']:>10} -> {item['rps']:<8}"
+        )
+        if base["p95_ms"] and item["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {item['p95_ms']} ms")
+        if item["rps"] < base["rps"] * (1 - max_regression):
+            regressions.append(f"{name}: rps {base['rps']} -> {item['rps']}")
+    return regressions
+
+
+def main(args) -> int:
+    results = asyncio.run(run(args))
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,201 @@
+"""
+Наполнение базы данных для нагрузочного тестирования.
+
+Кинотеатры, залы, фильмы, сеансы на месяц вперед и бронирования
+загружаются через COPY напрямую в Postgres (настройки подключения
+из src/settings.py), через HTTP API миллионы строк не создать.
+
+    $ python -m benchmarks.seed --reset
+    $ python -m benchmarks.seed --cinemas 200 --bookings 100000
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from src.db import db, init_db, close_db
+
+CITIES = ["Moscow", "Saint Petersburg", "Kazan", "Novosibirsk", "Yekaterinburg"]
+GENRES = ["Drama", "Comedy", "Fantastic", "Thriller", "Cartoon"]
+# Shows in every hall start at these hours, films are not longer than slot
+SHOW_HOURS = (10, 13, 16, 19, 22)
+SLOT_MINUTES = 170
+HALL_SIZES = ((10, 12), (15, 18), (20, 20), (25, 30))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--cinemas", type=int, default=1000)
+    parser.add_argument("--halls-per-cinema", type=int, default=3)
+    parser.add_argument("--films", type=int, default=200)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--bookings", type=int, default=2_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--reset", action="store_true", help="truncate all tables before seeding"
+    )
+    return parser.parse_args(argv)
+
+
+async def next_id(conn, table: str) -> int:
+    return await conn.fetchval(f"SELECT coalesce(max(id), 0) + 1 FROM {table}")
+
+
+async def copy(conn, table: str, columns, records) -> int:
+    count = 0
+
+    def counted():
+        nonlocal count
+        for record in records:
+            count += 1
+            yield record
+
+    # Records are streamed, millions of bookings are never kept in memory
+    await conn.copy_records_to_table(table, records=counted(), columns=columns)
+    # Ids are set explicitly, serial sequence has to follow them
+    await conn.execute(
+        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+        f"(SELECT coalesce(max(id), 1) FROM {table}))"
+    )
+    return count
+
+
+def film_records(first_id: int, count: int, rnd: random.Random):
+    return [
+        (
+            first_id + index,
+            f"Film {first_id + index}",
+            rnd.choice(GENRES),
+            "Cast",
+            "Description",
+            rnd.randint(80, SLOT_MINUTES - 10),
+        )
+        for index in range(count)
+    ]
+
+
+async def seed(args) -> dict:
+    rnd = random.Random(args.seed)
+    first_day = date.today() + timedelta(days=1)
+    stats = {}
+    async with db.acquire() as gino_conn:
+        conn = gino_conn.raw_connection
+        async with conn.transaction():
+            # Nobody listens to seat changes of millions of seeded bookings
+            await conn.execute("SET LOCAL tickets.seat_notify = 'off'")
+            if args.reset:
+                await conn.execute(
+                    "TRUNCATE booking, seat_hold, film_show, hall, cinema, films "
+                    "RESTART IDENTITY CASCADE"
+                )
+            id_cinema = await next_id(conn, "cinema")
+            id_hall = await next_id(conn, "hall")
+            id_film = await next_id(conn, "films")
+            id_film_show = await next_id(conn, "film_show")
+            id_booking = await next_id(conn, "booking")
+
+            films = film_records(id_film, args.films, rnd)
+            stats["films"] = await copy(
+                conn,
+                "films",
+                ["id", "title", "genre", "cast", "description", "duration"],
+                films,
+            )
+            stats["cinemas"] = await copy(
+                conn,
+                "cinema",
+                ["id", "name", "city"],
+                (
+                    (
+                        id_cinema + index,
+                        f"Cinema {id_cinema + index}",
+                        rnd.choice(CITIES),
+                    )
+                    for index in range(args.cinemas)
+                ),
+            )
+            halls = []
+            for cinema in range(id_cinema, id_cinema + args.cinemas):
+                for number in range(args.halls_per_cinema):
+                    rows, places_in_row = rnd.choice(HALL_SIZES)
+                    halls.append(
+                        (
+                            id_hall + len(halls),
+                            cinema,
+                            f"Hall {number + 1}",
+                            rows,
+                            places_in_row,
+                        )
+                    )
+            stats["halls"] = await copy(
+                conn,
+                "hall",
+                ["id", "id_cinema", "name", "rows", "places_in_row"],
+                halls,
+            )
+
+            shows = []
+            for hall in halls:
+                for day in range(args.days):
+                    show_date = first_day + timedelta(days=day)
+                    for hour in SHOW_HOURS:
+                        film = rnd.choice(films)
+                        start_time = datetime.combine(show_date, datetime.min.time())
+                        start_time += timedelta(hours=hour)
+                        shows.append(
+                            (
+                                id_film_show + len(shows),
+                                show_date,
+                                start_time,
+                                start_time + timedelta(minutes=film[5]),
+                                hall[0],
+                                film[0],
+                            )
+                        )
+            stats["film_shows"] = await copy(
+                conn,
+                "film_show",
+                ["id", "show_date", "start_time", "end_time", "id_hall", "id_film"],
+                shows,
+            )
+
+            # Bookings are spread over shows, places of a show are unique
+            capacity = {hall[0]: (hall[3], hall[4]) for hall in halls}
+            per_show, extra = divmod(args.bookings, len(shows)) if shows else (0, 0)
+
+            def booking_records():
+                next_booking = id_booking
+                for index, show in enumerate(shows):
+                    rows, places_in_row = capacity[show[4]]
+                    count = min(per_show + (index < extra), rows * places_in_row)
+                    for seat in rnd.sample(range(rows * places_in_row), count):
+                        row, place = divmod(seat, places_in_row)
+                        yield next_booking, show[0], row + 1, place + 1
+                        next_booking += 1
+
+            stats["bookings"] = await copy(
+                conn,
+                "booking",
+                ["id", "id_film_show", "row", "place"],
+                booking_records(),
+            )
+        await conn.execute("ANALYZE")
+    return stats
+
+
+async def main(args):
+    await init_db()
+    try:
+        start = time.perf_counter()
+        stats = await seed(args)
+        stats["seconds"] = round(time.perf_counter() - start, 1)
+    finally:
+        await close_db()
+    for name, value in stats.items():
+        print(f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,113 @@
+"""
+Микро-бенчмарк кодирования списков в JSON.
+
+Для модели ответа каждого роутера сравнивает путь через Pydantic
+(XxxOut.from_model, валидация response_model и сериализация FastAPI)
+с RowEncoder (orjson по строкам хранилища) и печатает строки в секунду.
+База данных не нужна, строки - модели Gino в памяти.
+
+    $ python -m benchmarks.serialization --rows 1000 --repeat 20
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+from src.db import Booking, Cinema, CinemaHall, Film, FilmShow
+from src.routers.booking import BookingOut, booking_encoder
+from src.routers.cinema import CinemaOut, cinema_encoder
+from src.routers.cinema_hall import CinemaHallOut, cinema_hall_encoder
+from src.routers.film import FilmOut, film_encoder
+from src.routers.film_show import FilmShowOut, film_show_encoder
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=1000, help="rows per list")
+    parser.add_argument("--repeat", type=int, default=20)
+    return parser.parse_args(argv)
+
+
+def make_rows(count: int):
+    start_time = datetime(2024, 1, 1, 10, 0)
+    return {
+        "cinema": [
+            Cinema(id=i, name=f"Cinema {i}", city="Moscow") for i in range(count)
+        ],
+        "cinema_hall": [
+            CinemaHall(id=i, name=f"Hall {i}", id_cinema=1, rows=20, places_in_row=20)
+            for i in range(count)
+        ],
+        "film": [
+            Film(
+                id=i,
+                title=f"Film {i}",
+                genre="Drama",
+                cast="Robert Downey Jr.",
+                description="Big fight",
+                duration=120,
+            )
+            for i in range(count)
+        ],
+        "film_show": [
+            FilmShow(
+                id=i,
+                show_date=start_time.date(),
+                start_time=start_time + timedelta(minutes=i),
+                end_time=start_time + timedelta(minutes=i + 120),
+                id_hall=1,
+                id_film=1,
+                sold=10,
+                capacity=400,
+            )
+            for i in range(count)
+        ],
+        "booking": [
+            Booking(id=i, id_film_show=1, row=i // 20 + 1, place=i % 20 + 1)
+            for i in range(count)
+        ],
+    }
+
+
+def pydantic_path(model) -> Callable[[list], bytes]:
+    # What a handler returning List[XxxOut] with response_model costs:
+    # validation against the response model, jsonable_encoder and json.dumps
+    def encode(rows):
+        items = [model.from_model(row) for row in rows]
+        return json.dumps(jsonable_encoder(parse_obj_as(List[model], items))).encode()
+
+    return encode
+
+
+def rows_per_second(encode: Callable[[list], bytes], rows: list, repeat: int):
+    encode(rows)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        encode(rows)
+    return len(rows) * repeat / (time.perf_counter() - started)
+
+
+def main(args) -> int:
+    routers = {
+        "cinema": (CinemaOut, cinema_encoder),
+        "cinema_hall": (CinemaHallOut, cinema_hall_encoder),
+        "film": (FilmOut, film_encoder),
+        "film_show": (FilmShowOut, film_show_encoder),
+        "booking": (BookingOut, booking_encoder),
+    }
+    rows = make_rows(args.rows)
+    print(f"{'router':<12}{'pydantic rows/s':>18}{'orjson rows/s':>16}{'speedup':>10}")
+    for name, (model, encoder) in routers.items():
+        before = rows_per_second(pydantic_path(model), rows[name], args.repeat)
+        after = rows_per_second(encoder.encode, rows[name], args.repeat)
+        print(f"{name:<12}{before:>18,.0f}{after:>16,.0f}{after / before:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
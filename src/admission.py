@@ -0,0 +1,151 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+
+from fastapi import HTTPException
+from src.metrics import admission_rejections
+from src.settings import (
+    ADMISSION_CONCURRENCY,
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_MAX_WAIT,
+    ADMISSION_SERVICE_TIME,
+)
+
+# Weight of the last request in request duration moving average
+SERVICE_TIME_WEIGHT = 0.2
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, position: int, eta: float):
+        super().__init__(position, eta)
+        self.position = position
+        self.eta = eta
+
+
+class AdmissionGate:
+    """
+    Не больше concurrency одновременных запросов, остальные ждут в очереди
+    FIFO. Если очередь полна или ожидание дольше max_wait - отказ.
+    Ожидание оценивается по скользящему среднему времени запроса.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = ADMISSION_CONCURRENCY,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        max_wait: float = ADMISSION_MAX_WAIT,
+        service_time: float = ADMISSION_SERVICE_TIME,
+    ):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.service_time = service_time
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def idle(self) -> bool:
+        return not self.active and not self._waiters
+
+    def eta(self, position: int) -> float:
+        # Seconds until a request at the position in the queue is admitted
+        return position * self.service_time / max(self.concurrency, 1)
+
+    async def acquire(self):
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            return
+        position = len(self._waiters) + 1
+        eta = self.eta(position)
+        if position > self.queue_size or eta > self.max_wait:
+            raise AdmissionRejected(position, eta)
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was handed over right before cancellation
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, elapsed: float = None):
+        if elapsed is not None:
+            self.service_time += SERVICE_TIME_WEIGHT * (elapsed - self.service_time)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Slot goes to the first waiter, active count is unchanged
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class AdmissionControl:
+    """
+    Очереди бронирования по сеансам, у каждого сеанса своя AdmissionGate,
+    так премьера не занимает все соединения пула. Ограничение действует
+    в пределах процесса, на весь сервис - умножается на число воркеров.
+    """
+
+    def __init__(self):
+        self._gates: Dict[int, AdmissionGate] = {}
+
+    def gate(self, id_film_show: int) -> AdmissionGate:
+        gate = self._gates.get(id_film_show)
+        if gate is None:
+            gate = self._gates[id_film_show] = AdmissionGate(
+                ADMISSION_CONCURRENCY,
+                ADMISSION_QUEUE_SIZE,
+                ADMISSION_MAX_WAIT,
+                ADMISSION_SERVICE_TIME,
+            )
+        return gate
+
+    @asynccontextmanager
+    async def admit(self, id_film_show: int, endpoint: str):
+        gate = self.gate(id_film_show)
+        try:
+            await gate.acquire()
+        except AdmissionRejected as error:
+            if gate.idle:
+                del self._gates[id_film_show]
+            admission_rejections.inc(endpoint)
+            raise HTTPException(
+                status_code=429,
+                detail={
+                    "message": "Too many booking requests for this film show",
+                    "position": error.position,
+                    "eta": round(error.eta, 3),
+                },
+                headers={"Retry-After": str(max(math.ceil(error.eta), 1))},
+            )
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            gate.release(time.monotonic() - start)
+            if gate.idle:
+                del self._gates[id_film_show]
+
+    def status(self, id_film_show: int) -> dict:
+        gate = self._gates.get(id_film_show)
+        if gate is None:
+            return {"active": 0, "queued": 0, "eta": 0.0}
+        return {
+            "active": gate.active,
+            "queued": gate.queued,
+            "eta": round(gate.eta(gate.queued + 1) if gate.queued else 0.0, 3),
+        }
+
+
+admission = AdmissionControl()
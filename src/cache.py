@@ -0,0 +1,95 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from src.settings import (
+    CATALOG_CACHE_SIZE,
+    CATALOG_CACHE_TTL,
+    IDEMPOTENCY_CACHE_SIZE,
+    IDEMPOTENCY_KEY_TTL,
+)
+from src.storage import storage
+
+
+class TTLCache:
+    """
+    LRU кэш ограниченного размера, записи живут не дольше ttl секунд.
+    Считает попадания, промахи и вытеснения.
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items: "OrderedDict[Any, tuple]" = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._items.get(key)
+        if item is not None:
+            expires_at, value = item
+            if expires_at > time.monotonic():
+                self._items.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._items[key]
+            self.evictions += 1
+        self.misses += 1
+        return default
+
+    def set(self, key, value):
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self._items.pop(key, None)
+
+    def clear(self):
+        self._items.clear()
+
+    async def get_or_load(self, key, load: Callable[[], Awaitable]):
+        value = self.get(key)
+        if value is None:
+            value = await load()
+            # Missing rows are not cached, so created rows are visible at once
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+film_cache = TTLCache("film", CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL)
+cinema_cache = TTLCache("cinema", CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL)
+cinema_hall_cache = TTLCache("cinema_hall", CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL)
+# Completed Idempotency-Key responses, retries skip the database
+idempotency_cache = TTLCache("idempotency", IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_KEY_TTL)
+
+caches = [film_cache, cinema_cache, cinema_hall_cache, idempotency_cache]
+
+
+async def get_film(film_id: int):
+    return await film_cache.get_or_load(film_id, lambda: storage.films.get(film_id))
+
+
+async def get_cinema(cinema_id: int):
+    return await cinema_cache.get_or_load(
+        cinema_id, lambda: storage.cinemas.get(cinema_id)
+    )
+
+
+async def get_cinema_hall(cinema_hall_id: int):
+    return await cinema_hall_cache.get_or_load(
+        cinema_hall_id, lambda: storage.halls.get(cinema_hall_id)
+    )
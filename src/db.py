@@ -1,5 +1,21 @@
+import asyncio
+
 from gino import Gino
-from .settings import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
+from sqlalchemy.schema import AddConstraint, CreateIndex
+from .settings import (
+    DB_HOST,
+    DB_PORT,
+    DB_USER,
+    DB_PASSWORD,
+    DB_NAME,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_MAX_QUERIES,
+    DB_POOL_MAX_INACTIVE_CONNECTION_LIFETIME,
+    DB_COMMAND_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE,
+)
 
 db = Gino()
 
@@ -11,6 +27,8 @@ class Cinema(db.Model):
     name = db.Column(db.Unicode(), nullable=False)
     city = db.Column(db.Unicode(), nullable=False)
 
+    _idx_city = db.Index("cinema_idx_city", "city")
+
 
 class CinemaHall(db.Model):
     __tablename__ = "hall"
@@ -21,6 +39,8 @@ class CinemaHall(db.Model):
     rows = db.Column(db.Integer(), nullable=False)
     places_in_row = db.Column(db.Integer(), nullable=False)
 
+    _idx_cinema = db.Index("hall_idx_cinema", "id_cinema")
+
 
 class Film(db.Model):
     __tablename__ = "films"
@@ -32,13 +52,19 @@ class Film(db.Model):
     description = db.Column(db.Unicode(), nullable=False)
     duration = db.Column(db.Integer(), nullable=False)
 
+    _idx_genre = db.Index("films_idx_genre", "genre")
+
 
 class FilmShow(db.Model):
     """
     Таблица сеансы привязана в кинозалу и к фильму.
     Аттрибуты - время начала (при создании), время окончания (авто), дата.
     При создании нужно проверять что не пересекается с другим сеансом.
-    Изменять нельзя, можно только удалить
+    Изменять нельзя, можно только удалить.
+    Пересечение сеансов в одном зале запрещено exclusion constraint,
+    его GiST индекс используется и для проверки пересечений при создании.
+    Количество проданных мест и вместимость зала поддерживают триггеры
+    (FILM_SHOW_COUNTERS_SQL), считать бронирования по сеансам не нужно.
     """
 
     __tablename__ = "film_show"
@@ -49,6 +75,21 @@ class FilmShow(db.Model):
     end_time = db.Column(db.DateTime())
     id_hall = db.Column("id_hall", None, db.ForeignKey("hall.id"))
     id_film = db.Column("id_film", None, db.ForeignKey("films.id"))
+    sold = db.Column(db.Integer(), nullable=False, server_default="0")
+    capacity = db.Column(db.Integer(), nullable=False, server_default="0")
+
+    _excl_hall_time = ExcludeConstraint(
+        (db.text("int4range(id_hall, id_hall, '[]')"), "&&"),
+        (db.text("tsrange(start_time, end_time, '[]')"), "&&"),
+        name="film_show_excl_hall_time",
+    )
+    # Also serves id_hall filters and foreign key
+    _idx_hall_show_date = db.Index(
+        "film_show_idx_hall_show_date", "id_hall", "show_date"
+    )
+    _idx_film = db.Index("film_show_idx_film", "id_film")
+    _idx_start_time = db.Index("film_show_idx_start_time", "start_time")
+    _idx_end_time = db.Index("film_show_idx_end_time", "end_time")
 
 
 class Booking(db.Model):
@@ -64,17 +105,284 @@ class Booking(db.Model):
     row = db.Column(db.Integer(), nullable=False)
     place = db.Column(db.Integer(), nullable=False)
 
+    # Also serves id_film_show filters and foreign key
     _idx = db.Index(
         "booking_idx_film_show_row_place", "id_film_show", "row", "place", unique=True
     )
 
 
-async def init_db():
+class SeatHold(db.Model):
+    """
+    Таблица временно удерживаемое место в сеансе (на время оплаты).
+    Сеанс, ряд и место (unique key constraint), токен корзины и время
+    окончания удержания. Просроченные удержания удаляет фоновая задача.
+    """
+
+    __tablename__ = "seat_hold"
+
+    id = db.Column(db.Integer(), primary_key=True)
+    token = db.Column(db.Unicode(), nullable=False)
+    id_film_show = db.Column("id_film_show", None, db.ForeignKey("film_show.id"))
+    row = db.Column(db.Integer(), nullable=False)
+    place = db.Column(db.Integer(), nullable=False)
+    expires_at = db.Column(db.DateTime(), nullable=False)
+
+    _idx = db.Index(
+        "seat_hold_idx_film_show_row_place",
+        "id_film_show",
+        "row",
+        "place",
+        unique=True,
+    )
+    _idx_token = db.Index("seat_hold_idx_token", "token")
+    _idx_expires_at = db.Index("seat_hold_idx_expires_at", "expires_at")
+
+
+class IdempotencyKey(db.Model):
+    """
+    Таблица сохраненных ответов на запросы с заголовком Idempotency-Key.
+    Ключ уникален в рамках метода и пути, пока запрос выполняется
+    status_code пустой. Записи старше IDEMPOTENCY_KEY_TTL удаляет фоновая задача.
+    """
+
+    __tablename__ = "idempotency_key"
+
+    id = db.Column(db.Integer(), primary_key=True)
+    endpoint = db.Column(db.Unicode(), nullable=False)
+    key = db.Column(db.Unicode(), nullable=False)
+    fingerprint = db.Column(db.Unicode(), nullable=False)
+    status_code = db.Column(db.Integer())
+    content_type = db.Column(db.Unicode())
+    response = db.Column(db.LargeBinary())
+    created_at = db.Column(db.DateTime(), nullable=False)
+
+    _idx = db.Index("idempotency_key_idx_endpoint_key", "endpoint", "key", unique=True)
+    _idx_created_at = db.Index("idempotency_key_idx_created_at", "created_at")
+
+
+# Triggers keep film_show.sold and film_show.capacity up to date. Booking
+# triggers are per statement, multi-row inserts update a show once. Columns
+# are added to film_show tables created before them and filled from bookings
+# and halls: capacity is 0 only for shows the triggers have not seen yet.
+FILM_SHOW_COUNTERS_SQL = """
+-- Workers starting at the same time replace functions one by one
+SELECT pg_advisory_xact_lock(hashtext('film_show_counters'));
+
+ALTER TABLE film_show
+    ADD COLUMN IF NOT EXISTS sold integer NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS capacity integer NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION film_show_set_capacity() RETURNS trigger AS $$
+BEGIN
+    SELECT rows * places_in_row INTO NEW.capacity FROM hall WHERE id = NEW.id_hall;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER film_show_capacity
+    BEFORE INSERT OR UPDATE OF id_hall ON film_show
+    FOR EACH ROW EXECUTE FUNCTION film_show_set_capacity();
+
+CREATE OR REPLACE FUNCTION hall_update_capacity() RETURNS trigger AS $$
+BEGIN
+    UPDATE film_show SET capacity = NEW.rows * NEW.places_in_row
+    WHERE id_hall = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER hall_capacity
+    AFTER UPDATE OF rows, places_in_row ON hall
+    FOR EACH ROW EXECUTE FUNCTION hall_update_capacity();
+
+CREATE OR REPLACE FUNCTION booking_count_sold() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE film_show SET sold = film_show.sold + counts.sold
+        FROM (
+            SELECT id_film_show, count(*) AS sold FROM new_rows GROUP BY id_film_show
+        ) counts
+        WHERE film_show.id = counts.id_film_show;
+    ELSE
+        UPDATE film_show SET sold = film_show.sold - counts.sold
+        FROM (
+            SELECT id_film_show, count(*) AS sold FROM old_rows GROUP BY id_film_show
+        ) counts
+        WHERE film_show.id = counts.id_film_show;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER booking_sold_insert
+    AFTER INSERT ON booking REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION booking_count_sold();
+
+CREATE OR REPLACE TRIGGER booking_sold_delete
+    AFTER DELETE ON booking REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION booking_count_sold();
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM film_show WHERE capacity = 0) THEN
+        -- Bookings wait until the counters are filled
+        LOCK TABLE booking IN SHARE MODE;
+        UPDATE film_show SET
+            sold = (
+                SELECT count(*) FROM booking WHERE booking.id_film_show = film_show.id
+            ),
+            capacity = hall.rows * hall.places_in_row
+        FROM hall
+        WHERE hall.id = film_show.id_hall AND film_show.capacity = 0;
+    END IF;
+END
+$$;
+"""
+
+
+SEAT_CHANGES_CHANNEL = "seat_changes"
+
+# Taken and released places are sent to SEAT_CHANGES_CHANNEL on commit as
+# {"s": id_film_show, "t": 1 - taken / 0 - released, "p": [[row, place], ...]},
+# "p" is null when there are too many places for one notification.
+# Bulk loads turn notifications off with SET tickets.seat_notify = 'off'.
+SEAT_CHANGES_SQL = """
+SELECT pg_advisory_xact_lock(hashtext('seat_changes'));
+
+CREATE OR REPLACE FUNCTION seat_changes_notify() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('tickets.seat_notify', true) = 'off' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        PERFORM pg_notify('seat_changes', json_build_object(
+            's', id_film_show,
+            't', 1,
+            'p', CASE WHEN count(*) <= 500
+                THEN json_agg(json_build_array("row", place)) END
+        )::text) FROM new_rows GROUP BY id_film_show;
+    ELSE
+        PERFORM pg_notify('seat_changes', json_build_object(
+            's', id_film_show,
+            't', 0,
+            'p', CASE WHEN count(*) <= 500
+                THEN json_agg(json_build_array("row", place)) END
+        )::text) FROM old_rows GROUP BY id_film_show;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER booking_seat_changes_insert
+    AFTER INSERT ON booking REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION seat_changes_notify();
+
+CREATE OR REPLACE TRIGGER booking_seat_changes_delete
+    AFTER DELETE ON booking REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION seat_changes_notify();
+
+CREATE OR REPLACE TRIGGER seat_hold_seat_changes_insert
+    AFTER INSERT ON seat_hold REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION seat_changes_notify();
+
+CREATE OR REPLACE TRIGGER seat_hold_seat_changes_delete
+    AFTER DELETE ON seat_hold REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION seat_changes_notify();
+"""
+
+
+async def create_indexes():
+    # create_all skips existing tables, indexes added to models later are
+    # created here
+    for table in db.sorted_tables:
+        for index in table.indexes:
+            statement = str(CreateIndex(index).compile(dialect=db.bind.dialect))
+            statement = statement.replace(" INDEX ", " INDEX IF NOT EXISTS ", 1)
+            await db.status(db.text(statement))
+
+
+async def create_extensions():
+    # GiST operator classes of scalar types for exclusion constraints.
+    # film_show_excl_hall_time compares ranges and works without it, so
+    # servers without contrib modules are fine
+    async with db.transaction():
+        await db.scalar(db.text("SELECT pg_advisory_xact_lock(hashtext('extensions'))"))
+        available = await db.scalar(
+            db.text("SELECT 1 FROM pg_available_extensions WHERE name = 'btree_gist'")
+        )
+        if available:
+            await db.status(db.text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+
+
+async def create_constraints():
+    # create_all skips existing tables, exclusion constraints added to models
+    # later are created here
+    async with db.transaction():
+        await db.scalar(
+            db.text("SELECT pg_advisory_xact_lock(hashtext('constraints'))")
+        )
+        for table in db.sorted_tables:
+            for constraint in table.constraints:
+                if not isinstance(constraint, ExcludeConstraint):
+                    continue
+                exists = await db.scalar(
+                    db.text("SELECT 1 FROM pg_constraint WHERE conname = :name"),
+                    name=constraint.name,
+                )
+                if not exists:
+                    statement = AddConstraint(constraint).compile(
+                        dialect=db.bind.dialect
+                    )
+                    await db.status(db.text(str(statement)))
+
+
+async def create_triggers():
+    # Several statements can be executed only without prepared statement
+    async with db.acquire() as conn:
+        await conn.raw_connection.execute(FILM_SHOW_COUNTERS_SQL)
+        await conn.raw_connection.execute(SEAT_CHANGES_SQL)
+
+
+DB_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+
+async def init_db(pool_class=None, create_schema: bool = True):
+    """
+    Подключение к базе данных. pool_class - пул соединений Gino вместо
+    пула asyncpg (в тестах), create_schema=False - схема уже создана.
+    """
     await db.set_bind(
-        f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+        DB_URL,
+        pool_class=pool_class,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        max_queries=DB_POOL_MAX_QUERIES,
+        max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_CONNECTION_LIFETIME,
+        command_timeout=DB_COMMAND_TIMEOUT,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
     )
+    if create_schema:
+        await create_schema_objects()
+    await warm_pool()
+
+
+async def create_schema_objects():
+    await create_extensions()
     # Create tables
     await db.gino.create_all()
+    await create_indexes()
+    await create_constraints()
+    await create_triggers()
+
+
+async def warm_pool():
+    # Open and check min_size connections before the first request
+    connections = await asyncio.gather(*(db.acquire() for _ in range(DB_POOL_MIN_SIZE)))
+    try:
+        await asyncio.gather(*(conn.scalar("SELECT 1") for conn in connections))
+    finally:
+        for conn in connections:
+            await conn.release()
 
 
 async def close_db():
@@ -0,0 +1,53 @@
+import csv
+import io
+import json
+from datetime import date, datetime, time
+from typing import AsyncIterable, List
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from src.settings import EXPORT_CHUNK_SIZE
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def export_value(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+
+async def export_chunks(rows: AsyncIterable, fields: List[str], format: str):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if format == "csv":
+        writer.writerow(fields)
+    count = 0
+    async for row in rows:
+        values = [export_value(value) for value in row]
+        if format == "csv":
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(fields, values))))
+            buffer.write("\n")
+        count += 1
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_response(rows: AsyncIterable, fields: List[str], format: str, name: str):
+    """
+    Потоковая выгрузка строк хранилища в NDJSON или CSV,
+    память не зависит от количества строк
+    """
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Incorrect export format")
+    return StreamingResponse(
+        export_chunks(rows, fields, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{format}"'},
+    )
@@ -0,0 +1,52 @@
+from operator import attrgetter
+from typing import Callable, Iterable, Type
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+from src.settings import FAST_JSON_RESPONSES
+
+
+class RowEncoder:
+    """
+    Кодирует строки хранилища в JSON массив без промежуточных объектов
+    Pydantic и без повторной валидации response_model: поля модели ответа
+    вычисляются один раз, значения берутся из строк, даты кодирует orjson.
+    converters - поля, значения которых вычисляются из строки иначе.
+    """
+
+    def __init__(self, model: Type[BaseModel], **converters: Callable):
+        self.model = model
+        self.fields = tuple(model.__fields__)
+        self.getters = tuple(
+            converters.get(field) or attrgetter(field) for field in self.fields
+        )
+
+    def encode(self, rows: Iterable) -> bytes:
+        items = tuple(zip(self.fields, self.getters))
+        return orjson.dumps(
+            [{field: getter(row) for field, getter in items} for row in rows]
+        )
+
+    def prepare(self, rows: Iterable):
+        """Тело ответа: JSON или, если быстрый путь выключен, модели ответа"""
+        if not FAST_JSON_RESPONSES:
+            return [self.model.from_model(row) for row in rows]
+        return self.encode(rows)
+
+    def respond(self, content, response: Response = None):
+        """
+        Ответ из результата prepare; headers из response (курсор страницы)
+        переносятся, FastAPI не объединяет их с возвращенным Response
+        """
+        if not FAST_JSON_RESPONSES:
+            return content
+        fast_response = Response(content, media_type="application/json")
+        if response is not None:
+            for name, value in response.headers.items():
+                if name != "content-length":
+                    fast_response.headers[name] = value
+        return fast_response
+
+    def response(self, rows: Iterable, response: Response = None):
+        return self.respond(self.prepare(rows), response)
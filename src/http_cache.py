@@ -0,0 +1,98 @@
+import time
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Hashable, Optional
+
+from fastapi import Request, Response
+from src.settings import ETAG_TTL, HTTP_CACHE_MAX_AGE
+
+
+class VersionRegistry:
+    """
+    Версии таблиц и сущностей каталога для ETag и Last-Modified.
+    Обработчики изменений увеличивают версии, условный GET сравнивает тег
+    клиента с версиями без запроса к базе. Версии свои у каждого процесса,
+    поэтому тег содержит id процесса и номер окна ETAG_TTL.
+    """
+
+    def __init__(self):
+        self.process = uuid.uuid4().hex[:8]
+        self._versions: Dict[Hashable, int] = {}
+        self._changed_at: Dict[Hashable, float] = {}
+
+    def bump(self, *keys: Hashable):
+        now = time.time()
+        for key in keys:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._changed_at[key] = now
+
+    def etag(self, keys, now: float, variant: str = "") -> str:
+        versions = ".".join(str(self._versions.get(key, 0)) for key in keys)
+        return f'"{self.process}-{int(now // ETAG_TTL)}-{versions}{variant}"'
+
+    def last_modified(self, keys, now: float) -> int:
+        # Next second after the change, a response given in the second of
+        # the change gets no Last-Modified, as more changes may follow in it
+        window_start = int(now // ETAG_TTL) * ETAG_TTL
+        changed = [
+            int(self._changed_at[key]) + 1 for key in keys if key in self._changed_at
+        ]
+        return max(changed + [window_start])
+
+
+versions = VersionRegistry()
+
+
+def bump_film_shows(*id_halls: int):
+    """Сеансы залов созданы, удалены или изменились их счетчики sold/capacity"""
+    versions.bump("film_show", *(("film_show", id_hall) for id_hall in id_halls))
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, W/ prefix is ignored
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        tag = tag[2:] if tag.startswith("W/") else tag
+        if tag == etag:
+            return True
+    return False
+
+
+def not_modified(
+    request: Request, response: Response, *keys: Hashable, variant: str = ""
+) -> Optional[Response]:
+    """
+    Условный GET: выставляет ETag, Last-Modified и Cache-Control в response,
+    возвращает ответ 304, если копия клиента актуальна, иначе None.
+    Вызывается до запроса к хранилищу - изменение во время запроса меняет
+    версию, и следующая проверка вернет полный ответ. variant - то, от чего
+    ответ зависит кроме версий и URL (например, текущая дата).
+    """
+    now = time.time()
+    headers = {
+        "ETag": versions.etag(keys, now, variant),
+        "Cache-Control": f"public, max-age={HTTP_CACHE_MAX_AGE}",
+    }
+    last_modified = versions.last_modified(keys, now)
+    if last_modified <= now:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    response.headers.update(headers)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = etag_matches(if_none_match, headers["ETag"])
+    else:
+        fresh = "Last-Modified" in headers and not_modified_since(
+            request.headers.get("if-modified-since"), last_modified
+        )
+    return Response(status_code=304, headers=headers) if fresh else None
+
+
+def not_modified_since(if_modified_since: Optional[str], last_modified: int) -> bool:
+    if not if_modified_since:
+        return False
+    try:
+        return parsedate_to_datetime(if_modified_since).timestamp() >= last_modified
+    except (TypeError, ValueError):
+        return False
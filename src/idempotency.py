@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, Tuple
+
+from fastapi.responses import JSONResponse
+from src.cache import idempotency_cache
+from src.db import IdempotencyKey
+from src.settings import (
+    IDEMPOTENCY_KEY_TTL,
+    IDEMPOTENCY_LEASE,
+    IDEMPOTENCY_SWEEP_INTERVAL,
+)
+from src.storage import storage
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_HEADER = b"idempotency-key"
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI middleware: повтор запроса с тем же заголовком Idempotency-Key
+    получает сохраненный ответ первого запроса, запрос не выполняется.
+    Ответы хранятся в хранилище (таблица idempotency_key общая для воркеров) и в
+    idempotency_cache. Ответы 5xx и 429 не сохраняются, такой запрос можно
+    повторить. Ключ упавшего воркера занимает повтор после IDEMPOTENCY_LEASE.
+    """
+
+    def __init__(self, app, endpoints: Iterable[Tuple[str, str]]):
+        self.app = app
+        self.endpoints = {f"{method} {path}" for method, path in endpoints}
+
+    async def __call__(self, scope, receive, send):
+        endpoint = f"{scope.get('method')} {scope.get('path')}"
+        key = dict(scope.get("headers", ())).get(IDEMPOTENCY_KEY_HEADER)
+        if scope["type"] != "http" or endpoint not in self.endpoints or key is None:
+            await self.app(scope, receive, send)
+            return
+        key = key.decode("latin-1")
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            await self.error(scope, receive, send, 400, "Incorrect Idempotency-Key")
+            return
+        body = await read_body(receive)
+        fingerprint = hashlib.sha256(body).hexdigest()
+        stored = idempotency_cache.get((endpoint, key))
+        if stored is None:
+            now = datetime.now()
+            stored = await storage.idempotency_keys.claim(
+                endpoint,
+                key,
+                fingerprint,
+                now,
+                now - timedelta(seconds=IDEMPOTENCY_LEASE),
+            )
+        if stored is not None:
+            await self.replay(stored, fingerprint, endpoint, key, scope, receive, send)
+            return
+
+        body_sent = False
+
+        async def receive_body():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status_code, content_type, chunks = 500, None, []
+
+        async def send_and_capture(message):
+            nonlocal status_code, content_type
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                content_type = dict(message.get("headers", ())).get(b"content-type")
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_body, send_and_capture)
+        except BaseException:
+            await storage.idempotency_keys.release(endpoint, key)
+            raise
+        # Shed by admission control, the retry has to be executed
+        if status_code >= 500 or status_code == 429:
+            await storage.idempotency_keys.release(endpoint, key)
+            return
+        content_type = content_type.decode("latin-1") if content_type else None
+        response = b"".join(chunks)
+        await storage.idempotency_keys.save(
+            endpoint, key, status_code, content_type, response
+        )
+        idempotency_cache.set(
+            (endpoint, key),
+            IdempotencyKey(
+                endpoint=endpoint,
+                key=key,
+                fingerprint=fingerprint,
+                status_code=status_code,
+                content_type=content_type,
+                response=response,
+            ),
+        )
+
+    async def replay(self, stored, fingerprint, endpoint, key, scope, receive, send):
+        if stored.fingerprint != fingerprint:
+            await self.error(
+                scope,
+                receive,
+                send,
+                422,
+                "Idempotency-Key is already used by another request",
+            )
+            return
+        if stored.status_code is None:
+            await self.error(
+                scope,
+                receive,
+                send,
+                409,
+                "Request with this Idempotency-Key is in progress",
+            )
+            return
+        idempotency_cache.set((endpoint, key), stored)
+        headers = [(b"idempotent-replayed", b"true")]
+        if stored.content_type:
+            headers.append((b"content-type", stored.content_type.encode("latin-1")))
+        headers.append((b"content-length", str(len(stored.response)).encode()))
+        await send(
+            {
+                "type": "http.response.start",
+                "status": stored.status_code,
+                "headers": headers,
+            }
+        )
+        await send({"type": "http.response.body", "body": stored.response})
+
+    @staticmethod
+    async def error(scope, receive, send, status_code: int, detail: str):
+        await JSONResponse({"detail": detail}, status_code=status_code)(
+            scope, receive, send
+        )
+
+
+async def sweep_idempotency_keys(ttl: float = IDEMPOTENCY_KEY_TTL) -> int:
+    """Удаляет ключи старше ttl секунд, возвращает количество удаленных"""
+    return await storage.idempotency_keys.sweep(datetime.now() - timedelta(seconds=ttl))
+
+
+async def run_idempotency_sweeper():
+    while True:
+        try:
+            await sweep_idempotency_keys()
+        except Exception:
+            logger.exception("Idempotency keys sweep failed")
+        await asyncio.sleep(IDEMPOTENCY_SWEEP_INTERVAL)
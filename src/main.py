@@ -1,19 +1,58 @@
+import asyncio
+from contextlib import suppress
+
 from fastapi import FastAPI
-from .routers import cinema, cinema_hall, film, film_show, booking
+from .routers import (
+    cinema,
+    cinema_hall,
+    film,
+    film_show,
+    booking,
+    seat_hold,
+    cache,
+    metrics,
+)
 
-from .db import init_db, close_db
+from .idempotency import IdempotencyMiddleware, run_idempotency_sweeper
+from .metrics import MetricsMiddleware
+from .storage import storage
 
 app = FastAPI()
+app.add_middleware(
+    IdempotencyMiddleware,
+    endpoints=[
+        ("POST", "/booking/"),
+        ("POST", "/booking/batch"),
+        ("POST", "/booking/best-available"),
+        ("POST", "/film-show/"),
+        ("POST", "/film-show/bulk"),
+        ("POST", "/seat-hold/"),
+    ],
+)
+app.add_middleware(MetricsMiddleware)
 
 
 @app.on_event("startup")
 async def startup():
-    await init_db()
+    await storage.init()
+    app.state.seat_hold_sweeper = asyncio.ensure_future(
+        seat_hold.run_seat_hold_sweeper()
+    )
+    app.state.seat_listener = asyncio.ensure_future(storage.listen_seat_changes())
+    app.state.idempotency_sweeper = asyncio.ensure_future(run_idempotency_sweeper())
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    await close_db()
+    for task in (
+        app.state.seat_hold_sweeper,
+        app.state.seat_listener,
+        app.state.idempotency_sweeper,
+    ):
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    await storage.close()
 
 
 app.include_router(cinema.router, prefix="/cinema")
@@ -21,3 +60,6 @@ app.include_router(cinema_hall.router, prefix="/cinema-hall")
 app.include_router(film.router, prefix="/film")
 app.include_router(film_show.router, prefix="/film-show")
 app.include_router(booking.router, prefix="/booking")
+app.include_router(seat_hold.router, prefix="/seat-hold")
+app.include_router(cache.router, prefix="/cache")
+app.include_router(metrics.router)
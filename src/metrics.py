@@ -0,0 +1,282 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from gino.dialects.asyncpg import DBAPICursor
+from src.cache import caches
+from src.db import db
+from src.single_flight import flights
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# [queries count, queries duration] of the current request
+request_db_stats: ContextVar[list] = ContextVar("request_db_stats", default=None)
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    labels = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Metric:
+    """
+    Метрика в текстовом формате Prometheus, значения по наборам меток
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ] + self.samples()
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self.values.items()
+        ]
+
+
+class CallbackMetric(Metric):
+    """Значения считываются функцией в момент выгрузки метрик"""
+
+    def __init__(self, type: str, name: str, documentation: str, labelnames, read):
+        super().__init__(name, documentation, labelnames)
+        self.type = type
+        self.read: Callable[[], Dict[Tuple, float]] = read
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self.read().items()
+        ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        # Labels -> [count per bucket (last is +Inf), sum]
+        self.values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        item = self.values.get(labels)
+        if item is None:
+            item = self.values[labels] = [[0] * (len(self.buckets) + 1), 0]
+        item[0][bisect_left(self.buckets, value)] += 1
+        item[1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                bucket_labels = format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            labels = format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def pool_connections():
+    pool = db.bind.raw_pool if db.bind is not None else None
+    if pool is None:
+        return {}
+    idle = pool.get_idle_size()
+    return {("in_use",): pool.get_size() - idle, ("idle",): idle}
+
+
+def cache_stats(key: str):
+    return lambda: {(cache.name,): cache.stats()[key] for cache in caches}
+
+
+def single_flight_stats():
+    return {
+        (flight.name, result): count
+        for flight in flights
+        for result, count in flight.stats().items()
+    }
+
+
+http_requests = Counter(
+    "http_requests_total", "HTTP requests", ["method", "route", "status"]
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"]
+)
+db_queries_per_request = Histogram(
+    "db_queries_per_request",
+    "Database queries per HTTP request",
+    ["route"],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+db_time_per_request = Histogram(
+    "db_time_per_request_seconds",
+    "Database queries duration per HTTP request",
+    ["route"],
+)
+db_query_duration = Histogram("db_query_duration_seconds", "Database query latency")
+booking_conflicts = Counter(
+    "booking_conflicts_total",
+    "Bookings rejected by booking_idx_film_show_row_place",
+    ["endpoint"],
+)
+admission_rejections = Counter(
+    "admission_rejections_total",
+    "Booking requests rejected by film show admission control",
+    ["endpoint"],
+)
+
+metrics = [
+    http_requests,
+    http_request_duration,
+    db_queries_per_request,
+    db_time_per_request,
+    db_query_duration,
+    booking_conflicts,
+    admission_rejections,
+    CallbackMetric(
+        "gauge",
+        "db_pool_connections",
+        "Database pool connections",
+        ["state"],
+        pool_connections,
+    ),
+    CallbackMetric(
+        "counter",
+        "catalog_cache_hits_total",
+        "Catalog cache hits",
+        ["cache"],
+        cache_stats("hits"),
+    ),
+    CallbackMetric(
+        "counter",
+        "catalog_cache_misses_total",
+        "Catalog cache misses",
+        ["cache"],
+        cache_stats("misses"),
+    ),
+    CallbackMetric(
+        "counter",
+        "catalog_cache_evictions_total",
+        "Catalog cache evictions",
+        ["cache"],
+        cache_stats("evictions"),
+    ),
+    CallbackMetric(
+        "counter",
+        "single_flight_requests_total",
+        "List reads: leader - loaded, shared - waited for an identical read, "
+        "cached - taken from the single-flight window",
+        ["flight", "result"],
+        single_flight_stats,
+    ),
+]
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+class MetricsCursor(DBAPICursor):
+    """Курсор Gino, замеряющий время каждого запроса"""
+
+    async def async_execute(self, query, timeout, args, limit=0, many=False):
+        start = time.perf_counter()
+        try:
+            return await super().async_execute(query, timeout, args, limit, many)
+        finally:
+            elapsed = time.perf_counter() - start
+            db_query_duration.observe(elapsed)
+            stats = request_db_stats.get()
+            if stats is not None:
+                stats[0] += 1
+                stats[1] += elapsed
+
+
+def install_query_hook():
+    # Gino takes cursor class of the dialect on every connection acquire
+    db.bind.dialect.cursor_cls = MetricsCursor
+
+
+def route_path(scope) -> str:
+    # Path template of the matched route, path parameters are put back
+    if "endpoint" not in scope:
+        return "unmatched"
+    segments = scope["path"].split("/")
+    position = 0
+    for name, value in scope.get("path_params", {}).items():
+        for index in range(position, len(segments)):
+            if segments[index] == str(value):
+                segments[index] = "{" + name + "}"
+                position = index + 1
+                break
+    return "/".join(segments)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: время обработки запроса, количество и время
+    запросов к базе данных в рамках запроса по шаблону пути
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        stats = [0, 0.0]
+        token = request_db_stats.set(stats)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_db_stats.reset(token)
+            elapsed = time.perf_counter() - start
+            route = route_path(scope)
+            http_requests.inc(scope["method"], route, status)
+            http_request_duration.observe(elapsed, scope["method"], route)
+            db_queries_per_request.observe(stats[0], route)
+            db_time_per_request.observe(stats[1], route)
@@ -0,0 +1,47 @@
+import base64
+from typing import List
+
+from fastapi import HTTPException, Query, Response
+from src.settings import PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class Page:
+    """
+    Параметры keyset пагинации списка по id: limit и непрозрачный курсор,
+    указывающий на последний id предыдущей страницы.
+    Курсор следующей страницы возвращается в заголовке X-Next-Cursor.
+    """
+
+    def __init__(
+        self,
+        response: Response,
+        limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+        cursor: str = None,
+    ):
+        self.response = response
+        self.limit = limit
+        self.after_id = decode_cursor(cursor) if cursor else None
+
+    @property
+    def fetch_limit(self) -> int:
+        # One extra row tells if there is a next page
+        return self.limit + 1
+
+    def items(self, rows: List) -> List:
+        if len(rows) > self.limit:
+            rows = rows[: self.limit]
+            self.response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].id)
+        return rows
+
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Incorrect cursor")
@@ -1,13 +1,35 @@
+from collections import Counter
 from typing import List
 
-from asyncpg.exceptions import UniqueViolationError
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from src.db import db, Booking, FilmShow
+from src.admission import admission
+from src.db import Booking
+from src.export import export_response
+from src.fast_json import RowEncoder
+from src.http_cache import bump_film_shows
+from src.metrics import booking_conflicts
+from src.pagination import Page
+from src.routers.film_show import validate_date
+from src.seats import seat_maps
+from src.settings import BOOKING_MAX_PLACES
+from src.storage import (
+    BOOKING_EXPORT_FIELDS,
+    FilmShowGoneError,
+    FilmShowNotFoundError,
+    PlaceOutOfHallError,
+    PlacesBusyError,
+    Place,
+    PlacesHeldError,
+    storage,
+)
 from datetime import datetime
 
 router = APIRouter()
 
+# Attempts to claim the best block when other requests take its places first
+BEST_AVAILABLE_ATTEMPTS = 3
+
 
 class BookingIn(BaseModel):
     id_film_show: int
@@ -15,6 +37,21 @@ class BookingIn(BaseModel):
     place: int
 
 
+class BookingPlaceIn(BaseModel):
+    row: int
+    place: int
+
+
+class BookingBatchIn(BaseModel):
+    id_film_show: int
+    places: List[BookingPlaceIn]
+
+
+class BookingBestIn(BaseModel):
+    id_film_show: int
+    count: int
+
+
 class BookingOut(BaseModel):
     id: int
     id_film_show: int
@@ -26,36 +63,183 @@ class BookingOut(BaseModel):
         return cls(id=m.id, id_film_show=m.id_film_show, row=m.row, place=m.place,)
 
 
+booking_encoder = RowEncoder(BookingOut)
+
+
+class AdmissionStatusOut(BaseModel):
+    id_film_show: int
+    active: int
+    queued: int
+    eta: float
+
+
+def places_detail(message, places):
+    return {
+        "message": message,
+        "places": [{"row": row, "place": place} for row, place in sorted(places)],
+    }
+
+
+def request_places(places_in: List[BookingPlaceIn], empty_detail: str) -> List[Place]:
+    # Checked before admission and storage, the list size is not limited by the
+    # request model
+    if not places_in:
+        raise HTTPException(status_code=400, detail=empty_detail)
+    if len(places_in) > BOOKING_MAX_PLACES:
+        raise HTTPException(status_code=400, detail="Too many places in request")
+    places = [(place.row, place.place) for place in places_in]
+    duplicates = [place for place, count in Counter(places).items() if count > 1]
+    if duplicates:
+        raise HTTPException(
+            status_code=400,
+            detail=places_detail("Places repeated in request", duplicates),
+        )
+    return places
+
+
 @router.get("/", response_model=List[BookingOut])
-async def get_booking_list():
-    async with db.transaction():
-        booking_list = await Booking.query.order_by(Booking.id).gino.all()
-        booking_list = [BookingOut.from_model(booking) for booking in booking_list]
-        return booking_list
+async def get_booking_list(id_film_show: int = None, page: Page = Depends()):
+    booking_list = page.items(
+        await storage.bookings.list(id_film_show, page.after_id, page.fetch_limit)
+    )
+    return booking_encoder.response(booking_list, page.response)
+
+
+@router.get("/export")
+async def export_booking_list(
+    format: str = "ndjson",
+    start_date: str = None,
+    end_date: str = None,
+    id_cinema: int = None,
+):
+    start_date, end_date = validate_date(start_date), validate_date(end_date)
+    rows = storage.bookings.export(
+        start_date and start_date.date(), end_date and end_date.date(), id_cinema
+    )
+    return export_response(rows, BOOKING_EXPORT_FIELDS, format, "booking")
 
 
 @router.post("/", response_model=BookingOut)
 async def create_booking(booking_in: BookingIn):
-    now = datetime.now()
-    film_show = await FilmShow.query.where(
-        FilmShow.id == booking_in.id_film_show
-    ).gino.first()
-    if now >= film_show.start_time:
-        raise HTTPException(status_code=400, detail="This film show already gone")
-    try:
-        booking = await Booking.create(
-            id_film_show=booking_in.id_film_show,
-            row=booking_in.row,
-            place=booking_in.place,
-        )
-    except UniqueViolationError:
-        raise HTTPException(status_code=400, detail="This place already busy")
-    return BookingOut.from_model(booking)
+    async with admission.admit(booking_in.id_film_show, "create_booking"):
+        try:
+            booking, id_hall = await storage.bookings.book(
+                booking_in.id_film_show,
+                booking_in.row,
+                booking_in.place,
+                datetime.now(),
+            )
+        except FilmShowNotFoundError:
+            raise HTTPException(status_code=404, detail="Film show not found")
+        except FilmShowGoneError:
+            raise HTTPException(status_code=400, detail="This film show already gone")
+        except PlaceOutOfHallError:
+            raise HTTPException(status_code=400, detail="No such place in the hall")
+        except PlacesHeldError:
+            raise HTTPException(status_code=400, detail="This place is on hold")
+        except PlacesBusyError:
+            booking_conflicts.inc("create_booking")
+            raise HTTPException(status_code=400, detail="This place already busy")
+        seat_maps.take(booking.id_film_show, booking.row, booking.place)
+        bump_film_shows(id_hall)
+        return BookingOut.from_model(booking)
+
+
+@router.post("/batch", response_model=List[BookingOut])
+async def create_booking_batch(booking_in: BookingBatchIn):
+    places = request_places(booking_in.places, "No places to book")
+    async with admission.admit(booking_in.id_film_show, "create_booking_batch"):
+        now = datetime.now()
+        film_show = await storage.film_shows.get(booking_in.id_film_show)
+        if not film_show:
+            raise HTTPException(status_code=404, detail="Film show not found")
+        if now >= film_show.start_time:
+            raise HTTPException(status_code=400, detail="This film show already gone")
+        try:
+            booking_list = await storage.bookings.create_many(
+                film_show.id, places, held_at=now
+            )
+        except PlaceOutOfHallError as error:
+            raise HTTPException(
+                status_code=400,
+                detail=places_detail("No such place in the hall", error.places),
+            )
+        except PlacesHeldError as error:
+            raise HTTPException(
+                status_code=400,
+                detail=places_detail("These places are on hold", error.places),
+            )
+        except PlacesBusyError as error:
+            booking_conflicts.inc("create_booking_batch")
+            raise HTTPException(
+                status_code=400,
+                detail=places_detail("These places already busy", error.places),
+            )
+        for booking in booking_list:
+            seat_maps.take(booking.id_film_show, booking.row, booking.place)
+        bump_film_shows(film_show.id_hall)
+        return [BookingOut.from_model(booking) for booking in booking_list]
+
+
+@router.post("/best-available", response_model=List[BookingOut])
+async def create_booking_best_available(booking_in: BookingBestIn):
+    """
+    Бронирует count свободных мест подряд в одном ряду, ближайших к центру
+    зала. Блок выбирается по карте мест сеанса и бронируется одним insert;
+    если места успели занять, карта обновляется и выбирается следующий блок.
+    """
+    async with admission.admit(
+        booking_in.id_film_show, "create_booking_best_available"
+    ):
+        now = datetime.now()
+        film_show = await storage.film_shows.get(booking_in.id_film_show)
+        if not film_show:
+            raise HTTPException(status_code=404, detail="Film show not found")
+        if now >= film_show.start_time:
+            raise HTTPException(status_code=400, detail="This film show already gone")
+        seat_map = await seat_maps.get(film_show.id)
+        if booking_in.count < 1 or booking_in.count > seat_map.places_in_row:
+            raise HTTPException(status_code=400, detail="Incorrect places count")
+        for _ in range(BEST_AVAILABLE_ATTEMPTS):
+            seat_map = await seat_maps.get(film_show.id)
+            block = seat_map.best_block(booking_in.count)
+            if block is None:
+                raise HTTPException(
+                    status_code=400, detail="No adjacent places available"
+                )
+            row, first = block
+            places = [(row, place) for place in range(first, first + booking_in.count)]
+            try:
+                booking_list = await storage.bookings.create_many(
+                    film_show.id, places, held_at=now
+                )
+            except PlacesHeldError as error:
+                # Places held by another worker are not in this seat map
+                taken = error.places
+            except PlacesBusyError as error:
+                booking_conflicts.inc("create_booking_best_available")
+                taken = error.places
+            else:
+                for booking in booking_list:
+                    seat_maps.take(booking.id_film_show, booking.row, booking.place)
+                bump_film_shows(film_show.id_hall)
+                return [BookingOut.from_model(booking) for booking in booking_list]
+            for row, place in taken:
+                seat_maps.take(film_show.id, row, place)
+        raise HTTPException(status_code=400, detail="These places already busy")
+
+
+@router.get("/queue/{id_film_show}", response_model=AdmissionStatusOut)
+async def get_booking_queue(id_film_show: int):
+    # Booking requests of the film show being executed and waiting in this worker
+    return AdmissionStatusOut(
+        id_film_show=id_film_show, **admission.status(id_film_show)
+    )
 
 
 @router.get("/{id_booking}", response_model=BookingOut)
 async def get_booking(id_booking: int):
-    booking = await Booking.query.where(Booking.id == id_booking).gino.first()
+    booking = await storage.bookings.get(id_booking)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     return BookingOut.from_model(booking)
@@ -63,7 +247,10 @@ async def get_booking(id_booking: int):
 
 @router.delete("/{id_booking}")
 async def delete_booking(id_booking: int):
-    booking = await Booking.query.where(Booking.id == id_booking).gino.first()
-    if not booking:
+    deleted = await storage.bookings.delete(id_booking)
+    if not deleted:
         raise HTTPException(status_code=404, detail="Booking not found")
-    await Booking.delete.where(Booking.id == id_booking).gino.status()
+    booking, id_hall = deleted
+    seat_maps.release(booking.id_film_show, booking.row, booking.place)
+    # Sold counter is a part of the film show lists
+    bump_film_shows(id_hall)
@@ -0,0 +1,20 @@
+from typing import List
+
+from fastapi import APIRouter
+from pydantic import BaseModel
+from src.cache import caches
+
+router = APIRouter()
+
+
+class CacheStatsOut(BaseModel):
+    name: str
+    size: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+@router.get("/stats", response_model=List[CacheStatsOut])
+async def get_cache_stats():
+    return [CacheStatsOut(name=cache.name, **cache.stats()) for cache in caches]
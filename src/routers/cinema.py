@@ -1,11 +1,18 @@
 from typing import List
-from sqlalchemy import and_
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic import BaseModel
-from src.db import db, Cinema, CinemaHall, FilmShow
-from src.routers.cinema_hall import CinemaHallOut
-from src.routers.film_show import FilmShowOut
+from src import cache
+from src.db import Cinema
+from src.fast_json import RowEncoder
+from src.http_cache import not_modified, versions
+from src.pagination import Page
+from src.routers.cinema_hall import CinemaHallOut, cinema_hall_encoder
+from src.routers.film import FilmOut
+from src.routers.film_show import FilmShowOut, film_show_encoder, validate_date
+from src.single_flight import film_show_flight, shared_page
+from src.storage import storage
+from datetime import date, datetime
 
 router = APIRouter()
 
@@ -30,29 +37,48 @@ class CinemaOut(BaseModel):
         return cls(id=m.id, name=m.name, city=m.city,)
 
 
+cinema_encoder = RowEncoder(CinemaOut)
+
+
 class CinemaHallIn(BaseModel):
     name: str
     rows: int
     places_in_row: int
 
 
+class ScheduleHallOut(CinemaHallOut):
+    film_shows: List[FilmShowOut]
+
+
+class ScheduleOut(BaseModel):
+    cinema: CinemaOut
+    show_date: date
+    halls: List[ScheduleHallOut]
+    # Films of the day shows, each film once
+    films: List[FilmOut]
+
+
 @router.get("/", response_model=List[CinemaOut])
-async def get_cinema_list():
-    async with db.transaction():
-        cinema_list = await Cinema.query.order_by(Cinema.id).gino.all()
-        cinema_list = [CinemaOut.from_model(cinema) for cinema in cinema_list]
-        return cinema_list
+async def get_cinema_list(request: Request, city: str = None, page: Page = Depends()):
+    cached = not_modified(request, page.response, "cinema")
+    if cached:
+        return cached
+    cinema_list = page.items(
+        await storage.cinemas.list(city, page.after_id, page.fetch_limit)
+    )
+    return cinema_encoder.response(cinema_list, page.response)
 
 
 @router.post("/", response_model=CinemaOut)
 async def create_cinema(cinema_in: CinemaIn):
-    cinema = await Cinema.create(name=cinema_in.name, city=cinema_in.city)
+    cinema = await storage.cinemas.create(name=cinema_in.name, city=cinema_in.city)
+    versions.bump("cinema")
     return CinemaOut.from_model(cinema)
 
 
 @router.get("/{cinema_id}", response_model=CinemaOut)
 async def get_cinema(cinema_id: int):
-    cinema = await Cinema.query.where(Cinema.id == cinema_id).gino.first()
+    cinema = await cache.get_cinema(cinema_id)
     if not cinema:
         raise HTTPException(status_code=404, detail="Cinema not found")
     return CinemaOut.from_model(cinema)
@@ -60,72 +86,124 @@ async def get_cinema(cinema_id: int):
 
 @router.patch("/{cinema_id}")
 async def update_cinema(cinema_id: int, cinema_in: CinemaInUpdate):
-    cinema = await Cinema.query.where(Cinema.id == cinema_id).gino.first()
+    cinema = await storage.cinemas.update(
+        cinema_id, **cinema_in.dict(exclude_unset=True)
+    )
     if not cinema:
         raise HTTPException(status_code=404, detail="Cinema not found")
-    if cinema_in.name:
-        await cinema.update(name=cinema_in.name).apply()
-    if cinema_in.city:
-        await cinema.update(city=cinema_in.city).apply()
+    cache.cinema_cache.invalidate(cinema_id)
+    versions.bump("cinema")
     return "Updated"
 
 
 @router.post("/{cinema_id}/hall/", response_model=CinemaHallOut)
 async def create_cinema_hall(cinema_id: int, cinema_hall_in: CinemaHallIn):
-    cinema = await Cinema.query.where(Cinema.id == cinema_id).gino.first()
+    cinema = await cache.get_cinema(cinema_id)
     if not cinema:
         raise HTTPException(
             status_code=404, detail="Cinema ID for new cinema hall not found"
         )
-    cinema_hall = await CinemaHall.create(
+    cinema_hall = await storage.halls.create(
         name=cinema_hall_in.name,
         id_cinema=cinema_id,
         rows=cinema_hall_in.rows,
         places_in_row=cinema_hall_in.places_in_row,
     )
+    versions.bump("cinema_hall")
     return CinemaHallOut.from_model(cinema_hall)
 
 
+@router.get("/{cinema_id}/schedule", response_model=ScheduleOut)
+async def get_cinema_schedule(
+    request: Request, response: Response, cinema_id: int, date: str = None
+):
+    """
+    Расписание кинотеатра на день (show_date, по умолчанию сегодня): залы,
+    их сеансы и фильмы сеансов одним запросом с join вместо запросов
+    по каждому залу и фильму.
+    """
+    show_date = (validate_date(date) or datetime.now()).date()
+    cached = not_modified(
+        request,
+        response,
+        "cinema",
+        "cinema_hall",
+        "film_show",
+        "film",
+        variant=f"-{show_date}",
+    )
+    if cached:
+        return cached
+    rows = await storage.film_shows.schedule(cinema_id, show_date)
+    if not rows:
+        raise HTTPException(status_code=404, detail="Cinema not found")
+    halls, films = {}, {}
+    for _, cinema_hall, film_show, film in rows:
+        if cinema_hall is None:
+            continue
+        hall = halls.get(cinema_hall.id)
+        if hall is None:
+            hall = halls[cinema_hall.id] = ScheduleHallOut(
+                **CinemaHallOut.from_model(cinema_hall).dict(), film_shows=[]
+            )
+        if film_show is None:
+            continue
+        hall.film_shows.append(FilmShowOut.from_model(film_show))
+        if film.id not in films:
+            films[film.id] = FilmOut.from_model(film)
+    return ScheduleOut(
+        cinema=CinemaOut.from_model(rows[0][0]),
+        show_date=show_date,
+        halls=list(halls.values()),
+        films=list(films.values()),
+    )
+
+
 @router.get("/{cinema_id}/hall/", response_model=List[CinemaHallOut])
-async def get_cinema_hall_list(cinema_id: int):
-    async with db.transaction():
-        cinema_hall_list = await CinemaHall.query.where(
-            CinemaHall.id_cinema == cinema_id
-        ).gino.all()
-        cinema_hall_list = [
-            CinemaHallOut.from_model(cinema) for cinema in cinema_hall_list
-        ]
-        return cinema_hall_list
+async def get_cinema_hall_list(
+    request: Request, cinema_id: int, page: Page = Depends()
+):
+    cached = not_modified(request, page.response, "cinema_hall")
+    if cached:
+        return cached
+    cinema_hall_list = page.items(
+        await storage.halls.list(cinema_id, page.after_id, page.fetch_limit)
+    )
+    return cinema_hall_encoder.response(cinema_hall_list, page.response)
 
 
 @router.get("/{cinema_id}/hall/{cinema_hall_id}", response_model=CinemaHallOut)
 async def get_cinema_hall(cinema_id: int, cinema_hall_id: int):
-    async with db.transaction():
-        cinema_hall = await CinemaHall.query.where(
-            and_(CinemaHall.id == cinema_hall_id, CinemaHall.id_cinema == cinema_id)
-        ).gino.first()
-        if not cinema_hall:
-            raise HTTPException(status_code=404, detail="Cinema hall not found")
-        return CinemaHallOut.from_model(cinema_hall)
+    cinema_hall = await cache.get_cinema_hall(cinema_hall_id)
+    if not cinema_hall or cinema_hall.id_cinema != cinema_id:
+        raise HTTPException(status_code=404, detail="Cinema hall not found")
+    return CinemaHallOut.from_model(cinema_hall)
 
 
 @router.get(
     "/{cinema_id}/hall/{cinema_hall_id}/film-show/", response_model=List[FilmShowOut]
 )
-async def get_film_show_list(cinema_id: int, cinema_hall_id: int):
-    async with db.transaction():
-        cinema = await Cinema.query.where(Cinema.id == cinema_id).gino.first()
-        if not cinema:
-            raise HTTPException(status_code=404, detail="Cinema not found")
-        cinema_hall = await CinemaHall.query.where(
-            and_(CinemaHall.id == cinema_hall_id, CinemaHall.id_cinema == cinema_id)
-        ).gino.first()
-        if not cinema_hall:
-            raise HTTPException(status_code=404, detail="Cinema hall not found")
-        film_show = await FilmShow.query.where(
-            FilmShow.id_hall == cinema_hall.id
-        ).gino.all()
+async def get_film_show_list(
+    request: Request, cinema_id: int, cinema_hall_id: int, page: Page = Depends()
+):
+    cinema = await cache.get_cinema(cinema_id)
+    if not cinema:
+        raise HTTPException(status_code=404, detail="Cinema not found")
+    cinema_hall = await cache.get_cinema_hall(cinema_hall_id)
+    if not cinema_hall or cinema_hall.id_cinema != cinema_id:
+        raise HTTPException(status_code=404, detail="Cinema hall not found")
+    cached = not_modified(request, page.response, ("film_show", cinema_hall.id))
+    if cached:
+        return cached
+
+    async def load():
+        film_show = await storage.film_shows.list(
+            id_hall=cinema_hall.id, after_id=page.after_id, limit=page.fetch_limit
+        )
         if not film_show:
             raise HTTPException(status_code=404, detail="Film show not found")
-        film_show_list = [FilmShowOut.from_model(show) for show in film_show]
-        return film_show_list
+        return film_show
+
+    return await shared_page(
+        film_show_flight, ("hall", cinema_hall.id), page, film_show_encoder, load
+    )
@@ -1,8 +1,14 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
-from src.db import db, Cinema, CinemaHall
+from src import cache
+from src.db import CinemaHall
+from src.fast_json import RowEncoder
+from src.http_cache import bump_film_shows, not_modified, versions
+from src.pagination import Page
+from src.seats import seat_maps
+from src.storage import storage
 
 router = APIRouter()
 
@@ -31,21 +37,25 @@ class CinemaHallOut(BaseModel):
         )
 
 
+cinema_hall_encoder = RowEncoder(CinemaHallOut)
+
+
 @router.get("/", response_model=List[CinemaHallOut])
-async def get_cinema_hall_list():
-    async with db.transaction():
-        cinema_hall_list = await CinemaHall.query.order_by(CinemaHall.id).gino.all()
-        cinema_hall_list = [
-            CinemaHallOut.from_model(cinema) for cinema in cinema_hall_list
-        ]
-        return cinema_hall_list
+async def get_cinema_hall_list(
+    request: Request, id_cinema: int = None, page: Page = Depends()
+):
+    cached = not_modified(request, page.response, "cinema_hall")
+    if cached:
+        return cached
+    cinema_hall_list = page.items(
+        await storage.halls.list(id_cinema, page.after_id, page.fetch_limit)
+    )
+    return cinema_hall_encoder.response(cinema_hall_list, page.response)
 
 
 @router.get("/{cinema_hall_id}", response_model=CinemaHallOut)
 async def get_cinema_hall(cinema_hall_id: int):
-    cinema_hall = await CinemaHall.query.where(
-        CinemaHall.id == cinema_hall_id
-    ).gino.first()
+    cinema_hall = await cache.get_cinema_hall(cinema_hall_id)
     if not cinema_hall:
         raise HTTPException(status_code=404, detail="Cinema hall not found")
     return CinemaHallOut.from_model(cinema_hall)
@@ -53,10 +63,14 @@ async def get_cinema_hall(cinema_hall_id: int):
 
 @router.patch("/{cinema_hall_id}")
 async def update_cinema_hall(cinema_hall_id: int, cinema_hall_in: CinemaHallInUpdate):
-    cinema_hall = await CinemaHall.query.where(
-        CinemaHall.id == cinema_hall_id
-    ).gino.first()
+    cinema_hall = await storage.halls.update(
+        cinema_hall_id, **cinema_hall_in.dict(exclude_unset=True)
+    )
     if not cinema_hall:
         raise HTTPException(status_code=404, detail="Cinema hall not found")
-    await cinema_hall.update(**cinema_hall_in.dict(exclude_unset=True)).apply()
+    cache.cinema_hall_cache.invalidate(cinema_hall_id)
+    seat_maps.invalidate_hall(cinema_hall_id)
+    # Capacity of the hall film shows changes with its size
+    versions.bump("cinema_hall")
+    bump_film_shows(cinema_hall_id)
     return "Updated"
@@ -1,8 +1,13 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
-from src.db import db, Film
+from src import cache
+from src.db import Film
+from src.fast_json import RowEncoder
+from src.http_cache import not_modified, versions
+from src.pagination import Page
+from src.storage import storage
 
 router = APIRouter()
 
@@ -43,29 +48,36 @@ class FilmOut(BaseModel):
         )
 
 
+film_encoder = RowEncoder(FilmOut)
+
+
 @router.get("/", response_model=List[FilmOut])
-async def get_film_list():
-    async with db.transaction():
-        film_list = await Film.query.order_by(Film.id).gino.all()
-        film_list = [FilmOut.from_model(film) for film in film_list]
-        return film_list
+async def get_film_list(request: Request, genre: str = None, page: Page = Depends()):
+    cached = not_modified(request, page.response, "film")
+    if cached:
+        return cached
+    film_list = page.items(
+        await storage.films.list(genre, page.after_id, page.fetch_limit)
+    )
+    return film_encoder.response(film_list, page.response)
 
 
 @router.post("/", response_model=FilmOut)
 async def create_film(film_in: FilmIn):
-    film = await Film.create(
+    film = await storage.films.create(
         title=film_in.title,
         genre=film_in.genre,
         cast=film_in.cast,
         description=film_in.description,
         duration=film_in.duration,
     )
+    versions.bump("film")
     return FilmOut.from_model(film)
 
 
 @router.get("/{film_id}", response_model=FilmOut)
 async def get_film(film_id: int):
-    film = await Film.query.where(Film.id == film_id).gino.first()
+    film = await cache.get_film(film_id)
     if not film:
         raise HTTPException(status_code=404, detail="Film not found")
     return FilmOut.from_model(film)
@@ -73,7 +85,8 @@ async def get_film(film_id: int):
 
 @router.patch("/{film_id}")
 async def update_film(film_id: int, film_in: FilmInUpdate):
-    film = await Film.query.where(Film.id == film_id).gino.first()
+    film = await storage.films.update(film_id, **film_in.dict(exclude_unset=True))
     if not film:
         raise HTTPException(status_code=404, detail="Film not found")
-    await film.update(**film_in.dict(exclude_unset=True)).apply()
+    cache.film_cache.invalidate(film_id)
+    versions.bump("film")
@@ -1,9 +1,24 @@
+import asyncio
+import csv
+import io
+import json
+from collections import defaultdict
 from typing import List
-from sqlalchemy import and_, or_
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from src.db import db, FilmShow, Film
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from src import cache
+from src.db import FilmShow
+from src.export import export_response
+from src.fast_json import RowEncoder
+from src.http_cache import bump_film_shows, not_modified
+from src.pagination import Page
+from src.seat_events import RESET, seat_channels
+from src.seats import seat_maps
+from src.settings import FILM_SHOW_BULK_MAX_SIZE, SEAT_EVENTS_KEEPALIVE
+from src.single_flight import film_show_flight, shared_page
+from src.storage import FILM_SHOW_EXPORT_FIELDS, ShowTimeBusyError, storage
 from datetime import datetime, date, time, timedelta
 
 DAY_END_TIME = time(7, 0)
@@ -29,6 +44,8 @@ class FilmShowOut(BaseModel):
     end_time: time
     id_hall: int
     id_film: int
+    sold: int
+    capacity: int
 
     @classmethod
     def from_model(cls, m: FilmShow):
@@ -39,9 +56,33 @@ class FilmShowOut(BaseModel):
             end_time=m.end_time.time(),
             id_hall=m.id_hall,
             id_film=m.id_film,
+            sold=m.sold,
+            capacity=m.capacity,
         )
 
 
+film_show_encoder = RowEncoder(
+    FilmShowOut,
+    start_time=lambda m: m.start_time.time(),
+    end_time=lambda m: m.end_time.time(),
+)
+
+
+class FilmShowBulkItemOut(BaseModel):
+    index: int
+    status_code: int
+    film_show: FilmShowOut = None
+    detail: str = None
+
+
+class SeatMapOut(BaseModel):
+    id_film_show: int
+    rows: int
+    places_in_row: int
+    # One string per row, "1" - place is taken, "0" - place is free
+    seats: List[str]
+
+
 def validate_date(check_date):
     if check_date:
         try:
@@ -52,65 +93,286 @@ def validate_date(check_date):
 
 
 @router.get("/", response_model=List[FilmShowOut])
-async def get_film_show_list(start_date: str = None, end_date: str = None):
+async def get_film_show_list(
+    request: Request,
+    start_date: str = None,
+    end_date: str = None,
+    id_hall: int = None,
+    id_film: int = None,
+    page: Page = Depends(),
+):
     start_date, end_date = validate_date(start_date), validate_date(end_date)
-    async with db.transaction():
-        query = FilmShow.query
-        if start_date:
-            query = query.where(
-                FilmShow.start_time >= datetime.combine(start_date, DAY_END_TIME)
-            )
-        if end_date:
-            query = query.where(
-                FilmShow.end_time
-                < datetime.combine(end_date + timedelta(days=1), DAY_END_TIME)
-            )
-        film_show_list = await query.order_by(FilmShow.id).gino.all()
-        film_show_list = [
-            FilmShowOut.from_model(film_show) for film_show in film_show_list
-        ]
-        return film_show_list
+    # Film shows of one hall have a version of their own
+    key = "film_show" if id_hall is None else ("film_show", id_hall)
+    cached = not_modified(request, page.response, key)
+    if cached:
+        return cached
+    start_from = start_date and datetime.combine(start_date, DAY_END_TIME)
+    end_before = end_date and datetime.combine(
+        end_date + timedelta(days=1), DAY_END_TIME
+    )
+    return await shared_page(
+        film_show_flight,
+        ("list", start_from, end_before, id_hall, id_film),
+        page,
+        film_show_encoder,
+        lambda: storage.film_shows.list(
+            start_from=start_from,
+            end_before=end_before,
+            id_hall=id_hall,
+            id_film=id_film,
+            after_id=page.after_id,
+            limit=page.fetch_limit,
+        ),
+    )
 
 
 @router.post("/", response_model=FilmShowOut)
 async def create_film_show(film_show_in: FilmShowIn):
     start_time = datetime.fromisoformat(film_show_in.start_time.strip("Zz"))
-    film = await Film.query.where(Film.id == film_show_in.id_film).gino.first()
+    film = await cache.get_film(film_show_in.id_film)
     duration = film.duration
     end_time = start_time + timedelta(minutes=duration)
 
     # Split date and time
     show_date = start_time.date()
-    film_show_time_conflict = await FilmShow.query.where(
-        or_(
-            and_(start_time <= FilmShow.start_time, FilmShow.start_time <= end_time),
-            and_(start_time <= FilmShow.end_time, FilmShow.end_time <= end_time),
+    if await storage.film_shows.has_conflict(
+        film_show_in.id_hall, start_time, end_time
+    ):
+        raise HTTPException(status_code=400, detail="Show time already busy")
+
+    try:
+        film_show = await storage.film_shows.create(
+            show_date=show_date,
+            start_time=start_time,
+            end_time=end_time,
+            id_hall=film_show_in.id_hall,
+            id_film=film_show_in.id_film,
         )
-    ).gino.first()
-    if film_show_time_conflict:
+    except ShowTimeBusyError:
+        # Concurrent film show in the same hall was created first
         raise HTTPException(status_code=400, detail="Show time already busy")
+    bump_film_shows(film_show.id_hall)
+    return FilmShowOut.from_model(film_show)
+
 
-    film_show = await FilmShow.create(
-        show_date=show_date,
-        start_time=start_time,
-        end_time=end_time,
-        id_hall=film_show_in.id_hall,
-        id_film=film_show_in.id_film,
+@router.get("/export")
+async def export_film_show_list(
+    format: str = "ndjson",
+    start_date: str = None,
+    end_date: str = None,
+    id_cinema: int = None,
+):
+    start_date, end_date = validate_date(start_date), validate_date(end_date)
+    rows = storage.film_shows.export(
+        start_date and start_date.date(), end_date and end_date.date(), id_cinema
     )
-    return FilmShowOut.from_model(film_show)
+    return export_response(rows, FILM_SHOW_EXPORT_FIELDS, format, "film_show")
+
+
+async def read_film_show_list(request: Request) -> list:
+    """
+    Список сеансов из тела запроса - JSON массив, NDJSON или CSV
+    с колонками start_time, id_hall, id_film
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    body = (await request.body()).decode()
+    try:
+        if content_type == "text/csv":
+            return list(csv.DictReader(io.StringIO(body)))
+        if content_type in ("application/x-ndjson", "application/jsonl"):
+            return [json.loads(line) for line in body.splitlines() if line.strip()]
+        items = json.loads(body)
+    except (ValueError, csv.Error):
+        raise HTTPException(status_code=400, detail="Incorrect film show list")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Incorrect film show list")
+    return items
+
+
+@router.post("/bulk", response_model=List[FilmShowBulkItemOut])
+async def create_film_show_bulk(request: Request):
+    items = await read_film_show_list(request)
+    if len(items) > FILM_SHOW_BULK_MAX_SIZE:
+        raise HTTPException(status_code=400, detail="Too many film shows")
+    results = [None] * len(items)
+    shows = []
+    for index, item in enumerate(items):
+        try:
+            film_show_in = FilmShowIn(**item)
+            start_time = datetime.fromisoformat(film_show_in.start_time.strip("Zz"))
+        except (TypeError, ValueError, ValidationError):
+            results[index] = FilmShowBulkItemOut(
+                index=index, status_code=400, detail="Incorrect film show data"
+            )
+            continue
+        shows.append((index, film_show_in, start_time))
+
+    # One query per referenced table for the whole batch
+    id_films = {film_show_in.id_film for index, film_show_in, start_time in shows}
+    id_halls = {film_show_in.id_hall for index, film_show_in, start_time in shows}
+    durations = await storage.films.durations(id_films)
+    halls = await storage.halls.existing(id_halls)
+    intervals = defaultdict(list)
+    for index, film_show_in, start_time in shows:
+        if film_show_in.id_film not in durations:
+            results[index] = FilmShowBulkItemOut(
+                index=index, status_code=404, detail="Film not found"
+            )
+        elif film_show_in.id_hall not in halls:
+            results[index] = FilmShowBulkItemOut(
+                index=index, status_code=404, detail="Cinema hall not found"
+            )
+        else:
+            end_time = start_time + timedelta(minutes=durations[film_show_in.id_film])
+            intervals[film_show_in.id_hall].append(
+                (start_time, end_time, index, film_show_in.id_film)
+            )
+    if intervals:
+        start_time = min(start for hall in intervals.values() for start, *_ in hall)
+        end_time = max(end for hall in intervals.values() for _, end, *_ in hall)
+        existing = await storage.film_shows.overlapping(
+            list(intervals), start_time, end_time
+        )
+        for id_hall, start, end in existing:
+            # Index -1 marks already scheduled film show
+            intervals[id_hall].append((start, end, -1, None))
+
+    # Sweep sorted intervals of every hall, earlier film show wins
+    accepted = []
+    for id_hall, hall_intervals in intervals.items():
+        hall_intervals.sort(key=lambda interval: (interval[0], interval[2]))
+        last = None
+        for interval in hall_intervals:
+            start, end, index, id_film = interval
+            if last is None or start > last[1]:
+                last = interval
+                continue
+            if index >= 0:
+                results[index] = FilmShowBulkItemOut(
+                    index=index, status_code=400, detail="Show time already busy"
+                )
+            else:
+                results[last[2]] = FilmShowBulkItemOut(
+                    index=last[2], status_code=400, detail="Show time already busy"
+                )
+                last = interval
+        accepted.extend(
+            (id_hall, start, end, index, id_film)
+            for start, end, index, id_film in hall_intervals
+            if index >= 0 and results[index] is None
+        )
+
+    if accepted:
+        try:
+            film_show_list = await storage.film_shows.create_many(
+                [
+                    dict(
+                        show_date=start.date(),
+                        start_time=start,
+                        end_time=end,
+                        id_hall=id_hall,
+                        id_film=id_film,
+                    )
+                    for id_hall, start, end, index, id_film in accepted
+                ]
+            )
+        except ShowTimeBusyError:
+            # Concurrent film show in one of the halls was created first
+            raise HTTPException(status_code=400, detail="Show time already busy")
+        bump_film_shows(*intervals)
+        indexes = {
+            (id_hall, start): index for id_hall, start, end, index, id_film in accepted
+        }
+        for film_show in film_show_list:
+            index = indexes[film_show.id_hall, film_show.start_time]
+            results[index] = FilmShowBulkItemOut(
+                index=index,
+                status_code=200,
+                film_show=FilmShowOut.from_model(film_show),
+            )
+    return results
 
 
 @router.get("/{film_show_id}", response_model=FilmShowOut)
 async def get_film_show(film_show_id: int):
-    film_show = await FilmShow.query.where(FilmShow.id == film_show_id).gino.first()
+    film_show = await storage.film_shows.get(film_show_id)
     if not film_show:
         raise HTTPException(status_code=404, detail="Film not found")
     return FilmShowOut.from_model(film_show)
 
 
+@router.get("/{film_show_id}/seats", response_model=SeatMapOut)
+async def get_film_show_seats(film_show_id: int, format: str = "json"):
+    if format not in ("json", "packed"):
+        raise HTTPException(status_code=400, detail="Incorrect seat map format")
+    seat_map = await seat_maps.get(film_show_id)
+    if not seat_map:
+        raise HTTPException(status_code=404, detail="Film show not found")
+    if format == "packed":
+        # Bitmap of taken places, row by row, most significant bit first
+        return Response(
+            content=seat_map.to_bytes(),
+            media_type="application/octet-stream",
+            headers={
+                "X-Hall-Rows": str(seat_map.rows),
+                "X-Hall-Places-In-Row": str(seat_map.places_in_row),
+            },
+        )
+    return SeatMapOut(
+        id_film_show=film_show_id,
+        rows=seat_map.rows,
+        places_in_row=seat_map.places_in_row,
+        seats=seat_map.to_rows(),
+    )
+
+
+async def seat_events(film_show_id: int):
+    # Subscription goes first, so no change is lost between it and snapshot
+    with seat_channels.subscribe(film_show_id) as queue:
+        event = RESET
+        while True:
+            if event is RESET:
+                seat_map = await seat_maps.get(film_show_id)
+                if not seat_map:
+                    return
+                snapshot = SeatMapOut(
+                    id_film_show=film_show_id,
+                    rows=seat_map.rows,
+                    places_in_row=seat_map.places_in_row,
+                    seats=seat_map.to_rows(),
+                )
+                yield f"event: snapshot\ndata: {snapshot.json()}\n\n"
+            else:
+                yield f"event: delta\ndata: {event}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SEAT_EVENTS_KEEPALIVE)
+                    break
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+
+
+@router.get("/{film_show_id}/seats/events")
+async def get_film_show_seat_events(film_show_id: int):
+    """
+    Server-Sent Events: снимок карты мест сеанса (event: snapshot), затем
+    объединенные изменения {"taken": [[row, place]], "released": [...]}
+    (event: delta). Новый snapshot приходит, если изменения были потеряны.
+    """
+    if not await seat_maps.get(film_show_id):
+        raise HTTPException(status_code=404, detail="Film show not found")
+    return StreamingResponse(
+        seat_events(film_show_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.delete("/{film_show_id}")
 async def delete_film_show(film_show_id: int):
-    film_show = await FilmShow.query.where(FilmShow.id == film_show_id).gino.first()
+    film_show = await storage.film_shows.delete(film_show_id)
     if not film_show:
         raise HTTPException(status_code=404, detail="Film_show not found")
-    await FilmShow.delete.where(FilmShow.id == film_show_id).gino.status()
+    seat_maps.invalidate(film_show_id)
+    bump_film_shows(film_show.id_hall)
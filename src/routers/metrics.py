@@ -0,0 +1,9 @@
+from fastapi import APIRouter, Response
+from src.metrics import render_metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import uuid
+from typing import List
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from src.admission import admission
+from src.http_cache import bump_film_shows
+from src.metrics import booking_conflicts
+from src.routers.booking import (
+    BookingOut,
+    BookingPlaceIn,
+    places_detail,
+    request_places,
+)
+from src.seats import seat_maps
+from src.settings import (
+    SEAT_HOLD_TTL,
+    SEAT_HOLD_SWEEP_INTERVAL,
+    SEAT_HOLD_SWEEP_BATCH,
+)
+from src.storage import (
+    FilmShowGoneError,
+    PlaceOutOfHallError,
+    PlacesBusyError,
+    PlacesHeldError,
+    storage,
+)
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+class SeatHoldIn(BaseModel):
+    id_film_show: int
+    places: List[BookingPlaceIn]
+
+
+class SeatHoldOut(BaseModel):
+    token: str
+    id_film_show: int
+    places: List[BookingPlaceIn]
+    expires_at: datetime
+
+
+@router.post("/", response_model=SeatHoldOut)
+async def create_seat_hold(seat_hold_in: SeatHoldIn):
+    places = request_places(seat_hold_in.places, "No places to hold")
+    async with admission.admit(seat_hold_in.id_film_show, "create_seat_hold"):
+        now = datetime.now()
+        film_show = await storage.film_shows.get(seat_hold_in.id_film_show)
+        if not film_show:
+            raise HTTPException(status_code=404, detail="Film show not found")
+        if now >= film_show.start_time:
+            raise HTTPException(status_code=400, detail="This film show already gone")
+        token = uuid.uuid4().hex
+        expires_at = now + timedelta(seconds=SEAT_HOLD_TTL)
+        try:
+            await storage.seat_holds.create(
+                token, film_show.id, places, expires_at, now
+            )
+        except PlacesBusyError as error:
+            raise HTTPException(
+                status_code=400,
+                detail=places_detail("These places already busy", error.places),
+            )
+        except PlaceOutOfHallError as error:
+            raise HTTPException(
+                status_code=400,
+                detail=places_detail("No such place in the hall", error.places),
+            )
+        except PlacesHeldError as error:
+            raise HTTPException(
+                status_code=400,
+                detail=places_detail("These places are on hold", error.places),
+            )
+        for row, place in places:
+            seat_maps.take(film_show.id, row, place)
+        return SeatHoldOut(
+            token=token,
+            id_film_show=film_show.id,
+            places=seat_hold_in.places,
+            expires_at=expires_at,
+        )
+
+
+@router.post("/{token}/confirm", response_model=List[BookingOut])
+async def confirm_seat_hold(token: str):
+    try:
+        booking_list, id_halls = await storage.seat_holds.confirm(token, datetime.now())
+    except FilmShowGoneError:
+        raise HTTPException(status_code=400, detail="This film show already gone")
+    except PlacesBusyError:
+        booking_conflicts.inc("confirm_seat_hold")
+        raise HTTPException(status_code=400, detail="This place already busy")
+    if not booking_list:
+        raise HTTPException(status_code=404, detail="Seat hold not found")
+    bump_film_shows(*id_halls)
+    return [BookingOut.from_model(booking) for booking in booking_list]
+
+
+@router.delete("/{token}")
+async def delete_seat_hold(token: str):
+    released = await storage.seat_holds.delete(token)
+    if not released:
+        raise HTTPException(status_code=404, detail="Seat hold not found")
+    for id_film_show, row, place in released:
+        seat_maps.release(id_film_show, row, place)
+
+
+async def sweep_expired_seat_holds(batch_size: int = SEAT_HOLD_SWEEP_BATCH) -> int:
+    """
+    Удаляет одну пачку просроченных удержаний, возвращает количество удаленных
+    """
+    released = await storage.seat_holds.sweep(datetime.now(), batch_size)
+    for id_film_show, row, place in released:
+        seat_maps.release(id_film_show, row, place)
+    return len(released)
+
+
+async def run_seat_hold_sweeper():
+    while True:
+        try:
+            while await sweep_expired_seat_holds() >= SEAT_HOLD_SWEEP_BATCH:
+                pass
+        except Exception:
+            logger.exception("Expired seat holds sweep failed")
+        await asyncio.sleep(SEAT_HOLD_SWEEP_INTERVAL)
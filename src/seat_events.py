@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import asyncpg
+from src.db import DB_URL, SEAT_CHANGES_CHANNEL
+from src.seats import seat_maps
+from src.storage.base import Place
+from src.settings import (
+    SEAT_EVENTS_WINDOW,
+    SEAT_EVENTS_QUEUE_SIZE,
+    SEAT_EVENTS_RECONNECT_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Subscriber has to load the seat map again, its events were lost
+RESET = None
+
+
+class SeatChannel:
+    """
+    Рассылка изменений мест одного сеанса подписчикам. Изменения за окно
+    SEAT_EVENTS_WINDOW объединяются (последнее состояние места), событие
+    кодируется один раз для всех подписчиков.
+    """
+
+    def __init__(self):
+        self.subscribers: Set[asyncio.Queue] = set()
+        self._pending: Dict[Tuple[int, int], bool] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def publish(self, row: int, place: int, taken: bool):
+        self._pending[(row, place)] = taken
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_event_loop().call_later(
+                SEAT_EVENTS_WINDOW, self.flush
+            )
+
+    def flush(self):
+        self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        places = sorted(pending.items())
+        event = json.dumps(
+            {
+                "taken": [list(place) for place, taken in places if taken],
+                "released": [list(place) for place, taken in places if not taken],
+            }
+        )
+        for queue in self.subscribers:
+            self._put(queue, event)
+
+    def reset(self):
+        self._pending.clear()
+        for queue in self.subscribers:
+            self._put(queue, RESET)
+
+    def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, event):
+        if queue.full():
+            # Slow client gets a new snapshot instead of the missed events
+            while not queue.empty():
+                queue.get_nowait()
+            event = RESET
+        queue.put_nowait(event)
+
+
+class SeatChannelRegistry:
+    """Каналы существуют только для сеансов, у которых есть подписчики"""
+
+    def __init__(self):
+        self._channels: Dict[int, SeatChannel] = {}
+
+    @contextmanager
+    def subscribe(self, id_film_show: int):
+        channel = self._channels.get(id_film_show)
+        if channel is None:
+            channel = self._channels[id_film_show] = SeatChannel()
+        queue = asyncio.Queue(SEAT_EVENTS_QUEUE_SIZE)
+        channel.subscribers.add(queue)
+        try:
+            yield queue
+        finally:
+            channel.subscribers.discard(queue)
+            if not channel.subscribers:
+                channel.close()
+                del self._channels[id_film_show]
+
+    def publish(self, id_film_show: int, row: int, place: int, taken: bool):
+        channel = self._channels.get(id_film_show)
+        if channel is not None:
+            channel.publish(row, place, taken)
+
+    def reset(self, id_film_show: int = None):
+        if id_film_show is None:
+            channels = list(self._channels.values())
+        else:
+            channels = [self._channels.get(id_film_show)]
+        for channel in channels:
+            if channel is not None:
+                channel.reset()
+
+
+seat_channels = SeatChannelRegistry()
+
+
+def publish_seat_changes(id_film_show: int, taken: bool, places: Iterable[Place]):
+    """Изменение мест сеанса попадает в карты мест и каналы этого процесса"""
+    for row, place in places:
+        if taken:
+            seat_maps.take(id_film_show, row, place)
+        else:
+            seat_maps.release(id_film_show, row, place)
+        seat_channels.publish(id_film_show, row, place, taken)
+
+
+def apply_seat_changes(payload: str):
+    """Применяет уведомление SEAT_CHANGES_CHANNEL к картам мест и каналам"""
+    changes = json.loads(payload)
+    id_film_show, taken = changes["s"], bool(changes["t"])
+    if changes["p"] is None:
+        seat_maps.invalidate(id_film_show)
+        seat_channels.reset(id_film_show)
+        return
+    publish_seat_changes(id_film_show, taken, changes["p"])
+
+
+async def run_seat_listener(ready: asyncio.Event = None):
+    """
+    Слушает SEAT_CHANGES_CHANNEL на отдельном соединении, так изменения
+    мест из всех воркеров попадают в карты мест и каналы этого процесса.
+    После переподключения пропущенные уведомления не восстановить -
+    карты мест сбрасываются.
+    """
+
+    def on_notification(connection, pid, channel, payload):
+        try:
+            apply_seat_changes(payload)
+        except Exception:
+            logger.exception("Seat changes notification failed: %s", payload)
+
+    connected_before = False
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(DB_URL)
+            await conn.add_listener(SEAT_CHANGES_CHANNEL, on_notification)
+            if connected_before:
+                seat_maps.clear()
+                seat_channels.reset()
+            connected_before = True
+            if ready is not None:
+                ready.set()
+            while True:
+                # Broken connection is noticed only when something is sent
+                await asyncio.sleep(SEAT_EVENTS_RECONNECT_INTERVAL)
+                await conn.fetchval("SELECT 1")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Seat changes listener failed")
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(SEAT_EVENTS_RECONNECT_INTERVAL)
@@ -0,0 +1,163 @@
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from src.settings import SEAT_MAP_CACHE_SIZE
+from src.storage import storage
+
+
+class SeatMap:
+    """
+    Карта занятости мест сеанса - один бит на место.
+    Ряды и места нумеруются с 1, бит места (row, place) имеет номер
+    (row - 1) * places_in_row + (place - 1), старший бит байта - первый.
+    """
+
+    __slots__ = ("id_hall", "rows", "places_in_row", "bits")
+
+    def __init__(self, id_hall: int, rows: int, places_in_row: int):
+        self.id_hall = id_hall
+        self.rows = rows
+        self.places_in_row = places_in_row
+        self.bits = bytearray((rows * places_in_row + 7) // 8)
+
+    def _index(self, row: int, place: int) -> Optional[int]:
+        if not (1 <= row <= self.rows and 1 <= place <= self.places_in_row):
+            return None
+        return (row - 1) * self.places_in_row + (place - 1)
+
+    def is_taken(self, row: int, place: int) -> bool:
+        index = self._index(row, place)
+        if index is None:
+            return False
+        return bool(self.bits[index >> 3] & (0x80 >> (index & 7)))
+
+    def take(self, row: int, place: int):
+        index = self._index(row, place)
+        if index is not None:
+            self.bits[index >> 3] |= 0x80 >> (index & 7)
+
+    def release(self, row: int, place: int):
+        index = self._index(row, place)
+        if index is not None:
+            self.bits[index >> 3] &= ~(0x80 >> (index & 7)) & 0xFF
+
+    def best_block(self, count: int) -> Optional[Tuple[int, int]]:
+        """
+        Лучший блок из count свободных мест подряд в одном ряду - ближайший
+        к центру зала (квадрат расстояния от центра блока до центра зала).
+        Возвращает (ряд, первое место) или None, один проход по всем местам.
+        """
+        if not 1 <= count <= self.places_in_row:
+            return None
+        best, best_score = None, None
+        bits = self.bits
+        index = 0
+        place_offset = count - self.places_in_row - 2
+        for row in range(1, self.rows + 1):
+            # Doubled coordinates keep the score integer
+            row_score = (2 * row - self.rows - 1) ** 2
+            free = 0
+            for place in range(1, self.places_in_row + 1):
+                if bits[index >> 3] & (0x80 >> (index & 7)):
+                    free = 0
+                else:
+                    free += 1
+                index += 1
+                if free >= count:
+                    first = place - count + 1
+                    score = row_score + (2 * first + place_offset) ** 2
+                    if best_score is None or score < best_score:
+                        best, best_score = (row, first), score
+        return best
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.bits)
+
+    def to_rows(self) -> List[str]:
+        # One string per row, "1" - place is taken, "0" - place is free
+        return [
+            "".join(
+                "1" if self.is_taken(row, place) else "0"
+                for place in range(1, self.places_in_row + 1)
+            )
+            for row in range(1, self.rows + 1)
+        ]
+
+
+class SeatMapRegistry:
+    """
+    Карты занятости мест по сеансам, строятся из бронирований и удержаний
+    при первом обращении и обновляются при создании/удалении бронирования
+    или удержания.
+    """
+
+    def __init__(self, max_size: int = SEAT_MAP_CACHE_SIZE):
+        self.max_size = max_size
+        self._maps: "OrderedDict[int, SeatMap]" = OrderedDict()
+        self._loads: Dict[int, asyncio.Future] = {}
+        # Changes made while seat map is being loaded from the database
+        self._loading: Dict[int, list] = {}
+
+    async def get(self, id_film_show: int) -> Optional[SeatMap]:
+        seat_map = self._maps.get(id_film_show)
+        if seat_map is not None:
+            self._maps.move_to_end(id_film_show)
+            return seat_map
+        if id_film_show in self._loads:
+            return await asyncio.shield(self._loads[id_film_show])
+        self._loading[id_film_show] = []
+        self._loads[id_film_show] = asyncio.ensure_future(self._load(id_film_show))
+        try:
+            return await asyncio.shield(self._loads[id_film_show])
+        finally:
+            self._loads.pop(id_film_show, None)
+
+    async def _load(self, id_film_show: int) -> Optional[SeatMap]:
+        try:
+            hall = await storage.halls.get_by_film_show(id_film_show)
+            if not hall:
+                return None
+            seat_map = SeatMap(hall.id, hall.rows, hall.places_in_row)
+            places = await storage.bookings.places(id_film_show)
+            # Places on hold are not available too
+            places += await storage.seat_holds.places(id_film_show, datetime.now())
+        finally:
+            changes = self._loading.pop(id_film_show)
+        for row, place in places:
+            seat_map.take(row, place)
+        for taken, row, place in changes:
+            (seat_map.take if taken else seat_map.release)(row, place)
+        self._maps[id_film_show] = seat_map
+        if len(self._maps) > self.max_size:
+            self._maps.popitem(last=False)
+        return seat_map
+
+    def _apply(self, id_film_show: int, taken: bool, row: int, place: int):
+        if id_film_show in self._loading:
+            self._loading[id_film_show].append((taken, row, place))
+        seat_map = self._maps.get(id_film_show)
+        if seat_map is not None:
+            (seat_map.take if taken else seat_map.release)(row, place)
+
+    def take(self, id_film_show: int, row: int, place: int):
+        self._apply(id_film_show, True, row, place)
+
+    def release(self, id_film_show: int, row: int, place: int):
+        self._apply(id_film_show, False, row, place)
+
+    def invalidate(self, id_film_show: int):
+        self._maps.pop(id_film_show, None)
+
+    def clear(self):
+        self._maps.clear()
+
+    def invalidate_hall(self, id_hall: int):
+        for id_film_show in [
+            key for key, seat_map in self._maps.items() if seat_map.id_hall == id_hall
+        ]:
+            del self._maps[id_film_show]
+
+
+seat_maps = SeatMapRegistry()
@@ -5,3 +5,77 @@ DB_PASSWORD = os.getenv("DB_PASSWORD", "cinema")
 DB_NAME = os.getenv("DB_NAME", "tickets")
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = os.getenv("DB_PORT", "5432")
+
+# asyncpg connection pool, timeouts in seconds, 0 - no command timeout
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "10"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_MAX_QUERIES = int(os.getenv("DB_POOL_MAX_QUERIES", "50000"))
+DB_POOL_MAX_INACTIVE_CONNECTION_LIFETIME = float(
+    os.getenv("DB_POOL_MAX_INACTIVE_CONNECTION_LIFETIME", "300")
+)
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "0")) or None
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+SEAT_MAP_CACHE_SIZE = int(os.getenv("SEAT_MAP_CACHE_SIZE", "10000"))
+
+# Seat hold lifetime and expired holds sweeper settings, in seconds
+SEAT_HOLD_TTL = int(os.getenv("SEAT_HOLD_TTL", "600"))
+SEAT_HOLD_SWEEP_INTERVAL = float(os.getenv("SEAT_HOLD_SWEEP_INTERVAL", "5"))
+SEAT_HOLD_SWEEP_BATCH = int(os.getenv("SEAT_HOLD_SWEEP_BATCH", "1000"))
+
+FILM_SHOW_BULK_MAX_SIZE = int(os.getenv("FILM_SHOW_BULK_MAX_SIZE", "5000"))
+
+# Places in one batch booking or seat hold request
+BOOKING_MAX_PLACES = int(os.getenv("BOOKING_MAX_PLACES", "100"))
+
+# List endpoints page size
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "100"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "1000"))
+
+# Rows per chunk of streaming export response
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+# Film, cinema and cinema hall read-through cache, TTL in seconds
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "10000"))
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "60"))
+
+# Seat changes push: coalescing window, events queued per client and
+# keepalive interval of the event stream, in seconds
+SEAT_EVENTS_WINDOW = float(os.getenv("SEAT_EVENTS_WINDOW", "0.05"))
+SEAT_EVENTS_QUEUE_SIZE = int(os.getenv("SEAT_EVENTS_QUEUE_SIZE", "100"))
+SEAT_EVENTS_KEEPALIVE = float(os.getenv("SEAT_EVENTS_KEEPALIVE", "15"))
+SEAT_EVENTS_RECONNECT_INTERVAL = float(os.getenv("SEAT_EVENTS_RECONNECT_INTERVAL", "1"))
+
+# Idempotency-Key responses lifetime and expired keys sweep, in seconds
+IDEMPOTENCY_KEY_TTL = float(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_SWEEP_INTERVAL = float(os.getenv("IDEMPOTENCY_SWEEP_INTERVAL", "60"))
+# In-progress key lease, after it a retry takes over the key of a crashed
+# worker. Longer than any request has to run, in seconds
+IDEMPOTENCY_LEASE = float(os.getenv("IDEMPOTENCY_LEASE", "60"))
+
+# Admission control of booking requests per film show: concurrent requests,
+# queue length, longest expected wait and initial request duration estimate
+ADMISSION_CONCURRENCY = int(os.getenv("ADMISSION_CONCURRENCY", "4"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "100"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "5"))
+ADMISSION_SERVICE_TIME = float(os.getenv("ADMISSION_SERVICE_TIME", "0.05"))
+
+# Storage of cinemas, films, film shows and bookings: postgres or memory
+# (in-process, for tests and benchmarks of the HTTP layer alone)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "postgres")
+
+# List endpoints encode rows with orjson directly, 0 - through Pydantic models
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "1") == "1"
+
+# Conditional GET of catalog and schedule lists, in seconds: Cache-Control
+# max-age for clients and proxies, lifetime of ETag and Last-Modified of a
+# worker - versions are counted per process, other workers' changes are
+# seen after it
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "5"))
+ETAG_TTL = int(os.getenv("ETAG_TTL", "60"))
+
+# Identical concurrent list reads share one query, finished results are
+# also reused for this many seconds, 0 - only in-flight reads are shared
+SINGLE_FLIGHT_WINDOW = float(os.getenv("SINGLE_FLIGHT_WINDOW", "0"))
+SINGLE_FLIGHT_CACHE_SIZE = int(os.getenv("SINGLE_FLIGHT_CACHE_SIZE", "1000"))
@@ -0,0 +1,91 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable
+
+from src.fast_json import RowEncoder
+from src.pagination import NEXT_CURSOR_HEADER, Page
+from src.settings import SINGLE_FLIGHT_CACHE_SIZE, SINGLE_FLIGHT_WINDOW
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных чтений: первый запрос с ключом
+    выполняет загрузку, остальные ждут ее результат. Готовый результат
+    используется еще window секунд. Считает загрузки (leader), запросы,
+    дождавшиеся чужой загрузки (shared), и ответы из окна (cached).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: float = SINGLE_FLIGHT_WINDOW,
+        max_size: int = SINGLE_FLIGHT_CACHE_SIZE,
+    ):
+        self.name = name
+        self.window = window
+        self.max_size = max_size
+        self.leader = 0
+        self.shared = 0
+        self.cached = 0
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self._results: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    async def run(self, key: Hashable, load: Callable[[], Awaitable]):
+        item = self._results.get(key)
+        if item is not None:
+            expires_at, value = item
+            if expires_at > time.monotonic():
+                self.cached += 1
+                return value
+            del self._results[key]
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.shared += 1
+            return await asyncio.shield(flight)
+        self.leader += 1
+        # Cancelled leader does not cancel the load its followers wait for
+        flight = self._flights[key] = asyncio.ensure_future(load())
+        flight.add_done_callback(lambda _: self._flights.pop(key, None))
+        value = await asyncio.shield(flight)
+        if self.window > 0:
+            self._results[key] = (time.monotonic() + self.window, value)
+            if len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._results.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"leader": self.leader, "shared": self.shared, "cached": self.cached}
+
+
+async def shared_page(
+    flight: SingleFlight,
+    key: tuple,
+    page: Page,
+    encoder: RowEncoder,
+    load: Callable[[], Awaitable[list]],
+):
+    """
+    Страница списка, общая для одинаковых одновременных запросов: одна
+    загрузка и одна сериализация. key - разобранные параметры запроса,
+    к нему добавляются страница и ETag (версии данных), так изменение
+    в этом процессе не отдает старый результат.
+    """
+    key = key + (page.after_id, page.limit, page.response.headers.get("etag"))
+
+    async def load_page():
+        rows = page.items(await load())
+        return encoder.prepare(rows), page.response.headers.get(NEXT_CURSOR_HEADER)
+
+    content, cursor = await flight.run(key, load_page)
+    if cursor is not None:
+        page.response.headers[NEXT_CURSOR_HEADER] = cursor
+    return encoder.respond(content, page.response)
+
+
+film_show_flight = SingleFlight("film_show")
+
+flights = [film_show_flight]
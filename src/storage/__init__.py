@@ -0,0 +1,51 @@
+from src.settings import STORAGE_BACKEND
+from src.storage.base import (
+    BOOKING_EXPORT_FIELDS,
+    FILM_SHOW_EXPORT_FIELDS,
+    FilmShowGoneError,
+    FilmShowNotFoundError,
+    Place,
+    PlaceOutOfHallError,
+    PlacesBusyError,
+    PlacesHeldError,
+    ShowTimeBusyError,
+    Storage,
+    StorageError,
+)
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    # Backends are imported on demand, the memory one needs no Postgres
+    if backend == "postgres":
+        from src.storage.gino import GinoStorage
+
+        return GinoStorage()
+    if backend == "memory":
+        from src.storage.memory import MemoryStorage
+
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage backend {backend}")
+
+
+class StorageProxy:
+    """
+    Активное хранилище, через него работают роутеры. Создается по
+    STORAGE_BACKEND при первом обращении, заменяется set_storage.
+    """
+
+    def __init__(self):
+        self._storage = None
+
+    def __getattr__(self, name):
+        if self._storage is None:
+            self._storage = create_storage()
+        return getattr(self._storage, name)
+
+
+storage = StorageProxy()
+
+
+def set_storage(new_storage: Storage) -> Storage:
+    """Заменяет активное хранилище, возвращает предыдущее"""
+    previous, storage._storage = storage._storage, new_storage
+    return previous
@@ -0,0 +1,363 @@
+import abc
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.db import Booking, Cinema, CinemaHall, Film, FilmShow, IdempotencyKey
+
+# (row, place)
+Place = Tuple[int, int]
+
+FILM_SHOW_EXPORT_FIELDS = [
+    "id",
+    "show_date",
+    "start_time",
+    "end_time",
+    "id_hall",
+    "id_film",
+]
+BOOKING_EXPORT_FIELDS = ["id", "id_film_show", "row", "place"]
+
+
+class StorageError(Exception):
+    pass
+
+
+class PlacesBusyError(StorageError):
+    """Места уже забронированы, places - какие именно (если известно)"""
+
+    def __init__(self, places: Iterable[Place] = ()):
+        self.places = list(places)
+        super().__init__(self.places)
+
+
+class PlacesHeldError(StorageError):
+    """Места удерживаются другим покупателем"""
+
+    def __init__(self, places: Iterable[Place] = ()):
+        self.places = list(places)
+        super().__init__(self.places)
+
+
+class ShowTimeBusyError(StorageError):
+    """Сеанс пересекается с другим сеансом в том же зале"""
+
+
+class FilmShowNotFoundError(StorageError):
+    """Сеанса нет"""
+
+
+class FilmShowGoneError(StorageError):
+    """Сеанс уже начался"""
+
+
+class PlaceOutOfHallError(StorageError):
+    """Рядов или мест нет в зале сеанса, places - какие именно"""
+
+    def __init__(self, places: Iterable[Place] = ()):
+        self.places = list(places)
+        super().__init__(self.places)
+
+
+class CinemaRepository(abc.ABC):
+    @abc.abstractmethod
+    async def list(
+        self, city: str = None, after_id: int = None, limit: int = None
+    ) -> List[Cinema]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get(self, id_cinema: int) -> Optional[Cinema]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def create(self, name: str, city: str) -> Cinema:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def update(self, id_cinema: int, **values) -> Optional[Cinema]:
+        raise NotImplementedError
+
+
+class CinemaHallRepository(abc.ABC):
+    @abc.abstractmethod
+    async def list(
+        self, id_cinema: int = None, after_id: int = None, limit: int = None
+    ) -> List[CinemaHall]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get(self, id_hall: int) -> Optional[CinemaHall]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get_by_film_show(self, id_film_show: int) -> Optional[CinemaHall]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def existing(self, ids: Iterable[int]) -> Set[int]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def create(
+        self, id_cinema: int, name: str, rows: int, places_in_row: int
+    ) -> CinemaHall:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def update(self, id_hall: int, **values) -> Optional[CinemaHall]:
+        """Изменение размеров зала меняет и вместимость его сеансов"""
+        raise NotImplementedError
+
+
+class FilmRepository(abc.ABC):
+    @abc.abstractmethod
+    async def list(
+        self, genre: str = None, after_id: int = None, limit: int = None
+    ) -> List[Film]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get(self, id_film: int) -> Optional[Film]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def durations(self, ids: Iterable[int]) -> Dict[int, int]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def create(self, **values) -> Film:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def update(self, id_film: int, **values) -> Optional[Film]:
+        raise NotImplementedError
+
+
+class FilmShowRepository(abc.ABC):
+    @abc.abstractmethod
+    async def list(
+        self,
+        start_from: datetime = None,
+        end_before: datetime = None,
+        id_hall: int = None,
+        id_film: int = None,
+        after_id: int = None,
+        limit: int = None,
+    ) -> List[FilmShow]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get(self, id_film_show: int) -> Optional[FilmShow]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def has_conflict(
+        self, id_hall: int, start_time: datetime, end_time: datetime
+    ) -> bool:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def overlapping(
+        self, id_halls: Iterable[int], start_time: datetime, end_time: datetime
+    ) -> List[Tuple[int, datetime, datetime]]:
+        """(зал, начало, конец) сеансов залов, пересекающих интервал"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def create(self, **values) -> FilmShow:
+        """Вызывает ShowTimeBusyError при пересечении с другим сеансом зала"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def create_many(self, shows: List[dict]) -> List[FilmShow]:
+        """Все сеансы создаются или ни одного (ShowTimeBusyError)"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def delete(self, id_film_show: int) -> Optional[FilmShow]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def schedule(
+        self, id_cinema: int, show_date: date
+    ) -> List[Tuple[Cinema, Optional[CinemaHall], Optional[FilmShow], Optional[Film]]]:
+        """
+        Кинотеатр, его залы, сеансы залов на дату и фильмы сеансов строками
+        внешнего соединения по залу и времени начала, пусто - кинотеатра нет
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def export(
+        self, start_date: date = None, end_date: date = None, id_cinema: int = None
+    ) -> AsyncIterator[tuple]:
+        """Строки FILM_SHOW_EXPORT_FIELDS по id"""
+        raise NotImplementedError
+
+
+class BookingRepository(abc.ABC):
+    @abc.abstractmethod
+    async def list(
+        self, id_film_show: int = None, after_id: int = None, limit: int = None
+    ) -> List[Booking]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get(self, id_booking: int) -> Optional[Booking]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def places(self, id_film_show: int) -> List[Place]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def create(self, id_film_show: int, row: int, place: int) -> Booking:
+        """Вызывает PlacesBusyError, если место уже забронировано"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def book(
+        self, id_film_show: int, row: int, place: int, now: datetime
+    ) -> Tuple[Booking, int]:
+        """
+        Бронирует место с проверками сеанса и зала, возвращает бронь и
+        зал сеанса. Ошибки проверяются по порядку: FilmShowNotFoundError,
+        FilmShowGoneError, PlaceOutOfHallError, PlacesHeldError,
+        PlacesBusyError
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def create_many(
+        self, id_film_show: int, places: List[Place], held_at: datetime = None
+    ) -> List[Booking]:
+        """
+        Все места бронируются или ни одного: PlacesBusyError с уже
+        забронированными местами, PlaceOutOfHallError с местами вне зала
+        сеанса или, если задан held_at, PlacesHeldError с местами,
+        удерживаемыми в этот момент
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def delete(self, id_booking: int) -> Optional[Tuple[Booking, int]]:
+        """Удаленная бронь и зал ее сеанса"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def export(
+        self, start_date: date = None, end_date: date = None, id_cinema: int = None
+    ) -> AsyncIterator[tuple]:
+        """Строки BOOKING_EXPORT_FIELDS по id, фильтры - по сеансу"""
+        raise NotImplementedError
+
+
+class SeatHoldRepository(abc.ABC):
+    @abc.abstractmethod
+    async def held(
+        self, id_film_show: int, places: List[Place], now: datetime
+    ) -> List[Place]:
+        """Места из places, удерживаемые в момент now"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def places(self, id_film_show: int, now: datetime) -> List[Place]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def create(
+        self,
+        token: str,
+        id_film_show: int,
+        places: List[Place],
+        expires_at: datetime,
+        now: datetime,
+    ):
+        """
+        Удерживает все места или ни одного: PlacesBusyError с забронированными
+        местами, PlaceOutOfHallError с местами вне зала сеанса, PlacesHeldError
+        с местами, которые удерживает другой токен.
+        Просроченные удержания перехватываются.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def confirm(
+        self, token: str, now: datetime
+    ) -> Tuple[List[Booking], Set[int]]:
+        """
+        Бронирует места действующего удержания и удаляет его, возвращает
+        брони и залы их сеансов. Пустой список - удержания нет;
+        FilmShowGoneError - сеанс уже начался;
+        PlacesBusyError - место уже забронировано
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def delete(self, token: str) -> List[Tuple[int, int, int]]:
+        """(сеанс, ряд, место) освобожденных мест"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def sweep(self, now: datetime, limit: int) -> List[Tuple[int, int, int]]:
+        """Удаляет не больше limit просроченных удержаний"""
+        raise NotImplementedError
+
+
+class IdempotencyKeyRepository(abc.ABC):
+    @abc.abstractmethod
+    async def claim(
+        self,
+        endpoint: str,
+        key: str,
+        fingerprint: str,
+        created_at: datetime,
+        lease_before: datetime,
+    ) -> Optional[IdempotencyKey]:
+        """
+        Занимает ключ для нового запроса - возвращает None, или возвращает
+        существующую запись (выполняющийся или завершенный запрос).
+        Выполняющийся запрос, занявший ключ раньше lease_before, считается
+        потерянным, ключ занимается заново
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def save(
+        self,
+        endpoint: str,
+        key: str,
+        status_code: int,
+        content_type: str,
+        response: bytes,
+    ):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def release(self, endpoint: str, key: str):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def sweep(self, created_before: datetime) -> int:
+        raise NotImplementedError
+
+
+class Storage:
+    """Хранилище данных сервиса - набор репозиториев"""
+
+    cinemas: CinemaRepository
+    halls: CinemaHallRepository
+    films: FilmRepository
+    film_shows: FilmShowRepository
+    bookings: BookingRepository
+    seat_holds: SeatHoldRepository
+    idempotency_keys: IdempotencyKeyRepository
+
+    async def init(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def listen_seat_changes(self):
+        """Доставка изменений мест из других процессов в seat_maps и seat_channels"""
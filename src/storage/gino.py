@@ -0,0 +1,707 @@
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Set
+
+from asyncpg.exceptions import ExclusionViolationError, UniqueViolationError
+from sqlalchemy import and_, between, cast, exists, func, not_, true, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from src.db import (
+    db,
+    Booking,
+    Cinema,
+    CinemaHall,
+    Film,
+    FilmShow,
+    IdempotencyKey,
+    SeatHold,
+    init_db,
+    close_db,
+)
+from src.metrics import install_query_hook
+from src.seat_events import run_seat_listener
+from src.storage.base import (
+    BookingRepository,
+    CinemaHallRepository,
+    CinemaRepository,
+    FilmRepository,
+    FilmShowGoneError,
+    FilmShowNotFoundError,
+    FilmShowRepository,
+    IdempotencyKeyRepository,
+    Place,
+    PlaceOutOfHallError,
+    PlacesBusyError,
+    PlacesHeldError,
+    SeatHoldRepository,
+    ShowTimeBusyError,
+    Storage,
+)
+
+
+def paginate(query, model, after_id: int = None, limit: int = None):
+    if after_id is not None:
+        query = query.where(model.id > after_id)
+    query = query.order_by(model.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+async def iterate_rows(query) -> AsyncIterator[tuple]:
+    # Server-side cursor, rows are fetched from Postgres by small portions
+    async with db.acquire() as conn:
+        async with conn.transaction():
+            async for row in conn.iterate(query):
+                yield tuple(row)
+
+
+def show_time_conflict(id_hall, start_time, end_time):
+    # Same expressions as in film_show_excl_hall_time to use its GiST index
+    return and_(
+        func.int4range(FilmShow.id_hall, FilmShow.id_hall, "[]").op("&&")(
+            func.int4range(id_hall, id_hall, "[]")
+        ),
+        func.tsrange(FilmShow.start_time, FilmShow.end_time, "[]").op("&&")(
+            func.tsrange(start_time, end_time, "[]")
+        ),
+    )
+
+
+def update_returning(model, id_value: int, values: dict):
+    # UPDATE ... RETURNING, no SELECT before it
+    return (
+        model.update.values(**values)
+        .where(model.id == id_value)
+        .returning(*model.__table__.columns)
+        .gino.first()
+    )
+
+
+def delete_returning(model, id_value: int):
+    return (
+        model.delete.where(model.id == id_value)
+        .returning(*model.__table__.columns)
+        .gino.first()
+    )
+
+
+def labeled_columns(model, prefix: str):
+    return [column.label(prefix + column.name) for column in model.__table__.columns]
+
+
+def labeled_model(model, prefix: str, row):
+    if row[prefix + "id"] is None:
+        return None
+    values = {
+        column.name: row[prefix + column.name] for column in model.__table__.columns
+    }
+    return model(**values)
+
+
+async def held_places(id_film_show: int, places: List[Place], now: datetime):
+    held = (
+        await db.select([SeatHold.row, SeatHold.place])
+        .where(
+            and_(
+                SeatHold.id_film_show == id_film_show,
+                tuple_(SeatHold.row, SeatHold.place).in_(places),
+                SeatHold.expires_at > now,
+            )
+        )
+        .gino.all()
+    )
+    return [tuple(place) for place in held]
+
+
+def in_hall(row, place):
+    return and_(
+        between(row, 1, CinemaHall.rows), between(place, 1, CinemaHall.places_in_row)
+    )
+
+
+def hall_places(id_film_show: int, places: List[Place], *columns):
+    # Places as rows of unnest(), only those inside the film show hall
+    row_list, place_list = zip(*places)
+    rows = db.select(
+        [
+            func.unnest(cast(list(row_list), ARRAY(db.Integer))).label("row"),
+            func.unnest(cast(list(place_list), ARRAY(db.Integer))).label("place"),
+        ]
+    ).alias("places")
+    return (
+        db.select(list(columns) + [FilmShow.id, rows.c.row, rows.c.place])
+        .select_from(
+            rows.join(FilmShow, FilmShow.id == id_film_show).join(
+                CinemaHall, FilmShow.id_hall == CinemaHall.id
+            )
+        )
+        .where(in_hall(rows.c.row, rows.c.place))
+    )
+
+
+async def outside_hall(id_film_show: int, places: List[Place]) -> List[Place]:
+    cinema_hall = await GinoCinemaHallRepository().get_by_film_show(id_film_show)
+    return [
+        (row, place)
+        for row, place in places
+        if not (
+            cinema_hall
+            and 1 <= row <= cinema_hall.rows
+            and 1 <= place <= cinema_hall.places_in_row
+        )
+    ]
+
+
+async def booked_places(id_film_show: int, places: List[Place]):
+    busy = (
+        await db.select([Booking.row, Booking.place])
+        .where(
+            and_(
+                Booking.id_film_show == id_film_show,
+                tuple_(Booking.row, Booking.place).in_(places),
+            )
+        )
+        .gino.all()
+    )
+    return [tuple(place) for place in busy]
+
+
+class GinoCinemaRepository(CinemaRepository):
+    async def list(self, city=None, after_id=None, limit=None):
+        query = Cinema.query
+        if city is not None:
+            query = query.where(Cinema.city == city)
+        return await paginate(query, Cinema, after_id, limit).gino.all()
+
+    async def get(self, id_cinema):
+        return await Cinema.query.where(Cinema.id == id_cinema).gino.first()
+
+    async def create(self, name, city):
+        return await Cinema.create(name=name, city=city)
+
+    async def update(self, id_cinema, **values):
+        if not values:
+            return await self.get(id_cinema)
+        return await update_returning(Cinema, id_cinema, values)
+
+
+class GinoCinemaHallRepository(CinemaHallRepository):
+    async def list(self, id_cinema=None, after_id=None, limit=None):
+        query = CinemaHall.query
+        if id_cinema is not None:
+            query = query.where(CinemaHall.id_cinema == id_cinema)
+        return await paginate(query, CinemaHall, after_id, limit).gino.all()
+
+    async def get(self, id_hall):
+        return await CinemaHall.query.where(CinemaHall.id == id_hall).gino.first()
+
+    async def get_by_film_show(self, id_film_show):
+        return (
+            await CinemaHall.query.select_from(
+                FilmShow.join(CinemaHall, FilmShow.id_hall == CinemaHall.id)
+            )
+            .where(FilmShow.id == id_film_show)
+            .gino.first()
+        )
+
+    async def existing(self, ids) -> Set[int]:
+        rows = await db.select([CinemaHall.id]).where(CinemaHall.id.in_(ids)).gino.all()
+        return {id_hall for id_hall, in rows}
+
+    async def create(self, id_cinema, name, rows, places_in_row):
+        return await CinemaHall.create(
+            id_cinema=id_cinema, name=name, rows=rows, places_in_row=places_in_row
+        )
+
+    async def update(self, id_hall, **values):
+        # Capacity of the hall film shows is updated by a trigger
+        if not values:
+            return await self.get(id_hall)
+        return await update_returning(CinemaHall, id_hall, values)
+
+
+class GinoFilmRepository(FilmRepository):
+    async def list(self, genre=None, after_id=None, limit=None):
+        query = Film.query
+        if genre is not None:
+            query = query.where(Film.genre == genre)
+        return await paginate(query, Film, after_id, limit).gino.all()
+
+    async def get(self, id_film):
+        return await Film.query.where(Film.id == id_film).gino.first()
+
+    async def durations(self, ids) -> Dict[int, int]:
+        return dict(
+            await db.select([Film.id, Film.duration]).where(Film.id.in_(ids)).gino.all()
+        )
+
+    async def create(self, **values):
+        return await Film.create(**values)
+
+    async def update(self, id_film, **values):
+        if not values:
+            return await self.get(id_film)
+        return await update_returning(Film, id_film, values)
+
+
+class GinoFilmShowRepository(FilmShowRepository):
+    async def list(
+        self,
+        start_from=None,
+        end_before=None,
+        id_hall=None,
+        id_film=None,
+        after_id=None,
+        limit=None,
+    ):
+        query = FilmShow.query
+        if start_from:
+            query = query.where(FilmShow.start_time >= start_from)
+        if end_before:
+            query = query.where(FilmShow.end_time < end_before)
+        if id_hall is not None:
+            query = query.where(FilmShow.id_hall == id_hall)
+        if id_film is not None:
+            query = query.where(FilmShow.id_film == id_film)
+        return await paginate(query, FilmShow, after_id, limit).gino.all()
+
+    async def get(self, id_film_show):
+        return await FilmShow.query.where(FilmShow.id == id_film_show).gino.first()
+
+    async def has_conflict(self, id_hall, start_time, end_time):
+        film_show = await FilmShow.query.where(
+            show_time_conflict(id_hall, start_time, end_time)
+        ).gino.first()
+        return film_show is not None
+
+    async def overlapping(self, id_halls, start_time, end_time):
+        rows = (
+            await db.select([FilmShow.id_hall, FilmShow.start_time, FilmShow.end_time])
+            .where(
+                and_(
+                    FilmShow.id_hall.in_(id_halls),
+                    func.tsrange(FilmShow.start_time, FilmShow.end_time, "[]").op("&&")(
+                        func.tsrange(start_time, end_time, "[]")
+                    ),
+                )
+            )
+            .gino.all()
+        )
+        return [tuple(row) for row in rows]
+
+    async def create(self, **values):
+        try:
+            return await FilmShow.create(**values)
+        except ExclusionViolationError:
+            raise ShowTimeBusyError()
+
+    async def create_many(self, shows):
+        # One multi-row insert is atomic without an explicit transaction
+        try:
+            return await db.all(
+                FilmShow.insert().values(shows).returning(*FilmShow.__table__.columns)
+            )
+        except ExclusionViolationError:
+            raise ShowTimeBusyError()
+
+    async def delete(self, id_film_show):
+        return await delete_returning(FilmShow, id_film_show)
+
+    async def schedule(self, id_cinema, show_date):
+        # One query with joins instead of queries per hall and film
+        rows = (
+            await db.select(
+                labeled_columns(Cinema, "cinema_")
+                + labeled_columns(CinemaHall, "hall_")
+                + labeled_columns(FilmShow, "film_show_")
+                + labeled_columns(Film, "film_")
+            )
+            .select_from(
+                Cinema.outerjoin(CinemaHall, CinemaHall.id_cinema == Cinema.id)
+                .outerjoin(
+                    FilmShow,
+                    and_(
+                        FilmShow.id_hall == CinemaHall.id,
+                        FilmShow.show_date == show_date,
+                    ),
+                )
+                .outerjoin(Film, Film.id == FilmShow.id_film)
+            )
+            .where(Cinema.id == id_cinema)
+            .order_by(CinemaHall.id, FilmShow.start_time)
+            .gino.all()
+        )
+        return [
+            (
+                labeled_model(Cinema, "cinema_", row),
+                labeled_model(CinemaHall, "hall_", row),
+                labeled_model(FilmShow, "film_show_", row),
+                labeled_model(Film, "film_", row),
+            )
+            for row in rows
+        ]
+
+    def export(self, start_date=None, end_date=None, id_cinema=None):
+        query = db.select(
+            [
+                FilmShow.id,
+                FilmShow.show_date,
+                FilmShow.start_time,
+                FilmShow.end_time,
+                FilmShow.id_hall,
+                FilmShow.id_film,
+            ]
+        )
+        if id_cinema:
+            query = query.select_from(
+                FilmShow.join(CinemaHall, FilmShow.id_hall == CinemaHall.id)
+            ).where(CinemaHall.id_cinema == id_cinema)
+        if start_date:
+            query = query.where(FilmShow.show_date >= start_date)
+        if end_date:
+            query = query.where(FilmShow.show_date <= end_date)
+        return iterate_rows(query.order_by(FilmShow.id))
+
+
+class GinoBookingRepository(BookingRepository):
+    async def list(self, id_film_show=None, after_id=None, limit=None):
+        query = Booking.query
+        if id_film_show is not None:
+            query = query.where(Booking.id_film_show == id_film_show)
+        return await paginate(query, Booking, after_id, limit).gino.all()
+
+    async def get(self, id_booking):
+        return await Booking.query.where(Booking.id == id_booking).gino.first()
+
+    async def places(self, id_film_show):
+        places = (
+            await db.select([Booking.row, Booking.place])
+            .where(Booking.id_film_show == id_film_show)
+            .gino.all()
+        )
+        return [tuple(place) for place in places]
+
+    async def create(self, id_film_show, row, place):
+        try:
+            return await Booking.create(id_film_show=id_film_show, row=row, place=place)
+        except UniqueViolationError:
+            raise PlacesBusyError([(row, place)])
+
+    async def book(self, id_film_show, row, place, now):
+        # Checks and the insert are one statement, one round trip
+        row_value, place_value = cast(row, db.Integer), cast(place, db.Integer)
+        show = (
+            db.select(
+                [
+                    FilmShow.id,
+                    FilmShow.id_hall,
+                    (FilmShow.start_time > now).label("upcoming"),
+                    in_hall(row_value, place_value).label("in_hall"),
+                    exists()
+                    .where(
+                        and_(
+                            SeatHold.id_film_show == FilmShow.id,
+                            SeatHold.row == row_value,
+                            SeatHold.place == place_value,
+                            SeatHold.expires_at > now,
+                        )
+                    )
+                    .label("held"),
+                ]
+            )
+            .select_from(FilmShow.join(CinemaHall, FilmShow.id_hall == CinemaHall.id))
+            .where(FilmShow.id == id_film_show)
+            .cte("show")
+        )
+        inserted = (
+            insert(Booking)
+            .from_select(
+                ["id_film_show", "row", "place"],
+                db.select([show.c.id, row_value, place_value]).where(
+                    and_(show.c.upcoming, show.c.in_hall, not_(show.c.held))
+                ),
+            )
+            .on_conflict_do_nothing(
+                index_elements=[Booking.id_film_show, Booking.row, Booking.place]
+            )
+            .returning(*Booking.__table__.columns)
+            .cte("inserted")
+        )
+        result = await db.first(
+            db.select(
+                [show.c.id_hall, show.c.upcoming, show.c.in_hall, show.c.held]
+                + [column.label("booking_" + column.name) for column in inserted.c]
+            ).select_from(show.outerjoin(inserted, true()))
+        )
+        if result is None:
+            raise FilmShowNotFoundError()
+        if not result["upcoming"]:
+            raise FilmShowGoneError()
+        if not result["in_hall"]:
+            raise PlaceOutOfHallError([(row, place)])
+        if result["held"]:
+            raise PlacesHeldError([(row, place)])
+        booking = labeled_model(Booking, "booking_", result)
+        if booking is None:
+            raise PlacesBusyError([(row, place)])
+        return booking, result["id_hall"]
+
+    async def create_many(self, id_film_show, places, held_at=None):
+        held = []
+        try:
+            # All places are booked by one multi-row insert or none of them,
+            # places outside the hall are not inserted and roll it back
+            async with db.transaction() as tx:
+                if held_at is not None:
+                    held = await held_places(id_film_show, places, held_at)
+                    if held:
+                        tx.raise_rollback()
+                booking_list = await db.all(
+                    Booking.insert()
+                    .from_select(
+                        ["id_film_show", "row", "place"],
+                        hall_places(id_film_show, places),
+                    )
+                    .returning(*Booking.__table__.columns)
+                )
+                if len(booking_list) < len(places):
+                    tx.raise_rollback()
+        except UniqueViolationError:
+            raise PlacesBusyError(await booked_places(id_film_show, places))
+        if held:
+            raise PlacesHeldError(held)
+        if len(booking_list) < len(places):
+            raise PlaceOutOfHallError(await outside_hall(id_film_show, places))
+        return booking_list
+
+    async def delete(self, id_booking):
+        # Hall of the film show comes from the same statement, DELETE ... USING
+        deleted = await db.first(
+            Booking.__table__.delete()
+            .where(and_(Booking.id == id_booking, FilmShow.id == Booking.id_film_show))
+            .returning(*Booking.__table__.columns, FilmShow.id_hall)
+        )
+        if deleted is None:
+            return None
+        booking = Booking(
+            **{
+                column.name: deleted[column.name]
+                for column in Booking.__table__.columns
+            }
+        )
+        return booking, deleted["id_hall"]
+
+    def export(self, start_date=None, end_date=None, id_cinema=None):
+        query = db.select(
+            [Booking.id, Booking.id_film_show, Booking.row, Booking.place]
+        )
+        if start_date or end_date or id_cinema:
+            join = Booking.join(FilmShow, Booking.id_film_show == FilmShow.id)
+            if id_cinema:
+                join = join.join(CinemaHall, FilmShow.id_hall == CinemaHall.id)
+                query = query.where(CinemaHall.id_cinema == id_cinema)
+            query = query.select_from(join)
+        if start_date:
+            query = query.where(FilmShow.show_date >= start_date)
+        if end_date:
+            query = query.where(FilmShow.show_date <= end_date)
+        return iterate_rows(query.order_by(Booking.id))
+
+
+class GinoSeatHoldRepository(SeatHoldRepository):
+    async def held(self, id_film_show, places, now):
+        return await held_places(id_film_show, places, now)
+
+    async def places(self, id_film_show, now):
+        places = (
+            await db.select([SeatHold.row, SeatHold.place])
+            .where(
+                and_(SeatHold.id_film_show == id_film_show, SeatHold.expires_at > now)
+            )
+            .gino.all()
+        )
+        return [tuple(place) for place in places]
+
+    async def create(self, token, id_film_show, places, expires_at, now):
+        async with db.transaction() as tx:
+            busy = await booked_places(id_film_show, places)
+            if busy:
+                tx.raise_rollback()
+            # Hold expired but not yet swept places are taken over, places
+            # outside the hall are not inserted
+            statement = insert(SeatHold).from_select(
+                ["token", "expires_at", "id_film_show", "row", "place"],
+                hall_places(
+                    id_film_show,
+                    places,
+                    cast(token, SeatHold.token.type),
+                    cast(expires_at, SeatHold.expires_at.type),
+                ),
+            )
+            statement = statement.on_conflict_do_update(
+                index_elements=[SeatHold.id_film_show, SeatHold.row, SeatHold.place],
+                set_=dict(
+                    token=statement.excluded.token,
+                    expires_at=statement.excluded.expires_at,
+                ),
+                where=SeatHold.expires_at <= now,
+            ).returning(SeatHold.row, SeatHold.place)
+            held = {tuple(place) for place in await db.all(statement)}
+            if len(held) < len(places):
+                tx.raise_rollback()
+        if busy:
+            raise PlacesBusyError(busy)
+        if len(held) < len(places):
+            outside = await outside_hall(id_film_show, places)
+            if outside:
+                raise PlaceOutOfHallError(outside)
+            raise PlacesHeldError(place for place in places if place not in held)
+
+    async def confirm(self, token, now):
+        try:
+            async with db.transaction() as tx:
+                held = await db.all(
+                    SeatHold.__table__.delete()
+                    .where(
+                        and_(
+                            SeatHold.token == token,
+                            SeatHold.expires_at > now,
+                            FilmShow.id == SeatHold.id_film_show,
+                            FilmShow.start_time > now,
+                        )
+                    )
+                    .returning(
+                        SeatHold.id_film_show,
+                        SeatHold.row,
+                        SeatHold.place,
+                        FilmShow.id_hall,
+                    )
+                )
+                if not held:
+                    # Hold is alive, its film show has already started
+                    gone = await db.scalar(
+                        exists()
+                        .where(
+                            and_(SeatHold.token == token, SeatHold.expires_at > now)
+                        )
+                        .select()
+                    )
+                    if gone:
+                        raise FilmShowGoneError()
+                    tx.raise_rollback()
+                booking_list = await db.all(
+                    Booking.insert()
+                    .values(
+                        [
+                            dict(
+                                id_film_show=hold["id_film_show"],
+                                row=hold["row"],
+                                place=hold["place"],
+                            )
+                            for hold in held
+                        ]
+                    )
+                    .returning(*Booking.__table__.columns)
+                )
+                return booking_list, {hold["id_hall"] for hold in held}
+        except UniqueViolationError:
+            raise PlacesBusyError()
+        return [], set()
+
+    async def delete(self, token):
+        released = await db.all(
+            SeatHold.delete.where(SeatHold.token == token).returning(
+                SeatHold.id_film_show, SeatHold.row, SeatHold.place
+            )
+        )
+        return [(hold.id_film_show, hold.row, hold.place) for hold in released]
+
+    async def sweep(self, now, limit):
+        # SKIP LOCKED lets several workers sweep the table at the same time
+        expired = (
+            db.select([SeatHold.id])
+            .where(SeatHold.expires_at <= now)
+            .order_by(SeatHold.expires_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        released = await db.all(
+            SeatHold.delete.where(SeatHold.id.in_(expired)).returning(
+                SeatHold.id_film_show, SeatHold.row, SeatHold.place
+            )
+        )
+        return [(hold.id_film_show, hold.row, hold.place) for hold in released]
+
+
+class GinoIdempotencyKeyRepository(IdempotencyKeyRepository):
+    async def claim(self, endpoint, key, fingerprint, created_at, lease_before):
+        statement = insert(IdempotencyKey).values(
+            endpoint=endpoint,
+            key=key,
+            fingerprint=fingerprint,
+            created_at=created_at,
+        )
+        # Lease of a lost in-progress request is over, the key is taken over
+        claimed = await db.all(
+            statement.on_conflict_do_update(
+                index_elements=[IdempotencyKey.endpoint, IdempotencyKey.key],
+                set_={
+                    "fingerprint": statement.excluded.fingerprint,
+                    "created_at": statement.excluded.created_at,
+                },
+                where=and_(
+                    IdempotencyKey.status_code.is_(None),
+                    IdempotencyKey.created_at < lease_before,
+                ),
+            ).returning(IdempotencyKey.id)
+        )
+        if claimed:
+            return None
+        return await IdempotencyKey.query.where(
+            and_(IdempotencyKey.endpoint == endpoint, IdempotencyKey.key == key)
+        ).gino.first()
+
+    async def save(self, endpoint, key, status_code, content_type, response):
+        await IdempotencyKey.update.values(
+            status_code=status_code, content_type=content_type, response=response
+        ).where(
+            and_(IdempotencyKey.endpoint == endpoint, IdempotencyKey.key == key)
+        ).gino.status()
+
+    async def release(self, endpoint, key):
+        await IdempotencyKey.delete.where(
+            and_(IdempotencyKey.endpoint == endpoint, IdempotencyKey.key == key)
+        ).gino.status()
+
+    async def sweep(self, created_before):
+        status, _ = await IdempotencyKey.delete.where(
+            IdempotencyKey.created_at < created_before
+        ).gino.status()
+        return int(status.split()[-1])
+
+
+class GinoStorage(Storage):
+    """
+    Хранилище в Postgres через Gino. pool_class и create_schema
+    передаются в init_db.
+    """
+
+    def __init__(self, pool_class=None, create_schema: bool = True):
+        self.pool_class = pool_class
+        self.create_schema = create_schema
+        self.cinemas = GinoCinemaRepository()
+        self.halls = GinoCinemaHallRepository()
+        self.films = GinoFilmRepository()
+        self.film_shows = GinoFilmShowRepository()
+        self.bookings = GinoBookingRepository()
+        self.seat_holds = GinoSeatHoldRepository()
+        self.idempotency_keys = GinoIdempotencyKeyRepository()
+
+    async def init(self):
+        await init_db(self.pool_class, self.create_schema)
+        install_query_hook()
+
+    async def close(self):
+        await close_db()
+
+    async def listen_seat_changes(self):
+        await run_seat_listener()
@@ -0,0 +1,571 @@
+import itertools
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Set, Tuple
+
+from src.db import Booking, Cinema, CinemaHall, Film, FilmShow, IdempotencyKey, SeatHold
+from src.seat_events import publish_seat_changes
+from src.storage.base import (
+    BookingRepository,
+    CinemaHallRepository,
+    CinemaRepository,
+    FilmRepository,
+    FilmShowGoneError,
+    FilmShowNotFoundError,
+    FilmShowRepository,
+    IdempotencyKeyRepository,
+    Place,
+    PlaceOutOfHallError,
+    PlacesBusyError,
+    PlacesHeldError,
+    SeatHoldRepository,
+    ShowTimeBusyError,
+    Storage,
+    StorageError,
+)
+
+
+def paginate(rows: Iterable, after_id: int = None, limit: int = None) -> list:
+    # Rows come in id order
+    if after_id is not None:
+        rows = (row for row in rows if row.id > after_id)
+    return list(itertools.islice(rows, limit))
+
+
+def overlaps(film_show: FilmShow, start_time: datetime, end_time: datetime) -> bool:
+    # Same rule as film_show_excl_hall_time, bounds are inclusive
+    return film_show.start_time <= end_time and start_time <= film_show.end_time
+
+
+class Table:
+    """Строки таблицы по id в порядке создания"""
+
+    def __init__(self):
+        self.rows: Dict[int, object] = {}
+        self._ids = itertools.count(1)
+
+    def insert(self, row):
+        row.id = next(self._ids)
+        self.rows[row.id] = row
+        return row
+
+    def get(self, id_row: int):
+        return self.rows.get(id_row)
+
+
+class MemoryData:
+    """
+    Данные хранилища в памяти процесса: таблицы и индексы по внешним
+    ключам. Операции не прерываются await, поэтому атомарны.
+    """
+
+    def __init__(self):
+        self.cinemas = Table()
+        self.halls = Table()
+        self.films = Table()
+        self.film_shows = Table()
+        self.bookings = Table()
+        self.seat_holds = Table()
+        self.halls_by_cinema: Dict[int, Dict[int, CinemaHall]] = defaultdict(dict)
+        self.film_shows_by_hall: Dict[int, Dict[int, FilmShow]] = defaultdict(dict)
+        # Unique (id_film_show, row, place) of bookings and seat holds
+        self.bookings_by_show: Dict[int, Dict[Place, Booking]] = defaultdict(dict)
+        self.holds_by_show: Dict[int, Dict[Place, SeatHold]] = defaultdict(dict)
+        self.holds_by_token: Dict[str, Set[Tuple[int, Place]]] = defaultdict(set)
+        self.idempotency_keys: Dict[Tuple[str, str], IdempotencyKey] = {}
+
+    def capacity(self, id_hall: int) -> int:
+        hall = self.halls.get(id_hall)
+        return hall.rows * hall.places_in_row if hall else 0
+
+    def outside_hall(self, id_film_show: int, places: List[Place]) -> List[Place]:
+        film_show = self.film_shows.get(id_film_show)
+        hall = film_show and self.halls.get(film_show.id_hall)
+        return [
+            (row, place)
+            for row, place in places
+            if not (hall and 1 <= row <= hall.rows and 1 <= place <= hall.places_in_row)
+        ]
+
+    def add_bookings(self, id_film_show: int, places: List[Place]) -> List[Booking]:
+        bookings = self.bookings_by_show[id_film_show]
+        booking_list = []
+        for row, place in places:
+            booking = self.bookings.insert(
+                Booking(id_film_show=id_film_show, row=row, place=place)
+            )
+            bookings[row, place] = booking
+            booking_list.append(booking)
+        film_show = self.film_shows.get(id_film_show)
+        if film_show is not None:
+            film_show.sold += len(booking_list)
+        publish_seat_changes(id_film_show, True, places)
+        return booking_list
+
+    def remove_hold(self, hold: SeatHold):
+        del self.seat_holds.rows[hold.id]
+        del self.holds_by_show[hold.id_film_show][hold.row, hold.place]
+        keys = self.holds_by_token[hold.token]
+        keys.discard((hold.id_film_show, (hold.row, hold.place)))
+        if not keys:
+            del self.holds_by_token[hold.token]
+
+
+class MemoryCinemaRepository(CinemaRepository):
+    def __init__(self, data: MemoryData):
+        self.data = data
+
+    async def list(self, city=None, after_id=None, limit=None):
+        rows = self.data.cinemas.rows.values()
+        if city is not None:
+            rows = (cinema for cinema in rows if cinema.city == city)
+        return paginate(rows, after_id, limit)
+
+    async def get(self, id_cinema):
+        return self.data.cinemas.get(id_cinema)
+
+    async def create(self, name, city):
+        return self.data.cinemas.insert(Cinema(name=name, city=city))
+
+    async def update(self, id_cinema, **values):
+        cinema = self.data.cinemas.get(id_cinema)
+        if cinema:
+            for name, value in values.items():
+                setattr(cinema, name, value)
+        return cinema
+
+
+class MemoryCinemaHallRepository(CinemaHallRepository):
+    def __init__(self, data: MemoryData):
+        self.data = data
+
+    async def list(self, id_cinema=None, after_id=None, limit=None):
+        if id_cinema is None:
+            rows = self.data.halls.rows.values()
+        else:
+            rows = self.data.halls_by_cinema.get(id_cinema, {}).values()
+        return paginate(rows, after_id, limit)
+
+    async def get(self, id_hall):
+        return self.data.halls.get(id_hall)
+
+    async def get_by_film_show(self, id_film_show):
+        film_show = self.data.film_shows.get(id_film_show)
+        return self.data.halls.get(film_show.id_hall) if film_show else None
+
+    async def existing(self, ids):
+        return {id_hall for id_hall in ids if id_hall in self.data.halls.rows}
+
+    async def create(self, id_cinema, name, rows, places_in_row):
+        cinema_hall = self.data.halls.insert(
+            CinemaHall(
+                id_cinema=id_cinema, name=name, rows=rows, places_in_row=places_in_row
+            )
+        )
+        self.data.halls_by_cinema[id_cinema][cinema_hall.id] = cinema_hall
+        return cinema_hall
+
+    async def update(self, id_hall, **values):
+        cinema_hall = self.data.halls.get(id_hall)
+        if cinema_hall:
+            for name, value in values.items():
+                setattr(cinema_hall, name, value)
+            capacity = self.data.capacity(id_hall)
+            for film_show in self.data.film_shows_by_hall.get(id_hall, {}).values():
+                film_show.capacity = capacity
+        return cinema_hall
+
+
+class MemoryFilmRepository(FilmRepository):
+    def __init__(self, data: MemoryData):
+        self.data = data
+
+    async def list(self, genre=None, after_id=None, limit=None):
+        rows = self.data.films.rows.values()
+        if genre is not None:
+            rows = (film for film in rows if film.genre == genre)
+        return paginate(rows, after_id, limit)
+
+    async def get(self, id_film):
+        return self.data.films.get(id_film)
+
+    async def durations(self, ids):
+        films = self.data.films.rows
+        return {id_film: films[id_film].duration for id_film in ids if id_film in films}
+
+    async def create(self, **values):
+        return self.data.films.insert(Film(**values))
+
+    async def update(self, id_film, **values):
+        film = self.data.films.get(id_film)
+        if film:
+            for name, value in values.items():
+                setattr(film, name, value)
+        return film
+
+
+class MemoryFilmShowRepository(FilmShowRepository):
+    def __init__(self, data: MemoryData):
+        self.data = data
+
+    async def list(
+        self,
+        start_from=None,
+        end_before=None,
+        id_hall=None,
+        id_film=None,
+        after_id=None,
+        limit=None,
+    ):
+        if id_hall is None:
+            rows = self.data.film_shows.rows.values()
+        else:
+            rows = self.data.film_shows_by_hall.get(id_hall, {}).values()
+        if start_from:
+            rows = (show for show in rows if show.start_time >= start_from)
+        if end_before:
+            rows = (show for show in rows if show.end_time < end_before)
+        if id_film is not None:
+            rows = (show for show in rows if show.id_film == id_film)
+        return paginate(rows, after_id, limit)
+
+    async def get(self, id_film_show):
+        return self.data.film_shows.get(id_film_show)
+
+    async def has_conflict(self, id_hall, start_time, end_time):
+        return any(
+            overlaps(film_show, start_time, end_time)
+            for film_show in self.data.film_shows_by_hall.get(id_hall, {}).values()
+        )
+
+    async def overlapping(self, id_halls, start_time, end_time):
+        return [
+            (film_show.id_hall, film_show.start_time, film_show.end_time)
+            for id_hall in id_halls
+            for film_show in self.data.film_shows_by_hall.get(id_hall, {}).values()
+            if overlaps(film_show, start_time, end_time)
+        ]
+
+    async def create(self, **values):
+        return (await self.create_many([values]))[0]
+
+    async def create_many(self, shows):
+        for index, values in enumerate(shows):
+            start_time, end_time = values["start_time"], values["end_time"]
+            if await self.has_conflict(values["id_hall"], start_time, end_time) or any(
+                other["id_hall"] == values["id_hall"]
+                and other["start_time"] <= end_time
+                and start_time <= other["end_time"]
+                for other in shows[:index]
+            ):
+                raise ShowTimeBusyError()
+        film_show_list = []
+        for values in shows:
+            capacity = self.data.capacity(values["id_hall"])
+            film_show = self.data.film_shows.insert(
+                FilmShow(**values, sold=0, capacity=capacity)
+            )
+            self.data.film_shows_by_hall[film_show.id_hall][film_show.id] = film_show
+            film_show_list.append(film_show)
+        return film_show_list
+
+    async def delete(self, id_film_show):
+        film_show = self.data.film_shows.get(id_film_show)
+        if film_show:
+            # Foreign keys of booking and seat_hold
+            data = self.data
+            if data.bookings_by_show.get(id_film_show) or data.holds_by_show.get(
+                id_film_show
+            ):
+                raise StorageError(f"Film show {id_film_show} has bookings")
+            del self.data.film_shows.rows[id_film_show]
+            del self.data.film_shows_by_hall[film_show.id_hall][id_film_show]
+        return film_show
+
+    async def schedule(self, id_cinema, show_date):
+        cinema = self.data.cinemas.get(id_cinema)
+        if cinema is None:
+            return []
+        rows = []
+        for id_hall, cinema_hall in sorted(
+            self.data.halls_by_cinema.get(id_cinema, {}).items()
+        ):
+            film_shows = sorted(
+                (
+                    film_show
+                    for film_show in self.data.film_shows_by_hall.get(
+                        id_hall, {}
+                    ).values()
+                    if film_show.show_date == show_date
+                ),
+                key=lambda film_show: film_show.start_time,
+            )
+            rows.extend(
+                (cinema, cinema_hall, film_show, self.data.films.get(film_show.id_film))
+                for film_show in film_shows
+            )
+            if not film_shows:
+                rows.append((cinema, cinema_hall, None, None))
+        return rows or [(cinema, None, None, None)]
+
+    async def export(self, start_date=None, end_date=None, id_cinema=None):
+        for film_show in list(self.data.film_shows.rows.values()):
+            if not show_matches(self.data, film_show, start_date, end_date, id_cinema):
+                continue
+            yield (
+                film_show.id,
+                film_show.show_date,
+                film_show.start_time,
+                film_show.end_time,
+                film_show.id_hall,
+                film_show.id_film,
+            )
+
+
+def show_matches(data: MemoryData, film_show, start_date, end_date, id_cinema) -> bool:
+    if film_show is None:
+        return not (start_date or end_date or id_cinema)
+    if start_date and film_show.show_date < start_date:
+        return False
+    if end_date and film_show.show_date > end_date:
+        return False
+    if id_cinema:
+        cinema_hall = data.halls.get(film_show.id_hall)
+        return cinema_hall is not None and cinema_hall.id_cinema == id_cinema
+    return True
+
+
+class MemoryBookingRepository(BookingRepository):
+    def __init__(self, data: MemoryData):
+        self.data = data
+
+    async def list(self, id_film_show=None, after_id=None, limit=None):
+        if id_film_show is None:
+            rows = self.data.bookings.rows.values()
+        else:
+            rows = sorted(
+                self.data.bookings_by_show.get(id_film_show, {}).values(),
+                key=lambda booking: booking.id,
+            )
+        return paginate(rows, after_id, limit)
+
+    async def get(self, id_booking):
+        return self.data.bookings.get(id_booking)
+
+    async def places(self, id_film_show):
+        return list(self.data.bookings_by_show.get(id_film_show, {}))
+
+    async def create(self, id_film_show, row, place):
+        return (await self.create_many(id_film_show, [(row, place)]))[0]
+
+    async def book(self, id_film_show, row, place, now):
+        film_show = self.data.film_shows.get(id_film_show)
+        if film_show is None:
+            raise FilmShowNotFoundError()
+        if now >= film_show.start_time:
+            raise FilmShowGoneError()
+        outside = self.data.outside_hall(id_film_show, [(row, place)])
+        if outside:
+            raise PlaceOutOfHallError(outside)
+        booking_list = await self.create_many(id_film_show, [(row, place)], now)
+        return booking_list[0], film_show.id_hall
+
+    async def create_many(self, id_film_show, places, held_at=None):
+        if held_at is not None:
+            held = await MemorySeatHoldRepository(self.data).held(
+                id_film_show, places, held_at
+            )
+            if held:
+                raise PlacesHeldError(held)
+        outside = self.data.outside_hall(id_film_show, places)
+        if outside:
+            raise PlaceOutOfHallError(outside)
+        bookings = self.data.bookings_by_show.get(id_film_show, {})
+        busy = [place for place in places if place in bookings]
+        if busy or len(set(places)) < len(places):
+            raise PlacesBusyError(busy)
+        return self.data.add_bookings(id_film_show, places)
+
+    async def delete(self, id_booking):
+        booking = self.data.bookings.rows.pop(id_booking, None)
+        if booking is None:
+            return None
+        del self.data.bookings_by_show[booking.id_film_show][booking.row, booking.place]
+        # Foreign key keeps the film show of a booking
+        film_show = self.data.film_shows.get(booking.id_film_show)
+        film_show.sold -= 1
+        publish_seat_changes(
+            booking.id_film_show, False, [(booking.row, booking.place)]
+        )
+        return booking, film_show.id_hall
+
+    async def export(self, start_date=None, end_date=None, id_cinema=None):
+        for booking in list(self.data.bookings.rows.values()):
+            film_show = self.data.film_shows.get(booking.id_film_show)
+            if show_matches(self.data, film_show, start_date, end_date, id_cinema):
+                yield (booking.id, booking.id_film_show, booking.row, booking.place)
+
+
+class MemorySeatHoldRepository(SeatHoldRepository):
+    def __init__(self, data: MemoryData):
+        self.data = data
+
+    async def held(self, id_film_show, places, now):
+        holds = self.data.holds_by_show.get(id_film_show, {})
+        return [
+            place
+            for place in places
+            if place in holds and holds[place].expires_at > now
+        ]
+
+    async def places(self, id_film_show, now):
+        return [
+            place
+            for place, hold in self.data.holds_by_show.get(id_film_show, {}).items()
+            if hold.expires_at > now
+        ]
+
+    async def create(self, token, id_film_show, places, expires_at, now):
+        bookings = self.data.bookings_by_show.get(id_film_show, {})
+        busy = [place for place in places if place in bookings]
+        if busy:
+            raise PlacesBusyError(busy)
+        outside = self.data.outside_hall(id_film_show, places)
+        if outside:
+            raise PlaceOutOfHallError(outside)
+        held = await self.held(id_film_show, places, now)
+        if held:
+            raise PlacesHeldError(held)
+        holds = self.data.holds_by_show[id_film_show]
+        for row, place in places:
+            expired = holds.get((row, place))
+            if expired is not None:
+                # Hold expired but not yet swept places are taken over
+                self.data.remove_hold(expired)
+            hold = self.data.seat_holds.insert(
+                SeatHold(
+                    token=token,
+                    id_film_show=id_film_show,
+                    row=row,
+                    place=place,
+                    expires_at=expires_at,
+                )
+            )
+            holds[row, place] = hold
+            self.data.holds_by_token[token].add((id_film_show, (row, place)))
+        publish_seat_changes(id_film_show, True, places)
+
+    async def confirm(self, token, now):
+        holds = [
+            self.data.holds_by_show[id_film_show][place]
+            for id_film_show, place in sorted(self.data.holds_by_token.get(token, ()))
+        ]
+        holds = [hold for hold in holds if hold.expires_at > now]
+        if any(
+            now >= self.data.film_shows.get(hold.id_film_show).start_time
+            for hold in holds
+        ):
+            raise FilmShowGoneError()
+        places = defaultdict(list)
+        for hold in holds:
+            places[hold.id_film_show].append((hold.row, hold.place))
+        for id_film_show, show_places in places.items():
+            bookings = self.data.bookings_by_show.get(id_film_show, {})
+            if any(place in bookings for place in show_places):
+                raise PlacesBusyError()
+        for hold in holds:
+            self.data.remove_hold(hold)
+        booking_list = [
+            booking
+            for id_film_show, show_places in places.items()
+            for booking in self.data.add_bookings(id_film_show, show_places)
+        ]
+        id_halls = {
+            self.data.film_shows.get(id_film_show).id_hall for id_film_show in places
+        }
+        return booking_list, id_halls
+
+    async def delete(self, token):
+        holds = [
+            self.data.holds_by_show[id_film_show][place]
+            for id_film_show, place in sorted(self.data.holds_by_token.get(token, ()))
+        ]
+        return self.release(holds)
+
+    async def sweep(self, now, limit):
+        expired = sorted(
+            (
+                hold
+                for hold in self.data.seat_holds.rows.values()
+                if hold.expires_at <= now
+            ),
+            key=lambda hold: hold.expires_at,
+        )
+        return self.release(expired[:limit])
+
+    def release(self, holds: List[SeatHold]) -> List[Tuple[int, int, int]]:
+        released = []
+        for hold in holds:
+            self.data.remove_hold(hold)
+            publish_seat_changes(hold.id_film_show, False, [(hold.row, hold.place)])
+            released.append((hold.id_film_show, hold.row, hold.place))
+        return released
+
+
+class MemoryIdempotencyKeyRepository(IdempotencyKeyRepository):
+    def __init__(self, data: MemoryData):
+        self.data = data
+
+    async def claim(self, endpoint, key, fingerprint, created_at, lease_before):
+        stored = self.data.idempotency_keys.get((endpoint, key))
+        if stored is not None and stored.status_code is None:
+            # Lease of a lost in-progress request is over
+            if stored.created_at < lease_before:
+                stored = None
+        if stored is None:
+            self.data.idempotency_keys[endpoint, key] = IdempotencyKey(
+                endpoint=endpoint,
+                key=key,
+                fingerprint=fingerprint,
+                created_at=created_at,
+            )
+        return stored
+
+    async def save(self, endpoint, key, status_code, content_type, response):
+        stored = self.data.idempotency_keys.get((endpoint, key))
+        if stored is not None:
+            stored.status_code = status_code
+            stored.content_type = content_type
+            stored.response = response
+
+    async def release(self, endpoint, key):
+        self.data.idempotency_keys.pop((endpoint, key), None)
+
+    async def sweep(self, created_before):
+        expired = [
+            endpoint_key
+            for endpoint_key, stored in self.data.idempotency_keys.items()
+            if stored.created_at < created_before
+        ]
+        for endpoint_key in expired:
+            del self.data.idempotency_keys[endpoint_key]
+        return len(expired)
+
+
+class MemoryStorage(Storage):
+    """
+    Хранилище в памяти процесса с теми же правилами, что и в Postgres:
+    уникальные места сеанса, непересекающиеся сеансы зала, счетчики sold
+    и capacity. Изменения мест сразу попадают в seat_maps и seat_channels.
+    Для тестов и нагрузочного тестирования HTTP слоя без базы данных.
+    """
+
+    def __init__(self):
+        self.data = MemoryData()
+        self.cinemas = MemoryCinemaRepository(self.data)
+        self.halls = MemoryCinemaHallRepository(self.data)
+        self.films = MemoryFilmRepository(self.data)
+        self.film_shows = MemoryFilmShowRepository(self.data)
+        self.bookings = MemoryBookingRepository(self.data)
+        self.seat_holds = MemorySeatHoldRepository(self.data)
+        self.idempotency_keys = MemoryIdempotencyKeyRepository(self.data)
@@ -1,15 +1,235 @@
+import asyncio
+import os
+from contextlib import contextmanager
+
+# Tests never touch the application database, every pytest-xdist worker
+# has a test database of its own. The application works with one
+# connection holding the test transaction
+BASE_DB_NAME = os.getenv("DB_NAME", "tickets")
+os.environ["DB_NAME"] = "_".join(
+    filter(None, [BASE_DB_NAME, "test", os.getenv("PYTEST_XDIST_WORKER")])
+)
+os.environ["DB_POOL_MIN_SIZE"] = os.environ["DB_POOL_MAX_SIZE"] = "1"
+
+import asyncpg
 import pytest
+from gino.dialects.base import Pool
 
-from src.db import Cinema, CinemaHall, Film, FilmShow, Booking, init_db, close_db
+from src.db import db, init_db, close_db
+from src.cache import caches
+from src.metrics import MetricsCursor, request_db_stats
+from src.seats import seat_maps
+from src.single_flight import flights
+from src.settings import (
+    DB_USER,
+    DB_PASSWORD,
+    DB_NAME,
+    DB_HOST,
+    DB_PORT,
+    STORAGE_BACKEND,
+)
+from src.storage import set_storage
+from src.storage.gino import GinoStorage
+from src.storage.memory import MemoryStorage
 
 
-@pytest.fixture(scope="function", autouse=True)
-async def clean_db_records():
+class RollbackPool(Pool):
+    """
+    Пул Gino из одного соединения, открытого в транзакции, которая
+    откатывается при закрытии пула - после теста в базе ничего не остается.
+    Соединение выдается по очереди, каждая выдача - в точке сохранения,
+    так ошибка запроса вне транзакции не прерывает транзакцию теста.
+    """
+
+    def __init__(self, url, loop, init=None, **kwargs):
+        self._url = url
+        self._init_connection = init
+        self._connection = None
+        self._transaction = None
+        self._lock = asyncio.Lock()
+
+    async def _init(self):
+        self._connection = await asyncpg.connect(
+            host=self._url.host,
+            port=self._url.port,
+            user=self._url.username,
+            database=self._url.database,
+            password=self._url.password,
+        )
+        if self._init_connection is not None:
+            await self._init_connection(self._connection)
+        # Nested transactions of the application become savepoints
+        self._transaction = self._connection.transaction()
+        await self._transaction.start()
+        return self
+
+    def __await__(self):
+        return self._init().__await__()
+
+    @property
+    def raw_pool(self):
+        return self
+
+    async def acquire(self, *, timeout=None):
+        await self._lock.acquire()
+        try:
+            await self._connection.execute("SAVEPOINT acquire")
+        except BaseException:
+            self._lock.release()
+            raise
+        return self._connection
+
+    async def release(self, conn):
+        try:
+            try:
+                await conn.execute("RELEASE SAVEPOINT acquire")
+            except asyncpg.InFailedSQLTransactionError:
+                await conn.execute(
+                    "ROLLBACK TO SAVEPOINT acquire; RELEASE SAVEPOINT acquire"
+                )
+        finally:
+            self._lock.release()
+
+    async def close(self):
+        try:
+            await self._transaction.rollback()
+        finally:
+            await self._connection.close()
+
+    # asyncpg pool interface used by the pool metrics
+    def get_size(self):
+        return 1
+
+    def get_idle_size(self):
+        return 0 if self._lock.locked() else 1
+
+    def repr(self, color):
+        return f"<RollbackPool {self._url.database}>"
+
+
+class QueryLog:
+    """
+    Запросы к Postgres, выполненные внутри HTTP-запросов: выражения Gino
+    и команды транзакций (BEGIN, COMMIT, точки сохранения). Точки
+    сохранения RollbackPool в журнал не попадают.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def record(self, query: str):
+        # Background sweepers run outside of requests
+        if request_db_stats.get() is not None:
+            self.queries.append(query)
+
+    @contextmanager
+    def budget(self, count: int):
+        start = len(self.queries)
+        yield
+        queries = self.queries[start:]
+        assert len(queries) == count, "\n".join(queries)
+
+
+@pytest.fixture
+def query_log(monkeypatch):
+    log = QueryLog()
+    cursor_execute = MetricsCursor.async_execute
+    connection_execute = asyncpg.Connection.execute
+
+    async def async_execute(self, query, *args, **kwargs):
+        log.record(query)
+        return await cursor_execute(self, query, *args, **kwargs)
+
+    async def execute(self, query, *args, **kwargs):
+        if "SAVEPOINT acquire" not in query:
+            log.record(query)
+        return await connection_execute(self, query, *args, **kwargs)
+
+    monkeypatch.setattr(MetricsCursor, "async_execute", async_execute)
+    monkeypatch.setattr(asyncpg.Connection, "execute", execute)
+    return log
+
+
+async def create_test_database():
+    # Test database is created on the first run, data left by an interrupted
+    # run is removed
+    conn = await asyncpg.connect(
+        host=DB_HOST,
+        port=DB_PORT,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=BASE_DB_NAME,
+    )
+    try:
+        exists = await conn.fetchval(
+            "SELECT 1 FROM pg_database WHERE datname = $1", DB_NAME
+        )
+        if not exists:
+            await conn.execute(f'CREATE DATABASE "{DB_NAME}"')
+    finally:
+        await conn.close()
     await init_db()
-    await Booking.delete.gino.status()
-    await FilmShow.delete.gino.status()
-    await CinemaHall.delete.gino.status()
-    await Cinema.delete.gino.status()
-    await Film.delete.gino.status()
-    await close_db()
-    yield
+    try:
+        await truncate_tables()
+    finally:
+        await close_db()
+
+
+async def truncate_tables():
+    tables = ", ".join(table.name for table in db.sorted_tables)
+    await db.status(db.text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+
+
+async def clean_test_database():
+    await init_db(create_schema=False)
+    try:
+        await truncate_tables()
+    finally:
+        await close_db()
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "commit: test works with committed data (LISTEN/NOTIFY, several "
+        "connections), tables are truncated after it instead of rollback",
+    )
+    config.addinivalue_line(
+        "markers", "postgres: test needs Postgres, skipped with the memory storage"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if STORAGE_BACKEND == "postgres":
+        return
+    skip = pytest.mark.skip(reason=f"STORAGE_BACKEND={STORAGE_BACKEND}")
+    for item in items:
+        if item.get_closest_marker("postgres"):
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def test_database():
+    # Schema is created once, tests do not run DDL on startup
+    if STORAGE_BACKEND == "postgres":
+        asyncio.run(create_test_database())
+
+
+@pytest.fixture(scope="function", autouse=True)
+def test_storage(request):
+    # Process-wide caches must not outlive rolled back rows
+    for cache in caches + flights:
+        cache.clear()
+    seat_maps.clear()
+    commit = request.node.get_closest_marker("commit")
+    if STORAGE_BACKEND == "memory":
+        storage = MemoryStorage()
+    elif commit:
+        storage = GinoStorage(create_schema=False)
+    else:
+        storage = GinoStorage(pool_class=RollbackPool, create_schema=False)
+    previous = set_storage(storage)
+    yield storage
+    set_storage(previous)
+    if commit and STORAGE_BACKEND == "postgres":
+        asyncio.run(clean_test_database())
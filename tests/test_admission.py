@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from src import admission
+from src.admission import AdmissionGate, AdmissionRejected
+from src.main import app
+from .create_functions import create_film_show_with_dependencies
+
+
+@pytest.mark.asyncio
+async def test_gate_fifo():
+    gate = AdmissionGate(concurrency=1, queue_size=2, max_wait=10, service_time=1)
+    order = []
+
+    async def request(number):
+        await gate.acquire()
+        order.append(number)
+        await asyncio.sleep(0)
+        gate.release()
+
+    await gate.acquire()
+    tasks = [asyncio.ensure_future(request(number)) for number in range(2)]
+    await asyncio.sleep(0)
+    assert (gate.active, gate.queued) == (1, 2)
+    # Queue is full
+    with pytest.raises(AdmissionRejected) as error:
+        await gate.acquire()
+    assert (error.value.position, error.value.eta) == (3, 3)
+    gate.release()
+    await asyncio.gather(*tasks)
+    assert order == [0, 1]
+    assert gate.idle
+
+
+@pytest.mark.asyncio
+async def test_gate_cancelled_waiter():
+    gate = AdmissionGate(concurrency=1, queue_size=10, max_wait=10, service_time=1)
+    await gate.acquire()
+    waiter = asyncio.ensure_future(gate.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    assert gate.queued == 0
+    gate.release()
+    assert gate.idle
+
+
+@pytest.mark.asyncio
+async def test_gate_max_wait():
+    gate = AdmissionGate(concurrency=2, queue_size=10, max_wait=0.9, service_time=1)
+    await gate.acquire()
+    await gate.acquire()
+    waiter = asyncio.ensure_future(gate.acquire())
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejected):
+        # Two requests ahead - one second of expected wait is too long
+        await gate.acquire()
+    gate.release(elapsed=0.1)
+    await waiter
+    assert gate.service_time == pytest.approx(0.82)
+
+
+def test_booking_rejected(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_CONCURRENCY", 0)
+    monkeypatch.setattr(admission, "ADMISSION_QUEUE_SIZE", 0)
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        response = client.post(
+            "/booking/", json={"id_film_show": id_film_show, "row": 1, "place": 1}
+        )
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "1"
+        assert response.json()["detail"]["position"] == 1
+        response = client.get(f"/booking/queue/{id_film_show}")
+        assert response.json() == {
+            "id_film_show": id_film_show,
+            "active": 0,
+            "queued": 0,
+            "eta": 0.0,
+        }
+
+
+def test_rejected_retry_with_idempotency_key(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_CONCURRENCY", 0)
+    monkeypatch.setattr(admission, "ADMISSION_QUEUE_SIZE", 0)
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        booking_data = {"id_film_show": id_film_show, "row": 1, "place": 1}
+        headers = {"Idempotency-Key": "booking-1"}
+        response = client.post("/booking/", json=booking_data, headers=headers)
+        assert response.status_code == 429
+        monkeypatch.undo()
+        # The shed request is not stored for the key, the retry is executed
+        response = client.post("/booking/", json=booking_data, headers=headers)
+        assert response.status_code == 200, response.json()
+        assert "idempotent-replayed" not in response.headers
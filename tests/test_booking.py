@@ -1,4 +1,8 @@
+import json
+
 from fastapi.testclient import TestClient
+from src.settings import BOOKING_MAX_PLACES
+from src.storage import storage
 from src.main import app
 from datetime import datetime, timedelta
 from .create_functions import create_film_show_with_dependencies, create_booking
@@ -90,6 +94,26 @@ def test_create_past_show_time():
         assert response.status_code == 400
 
 
+def test_create_film_show_not_found():
+    with TestClient(app) as client:
+        response, id_booking = create_booking(client, 99)
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Film show not found"
+
+
+def test_create_place_out_of_hall():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        for row, place in [(21, 1), (1, 21), (0, 1)]:
+            response, id_booking = create_booking(client, id_film_show, row, place)
+            assert response.status_code == 400
+            assert response.json()["detail"] == "No such place in the hall"
+        response = client.get(f"/film-show/{id_film_show}")
+        assert response.json()["sold"] == 0
+
+
 def test_delete():
     with TestClient(app) as client:
         # Full creation - cinema, hall, film, film show
@@ -109,3 +133,254 @@ def test_delete_not_found():
     with TestClient(app) as client:
         response = client.delete(f"/booking/{99}")
         assert response.status_code == 404
+
+
+def test_create_batch():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        places = [{"row": 5, "place": place} for place in range(1, 5)]
+        response = client.post(
+            "/booking/batch", json={"id_film_show": id_film_show, "places": places}
+        )
+        assert response.status_code == 200, response.json()
+        assert [
+            {"row": booking["row"], "place": booking["place"]}
+            for booking in response.json()
+        ] == places
+        assert all(
+            booking["id_film_show"] == id_film_show for booking in response.json()
+        )
+        response = client.get("/booking/")
+        assert len(response.json()) == 4
+
+
+def test_create_batch_occupied_places():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        create_booking(client, id_film_show, row=5, place=2)
+        create_booking(client, id_film_show, row=5, place=3)
+        places = [{"row": 5, "place": place} for place in range(1, 5)]
+        response = client.post(
+            "/booking/batch", json={"id_film_show": id_film_show, "places": places}
+        )
+        assert response.status_code == 400
+        assert sorted(
+            response.json()["detail"]["places"], key=lambda place: place["place"]
+        ) == [{"row": 5, "place": 2}, {"row": 5, "place": 3}]
+        # Nothing booked from the failed batch
+        response = client.get("/booking/")
+        assert len(response.json()) == 2
+
+
+def test_create_batch_repeated_places():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        places = [{"row": 5, "place": 1}, {"row": 5, "place": 1}]
+        response = client.post(
+            "/booking/batch", json={"id_film_show": id_film_show, "places": places}
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"]["places"] == [{"row": 5, "place": 1}]
+
+
+def test_create_batch_too_many_places():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        places = [{"row": 1, "place": 1}] * (BOOKING_MAX_PLACES + 1)
+        response = client.post(
+            "/booking/batch", json={"id_film_show": id_film_show, "places": places}
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Too many places in request"
+
+
+def test_create_batch_places_out_of_hall():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        response = client.post(
+            "/booking/batch",
+            json={
+                "id_film_show": id_film_show,
+                "places": [
+                    {"row": 1, "place": 1},
+                    {"row": 0, "place": -3},
+                    {"row": 999, "place": 1},
+                ],
+            },
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"] == {
+            "message": "No such place in the hall",
+            "places": [{"row": 0, "place": -3}, {"row": 999, "place": 1}],
+        }
+        # Nothing is booked, the places inside the hall too
+        assert client.get("/booking/").json() == []
+        assert client.get(f"/film-show/{id_film_show}").json()["sold"] == 0
+
+
+def test_create_batch_not_found():
+    with TestClient(app) as client:
+        response = client.post(
+            "/booking/batch",
+            json={"id_film_show": 99, "places": [{"row": 1, "place": 1}]},
+        )
+        assert response.status_code == 404
+
+
+def test_list_pagination():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        id_booking_list = [
+            create_booking(client, id_film_show, row=1, place=place)[1]
+            for place in range(1, 6)
+        ]
+        response = client.get("/booking/?limit=2")
+        assert [booking["id"] for booking in response.json()] == id_booking_list[:2]
+        cursor = response.headers["x-next-cursor"]
+        response = client.get(f"/booking/?limit=2&cursor={cursor}")
+        assert [booking["id"] for booking in response.json()] == id_booking_list[2:4]
+        cursor = response.headers["x-next-cursor"]
+        response = client.get(f"/booking/?limit=2&cursor={cursor}")
+        assert [booking["id"] for booking in response.json()] == id_booking_list[4:]
+        assert "x-next-cursor" not in response.headers
+
+
+def test_list_filter_film_show():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        create_booking(client, id_film_show)
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        response, id_booking = create_booking(client, id_film_show)
+        response = client.get(f"/booking/?id_film_show={id_film_show}")
+        assert response.status_code == 200
+        assert [booking["id"] for booking in response.json()] == [id_booking]
+
+
+def test_list_incorrect_cursor():
+    with TestClient(app) as client:
+        response = client.get("/booking/?cursor=11111")
+        assert response.status_code == 400
+        response = client.get("/booking/?limit=0")
+        assert response.status_code == 422
+
+
+def test_export():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        response, id_booking = create_booking(client, id_film_show)
+        response = client.get("/booking/export")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert [json.loads(line) for line in response.text.splitlines()] == [
+            {"id": id_booking, "id_film_show": id_film_show, "row": 20, "place": 20}
+        ]
+        response = client.get("/booking/export?format=csv")
+        assert response.status_code == 200
+        assert response.text.splitlines() == [
+            "id,id_film_show,row,place",
+            f"{id_booking},{id_film_show},20,20",
+        ]
+
+
+def test_export_filter():
+    with TestClient(app) as client:
+        show_dt = datetime.now() + timedelta(days=3)
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client, show_dt=show_dt
+        )
+        response, id_booking = create_booking(client, id_film_show)
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client, show_dt=show_dt + timedelta(days=1)
+        )
+        create_booking(client, id_film_show)
+        query_date = show_dt.date().strftime("%Y-%m-%d")
+        response = client.get(
+            f"/booking/export?start_date={query_date}&end_date={query_date}"
+        )
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == [
+            id_booking
+        ]
+        response = client.get(f"/booking/export?id_cinema={id_cinema}")
+        assert len(response.text.splitlines()) == 1
+
+
+def test_export_incorrect_format():
+    with TestClient(app) as client:
+        response = client.get("/booking/export?format=xml")
+        assert response.status_code == 400
+
+
+def best_places(response):
+    return [(booking["row"], booking["place"]) for booking in response.json()]
+
+
+def test_create_best_available():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        booking_data = {"id_film_show": id_film_show, "count": 4}
+        response = client.post("/booking/best-available", json=booking_data)
+        assert response.status_code == 200, response.json()
+        assert best_places(response) == [(10, 9), (10, 10), (10, 11), (10, 12)]
+        response = client.post("/booking/best-available", json=booking_data)
+        assert response.status_code == 200, response.json()
+        assert best_places(response) == [(11, 9), (11, 10), (11, 11), (11, 12)]
+        # Place booked from the middle of a row splits it
+        create_booking(client, id_film_show, row=9, place=11)
+        response = client.post("/booking/best-available", json=booking_data)
+        assert best_places(response) == [(12, 9), (12, 10), (12, 11), (12, 12)]
+        booking_data["count"] = 3
+        response = client.post("/booking/best-available", json=booking_data)
+        assert best_places(response) == [(9, 8), (9, 9), (9, 10)]
+
+
+def test_create_best_available_taken_by_other_worker():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        client.get(f"/film-show/{id_film_show}/seats")
+        # Booking is not known to the seat map of this process
+        client.portal.call(storage.bookings.create, id_film_show, 10, 10)
+        response = client.post(
+            "/booking/best-available", json={"id_film_show": id_film_show, "count": 2}
+        )
+        assert response.status_code == 200, response.json()
+        assert best_places(response) == [(11, 10), (11, 11)]
+
+
+def test_create_best_available_incorrect():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        for count in (0, 21):
+            response = client.post(
+                "/booking/best-available",
+                json={"id_film_show": id_film_show, "count": count},
+            )
+            assert response.status_code == 400
+            assert response.json() == {"detail": "Incorrect places count"}
+        response = client.post(
+            "/booking/best-available", json={"id_film_show": 0, "count": 2}
+        )
+        assert response.status_code == 404
@@ -1,3 +1,5 @@
+import datetime
+
 import pytest
 
 from fastapi.testclient import TestClient
@@ -5,6 +7,8 @@ from src.main import app
 from .create_functions import (
     create_cinema,
     create_cinema_hall,
+    create_film,
+    create_film_show,
     create_film_show_with_dependencies,
 )
 
@@ -36,6 +40,16 @@ def test_list():
         assert response.json() == [{"id": id_cinema, "name": "Star", "city": "Moscow"}]
 
 
+def test_list_filter_city():
+    with TestClient(app) as client:
+        create_cinema(client)
+        response = client.post("/cinema/", json={"name": "Moon", "city": "Kazan"})
+        id_cinema = response.json()["id"]
+        response = client.get("/cinema/?city=Kazan")
+        assert response.status_code == 200
+        assert response.json() == [{"id": id_cinema, "name": "Moon", "city": "Kazan"}]
+
+
 def test_get():
     with TestClient(app) as client:
         # Create
@@ -68,6 +82,15 @@ def test_update(key, value):
         assert response.json() == expected
 
 
+def test_update_falsy_value():
+    with TestClient(app) as client:
+        id_cinema = create_cinema(client)
+        response = client.patch(f"/cinema/{id_cinema}", json={"name": ""})
+        assert response.status_code == 200
+        response = client.get(f"/cinema/{id_cinema}")
+        assert response.json() == {"id": id_cinema, "name": "", "city": "Moscow"}
+
+
 def test_update_not_found():
     with TestClient(app) as client:
         response = client.patch(
@@ -143,6 +166,8 @@ def test_film_show_list():
                 "id_hall": id_hall,
                 "id_film": id_film,
                 "id": id_film_show,
+                "sold": 0,
+                "capacity": 400,
             }
         ]
 
@@ -162,3 +187,45 @@ def test_film_show_list_404():
         response, id_hall = create_cinema_hall(client, id_cinema)
         response = client.get(f"/cinema/{id_cinema}/hall/{id_hall}/film-show/")
         assert response.status_code == 404
+
+
+def test_schedule():
+    with TestClient(app) as client:
+        show_dt = datetime.datetime.combine(
+            datetime.date.today() + datetime.timedelta(days=3), datetime.time(12, 20)
+        )
+        id_cinema = create_cinema(client)
+        response, id_hall = create_cinema_hall(client, id_cinema)
+        response, id_empty_hall = create_cinema_hall(client, id_cinema)
+        response, id_film = create_film(client)
+        response, id_film_show = create_film_show(client, id_hall, id_film, show_dt)
+        response, id_late_show = create_film_show(
+            client, id_hall, id_film, show_dt + datetime.timedelta(hours=3)
+        )
+        # Next day show is not in the schedule
+        create_film_show(client, id_hall, id_film, show_dt + datetime.timedelta(days=1))
+        response = client.get(f"/cinema/{id_cinema}/schedule?date={show_dt.date()}")
+        assert response.status_code == 200
+        schedule = response.json()
+        assert schedule["cinema"]["id"] == id_cinema
+        assert schedule["show_date"] == str(show_dt.date())
+        assert [hall["id"] for hall in schedule["halls"]] == [id_hall, id_empty_hall]
+        assert [show["id"] for show in schedule["halls"][0]["film_shows"]] == [
+            id_film_show,
+            id_late_show,
+        ]
+        assert schedule["halls"][1]["film_shows"] == []
+        # Film of both shows is returned once
+        assert [film["id"] for film in schedule["films"]] == [id_film]
+
+
+def test_schedule_not_found():
+    with TestClient(app) as client:
+        response = client.get("/cinema/99/schedule")
+        assert response.status_code == 404
+        id_cinema = create_cinema(client)
+        response = client.get(f"/cinema/{id_cinema}/schedule?date=11111")
+        assert response.status_code == 400
+        response = client.get(f"/cinema/{id_cinema}/schedule")
+        assert response.status_code == 200
+        assert response.json()["halls"] == []
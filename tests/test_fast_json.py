@@ -0,0 +1,43 @@
+import json
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+from fastapi.encoders import jsonable_encoder
+from benchmarks.serialization import make_rows
+from src.main import app
+from src.routers.booking import BookingOut, booking_encoder
+from src.routers.cinema import CinemaOut, cinema_encoder
+from src.routers.cinema_hall import CinemaHallOut, cinema_hall_encoder
+from src.routers.film import FilmOut, film_encoder
+from src.routers.film_show import FilmShowOut, film_show_encoder
+
+
+@pytest.mark.parametrize(
+    "name, model, encoder",
+    [
+        ("cinema", CinemaOut, cinema_encoder),
+        ("cinema_hall", CinemaHallOut, cinema_hall_encoder),
+        ("film", FilmOut, film_encoder),
+        ("film_show", FilmShowOut, film_show_encoder),
+        ("booking", BookingOut, booking_encoder),
+    ],
+)
+def test_same_as_response_model(name, model, encoder):
+    rows = make_rows(3)[name]
+    expected = json.dumps(jsonable_encoder([model.from_model(row) for row in rows]))
+    assert orjson.loads(encoder.encode(rows)) == json.loads(expected)
+
+
+def test_page_cursor_header():
+    with TestClient(app) as client:
+        for name in ("Star", "Moon"):
+            client.post("/cinema/", json={"name": name, "city": "Moscow"})
+        response = client.get("/cinema/", params={"limit": 1})
+        assert response.status_code == 200
+        assert [cinema["name"] for cinema in response.json()] == ["Star"]
+        response = client.get(
+            "/cinema/", params={"cursor": response.headers["X-Next-Cursor"]}
+        )
+        assert [cinema["name"] for cinema in response.json()] == ["Moon"]
+        assert "X-Next-Cursor" not in response.headers
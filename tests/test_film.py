@@ -116,3 +116,27 @@ def test_update_not_found():
             },
         )
         assert response.status_code == 404
+
+
+def test_update_cached():
+    with TestClient(app) as client:
+        response, id_film = create_film(client)
+        # Read film into the cache, then update it
+        client.get(f"/film/{id_film}")
+        response = client.patch(f"/film/{id_film}", json={"title": "Star Trek"})
+        assert response.status_code == 200
+        response = client.get(f"/film/{id_film}")
+        assert response.json()["title"] == "Star Trek"
+
+
+def test_cache_stats():
+    with TestClient(app) as client:
+        response, id_film = create_film(client)
+        response = client.get("/cache/stats")
+        film_stats = next(stats for stats in response.json() if stats["name"] == "film")
+        client.get(f"/film/{id_film}")
+        client.get(f"/film/{id_film}")
+        response = client.get("/cache/stats")
+        stats = next(stats for stats in response.json() if stats["name"] == "film")
+        assert stats["misses"] == film_stats["misses"] + 1
+        assert stats["hits"] == film_stats["hits"] + 1
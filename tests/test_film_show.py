@@ -1,3 +1,4 @@
+import json
 import datetime
 
 from fastapi.testclient import TestClient
@@ -7,6 +8,7 @@ from .create_functions import (
     preprocess_show_time,
     create_film_show_dependencies,
     create_film_show_with_dependencies,
+    create_booking,
 )
 
 DEFAULT_TIME = datetime.datetime.now() + datetime.timedelta(days=5)
@@ -19,6 +21,35 @@ def test_empty_list():
         assert response.json() == []
 
 
+def test_export():
+    with TestClient(app) as client:
+        show_start = datetime.datetime.combine(
+            DEFAULT_TIME.date(), datetime.time(12, 20)
+        )
+        (
+            id_cinema,
+            id_hall,
+            id_film,
+            id_film_show,
+            time,
+        ) = create_film_show_with_dependencies(
+            client, show_dt=show_start, return_time=True
+        )
+        create_film_show_with_dependencies(client)
+        response = client.get(f"/film-show/export?id_cinema={id_cinema}")
+        assert response.status_code == 200
+        assert [json.loads(line) for line in response.text.splitlines()] == [
+            {
+                "id": id_film_show,
+                "show_date": time["show_date"],
+                "start_time": f"{time['show_date']}T{time['start_time']}",
+                "end_time": f"{time['show_date']}T{time['end_time']}",
+                "id_hall": id_hall,
+                "id_film": id_film,
+            }
+        ]
+
+
 def test_create():
     with TestClient(app) as client:
         # Create film show dependencies
@@ -38,6 +69,7 @@ def test_create():
         preprocess_time = preprocess_show_time(DEFAULT_TIME, film_duration)
         for key in preprocess_time:
             film_show_data[key] = preprocess_time[key]
+        film_show_data.update(sold=0, capacity=400)
         assert response.json() == film_show_data
 
 
@@ -60,6 +92,8 @@ def test_list():
                 "id_hall": id_hall,
                 "id_film": id_film,
                 "id": id_film_show,
+                "sold": 0,
+                "capacity": 400,
             }
         ]
 
@@ -82,6 +116,8 @@ def test_get():
             "id_hall": id_hall,
             "id_film": id_film,
             "id": id_film_show,
+            "sold": 0,
+            "capacity": 400,
         }
 
 
@@ -186,6 +222,8 @@ def test_filter_start_date():
                 "id_hall": id_hall,
                 "id_film": id_film,
                 "id": id_film_show,
+                "sold": 0,
+                "capacity": 400,
             }
         ]
 
@@ -224,6 +262,8 @@ def test_filter_end_date():
                 "id_hall": id_hall,
                 "id_film": id_film,
                 "id": id_film_show,
+                "sold": 0,
+                "capacity": 400,
             }
         ]
 
@@ -270,6 +310,8 @@ def test_filter_start_end_date():
                 "id_hall": id_hall,
                 "id_film": id_film,
                 "id": id_film_show,
+                "sold": 0,
+                "capacity": 400,
             }
         ]
 
@@ -305,6 +347,8 @@ def test_night_film_show():
             "id_hall": id_hall,
             "id_film": id_film,
             "id": id_film_show,
+            "sold": 0,
+            "capacity": 400,
         }
         # Check that film show (night show) is included in film show list of previous day of the date
         query_date = (DEFAULT_TIME.date() - datetime.timedelta(days=1)).strftime(
@@ -322,3 +366,170 @@ def test_night_film_show():
         )
         assert response.status_code == 200
         assert response.json() == []
+
+
+def test_seats():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        create_booking(client, id_film_show, row=1, place=2)
+        response, id_booking = create_booking(client, id_film_show, row=20, place=20)
+        response = client.get(f"/film-show/{id_film_show}/seats")
+        assert response.status_code == 200
+        seats = response.json()
+        assert seats["rows"] == 20
+        assert seats["places_in_row"] == 20
+        assert seats["seats"][0] == "01" + "0" * 18
+        assert seats["seats"][19] == "0" * 19 + "1"
+        assert all(row == "0" * 20 for row in seats["seats"][1:19])
+        # Released place is free again
+        client.delete(f"/booking/{id_booking}")
+        response = client.get(f"/film-show/{id_film_show}/seats")
+        assert response.json()["seats"][19] == "0" * 20
+
+
+def test_seats_packed():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        create_booking(client, id_film_show, row=1, place=2)
+        create_booking(client, id_film_show, row=20, place=20)
+        response = client.get(f"/film-show/{id_film_show}/seats?format=packed")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/octet-stream"
+        assert response.headers["x-hall-rows"] == "20"
+        assert response.headers["x-hall-places-in-row"] == "20"
+        # 20 x 20 hall - 400 bits
+        assert response.content == b"\x40" + b"\x00" * 48 + b"\x01"
+
+
+def test_seats_not_found():
+    with TestClient(app) as client:
+        response = client.get(f"/film-show/{99}/seats")
+        assert response.status_code == 404
+
+
+def test_create_show_time_other_hall_no_conflict():
+    with TestClient(app) as client:
+        # Create film shows at the same time in two halls
+        id_hall, id_film = create_film_show_dependencies(client)
+        response, id_film_show = create_film_show(
+            client, id_hall, id_film, DEFAULT_TIME
+        )
+        assert response.status_code == 200
+        id_hall, id_film = create_film_show_dependencies(client)
+        response, id_film_show = create_film_show(
+            client, id_hall, id_film, DEFAULT_TIME
+        )
+        assert response.status_code == 200
+
+
+def test_create_show_time_inside_conflict():
+    with TestClient(app) as client:
+        id_hall, id_film = create_film_show_dependencies(client)
+        response, id_film_show = create_film_show(
+            client, id_hall, id_film, DEFAULT_TIME
+        )
+        assert response.status_code == 200
+        # Short film show inside of the existing one
+        response = client.post(
+            "/film/",
+            json={
+                "title": "Short",
+                "genre": "Comedy",
+                "cast": "Unknown",
+                "description": "Short film",
+                "duration": 30,
+            },
+        )
+        id_short_film = response.json()["id"]
+        show_dt = DEFAULT_TIME + datetime.timedelta(minutes=30)
+        response, id_film_show = create_film_show(
+            client, id_hall, id_short_film, show_dt
+        )
+        assert response.status_code == 400
+
+
+def test_create_bulk():
+    with TestClient(app) as client:
+        id_hall, id_film = create_film_show_dependencies(client)
+        id_other_hall, id_film = create_film_show_dependencies(client)
+        create_film_show(client, id_hall, id_film, DEFAULT_TIME)
+        show_times = [
+            DEFAULT_TIME + datetime.timedelta(hours=3),
+            DEFAULT_TIME + datetime.timedelta(hours=4),
+            DEFAULT_TIME + datetime.timedelta(hours=1),
+            DEFAULT_TIME,
+        ]
+        film_show_list = [
+            {
+                "start_time": show_dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+                "id_hall": id_hall,
+                "id_film": id_film,
+            }
+            for show_dt in show_times
+        ]
+        # Same time in other hall has no conflict
+        film_show_list[3]["id_hall"] = id_other_hall
+        film_show_list.append(dict(film_show_list[0], id_film=99))
+        film_show_list.append({"start_time": "11111", "id_hall": id_hall})
+        response = client.post("/film-show/bulk", json=film_show_list)
+        assert response.status_code == 200, response.json()
+        results = response.json()
+        assert [result["index"] for result in results] == list(range(6))
+        assert [result["status_code"] for result in results] == [
+            200,
+            400,
+            400,
+            200,
+            404,
+            400,
+        ]
+        assert results[0]["film_show"]["id_hall"] == id_hall
+        assert results[3]["film_show"]["id_hall"] == id_other_hall
+        assert results[1]["detail"] == "Show time already busy"
+        response = client.get("/film-show/")
+        assert len(response.json()) == 3
+
+
+def test_create_bulk_csv():
+    with TestClient(app) as client:
+        id_hall, id_film = create_film_show_dependencies(client)
+        show_dt = DEFAULT_TIME.strftime("%Y-%m-%dT%H:%M:%S")
+        response = client.post(
+            "/film-show/bulk",
+            content=f"start_time,id_hall,id_film\n{show_dt},{id_hall},{id_film}\n",
+            headers={"content-type": "text/csv"},
+        )
+        assert response.status_code == 200, response.json()
+        assert response.json()[0]["status_code"] == 200
+        assert response.json()[0]["film_show"]["show_date"] == str(DEFAULT_TIME.date())
+
+
+def test_create_bulk_incorrect_list():
+    with TestClient(app) as client:
+        response = client.post("/film-show/bulk", json={"start_time": "11111"})
+        assert response.status_code == 400
+
+
+def test_sold_capacity():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        response, id_booking = create_booking(client, id_film_show)
+        client.post(
+            "/booking/batch",
+            json={
+                "id_film_show": id_film_show,
+                "places": [{"row": 1, "place": 1}, {"row": 1, "place": 2}],
+            },
+        )
+        response = client.get(f"/film-show/{id_film_show}")
+        assert (response.json()["sold"], response.json()["capacity"]) == (3, 400)
+        client.delete(f"/booking/{id_booking}")
+        client.patch(f"/cinema-hall/{id_hall}", json={"rows": 10})
+        response = client.get("/film-show/")
+        assert (response.json()[0]["sold"], response.json()[0]["capacity"]) == (2, 200)
@@ -0,0 +1,92 @@
+from email.utils import formatdate
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+from src import http_cache
+from src.main import app
+from src.storage import storage
+from .create_functions import (
+    create_booking,
+    create_film,
+    create_film_show_with_dependencies,
+)
+
+
+def test_film_list_not_modified(monkeypatch):
+    with TestClient(app) as client:
+        create_film(client)
+        response = client.get("/film/")
+        assert response.status_code == 200
+        assert response.headers["Cache-Control"].startswith("public, max-age=")
+        etag = response.headers["ETag"]
+
+        def fail(*args, **kwargs):
+            raise AssertionError("List is loaded for a fresh copy")
+
+        monkeypatch.setattr(storage._storage.films, "list", fail)
+        response = client.get("/film/", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+        monkeypatch.undo()
+        create_film(client)
+        response = client.get("/film/", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert len(response.json()) == 2
+        assert response.headers["ETag"] != etag
+
+
+def test_film_show_list_sold_changes():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        url = f"/cinema/{id_cinema}/hall/{id_hall}/film-show/"
+        etag = client.get(url).headers["ETag"]
+        other = client.get("/cinema/").headers["ETag"]
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+        create_booking(client, id_film_show)
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()[0]["sold"] == 1
+        # Other tables keep their versions
+        response = client.get("/cinema/", headers={"If-None-Match": other})
+        assert response.status_code == 304
+
+
+def test_last_modified(monkeypatch):
+    now = 1_700_000_000.5
+    monkeypatch.setattr(http_cache, "time", SimpleNamespace(time=lambda: now))
+    with TestClient(app) as client:
+        create_film(client)
+        # No Last-Modified in the second of a change, more may follow in it
+        assert "Last-Modified" not in client.get("/film/").headers
+        now += 1
+        last_modified = client.get("/film/").headers["Last-Modified"]
+        assert last_modified == formatdate(int(now), usegmt=True)
+        response = client.get("/film/", headers={"If-Modified-Since": last_modified})
+        assert response.status_code == 304
+        create_film(client)
+        response = client.get("/film/", headers={"If-Modified-Since": last_modified})
+        assert response.status_code == 200
+
+
+def test_schedule_cache_control():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        response = client.get(f"/cinema/{id_cinema}/schedule")
+        assert response.status_code == 200
+        assert "public" in response.headers["Cache-Control"]
+        response = client.get(
+            f"/cinema/{id_cinema}/schedule",
+            headers={"If-None-Match": response.headers["ETag"]},
+        )
+        assert response.status_code == 304
+
+
+def test_etag_matches():
+    assert http_cache.etag_matches('"a", W/"b"', '"b"')
+    assert http_cache.etag_matches(" * ", '"b"')
+    assert not http_cache.etag_matches('W/"a"', '"b"')
@@ -0,0 +1,120 @@
+import hashlib
+import json
+from fastapi.testclient import TestClient
+from src.cache import idempotency_cache
+from src.idempotency import sweep_idempotency_keys
+from src.main import app
+from src.settings import IDEMPOTENCY_LEASE
+from src.storage import storage
+from .create_functions import (
+    create_film_show_dependencies,
+    create_film_show_with_dependencies,
+)
+from datetime import datetime, timedelta
+
+
+def test_booking_replay():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        booking_data = {"id_film_show": id_film_show, "row": 1, "place": 1}
+        headers = {"Idempotency-Key": "booking-1"}
+        response = client.post("/booking/", json=booking_data, headers=headers)
+        assert response.status_code == 200, response.json()
+        assert "idempotent-replayed" not in response.headers
+        # Retry gets the same booking instead of "This place already busy"
+        retry = client.post("/booking/", json=booking_data, headers=headers)
+        assert retry.status_code == 200
+        assert retry.json() == response.json()
+        assert retry.headers["idempotent-replayed"] == "true"
+        # Response is replayed from the table by other workers
+        idempotency_cache.clear()
+        retry = client.post("/booking/", json=booking_data, headers=headers)
+        assert retry.json() == response.json()
+        assert len(client.get("/booking/").json()) == 1
+        # Without the key the request is executed again
+        response = client.post("/booking/", json=booking_data)
+        assert response.status_code == 400
+
+
+def test_film_show_replay():
+    with TestClient(app) as client:
+        id_hall, id_film = create_film_show_dependencies(client)
+        film_show_data = {
+            "start_time": (datetime.now() + timedelta(days=5)).strftime(
+                "%Y-%m-%dT%H:%M:%S.%fZ"
+            ),
+            "id_hall": id_hall,
+            "id_film": id_film,
+        }
+        headers = {"Idempotency-Key": "film-show-1"}
+        response = client.post("/film-show/", json=film_show_data, headers=headers)
+        assert response.status_code == 200, response.json()
+        retry = client.post("/film-show/", json=film_show_data, headers=headers)
+        assert retry.json() == response.json()
+        assert len(client.get("/film-show/").json()) == 1
+
+
+def test_key_reused():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        headers = {"Idempotency-Key": "booking-1"}
+        client.post(
+            "/booking/",
+            json={"id_film_show": id_film_show, "row": 1, "place": 1},
+            headers=headers,
+        )
+        response = client.post(
+            "/booking/",
+            json={"id_film_show": id_film_show, "row": 1, "place": 2},
+            headers=headers,
+        )
+        assert response.status_code == 422
+        response = client.post(
+            "/booking/",
+            json={"id_film_show": id_film_show, "row": 1, "place": 2},
+            headers={"Idempotency-Key": "x" * 256},
+        )
+        assert response.status_code == 400
+
+
+def test_sweep():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        client.post(
+            "/booking/",
+            json={"id_film_show": id_film_show, "row": 1, "place": 1},
+            headers={"Idempotency-Key": "booking-1"},
+        )
+        assert client.portal.call(sweep_idempotency_keys) == 0
+        assert client.portal.call(sweep_idempotency_keys, -1) == 1
+
+
+def test_lost_claim_taken_over():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        body = json.dumps({"id_film_show": id_film_show, "row": 1, "place": 1})
+        fingerprint = hashlib.sha256(body.encode()).hexdigest()
+        headers = {"Idempotency-Key": "booking-1", "Content-Type": "application/json"}
+        # Workers crashed before saving the responses
+        claim = storage.idempotency_keys.claim
+        for key, age in [("booking-1", 0.5), ("booking-2", 2)]:
+            claimed_at = datetime.now() - timedelta(seconds=IDEMPOTENCY_LEASE * age)
+            args = ("POST /booking/", key, fingerprint, claimed_at, claimed_at)
+            assert client.portal.call(claim, *args) is None
+        response = client.post("/booking/", content=body, headers=headers)
+        assert response.status_code == 409
+        # After the lease the retry executes the request
+        headers["Idempotency-Key"] = "booking-2"
+        response = client.post("/booking/", content=body, headers=headers)
+        assert response.status_code == 200
+        retry = client.post("/booking/", content=body, headers=headers)
+        assert retry.headers["idempotent-replayed"] == "true"
+        assert retry.json() == response.json()
@@ -0,0 +1,46 @@
+import pytest
+from fastapi.testclient import TestClient
+from src.main import app
+from .create_functions import create_film_show_with_dependencies, create_booking
+
+
+def get_metric(text, sample):
+    for line in text.splitlines():
+        if line.startswith(sample + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0
+
+
+@pytest.mark.postgres
+def test_metrics():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        before = response.text
+        create_booking(client, id_film_show)
+        create_booking(client, id_film_show)
+        client.get(f"/booking/{99}")
+        after = client.get("/metrics").text
+        for sample, increase in [
+            ('booking_conflicts_total{endpoint="create_booking"}', 1),
+            ('http_requests_total{method="POST",route="/booking/",status="200"}', 1),
+            ('http_requests_total{method="POST",route="/booking/",status="400"}', 1),
+            (
+                'http_requests_total{method="GET",route="/booking/{id_booking}",'
+                'status="404"}',
+                1,
+            ),
+            ('http_request_duration_seconds_count{method="POST",route="/booking/"}', 2),
+            ('db_queries_per_request_count{route="/booking/{id_booking}"}', 1),
+            ('db_queries_per_request_sum{route="/booking/{id_booking}"}', 1),
+        ]:
+            assert get_metric(after, sample) == get_metric(before, sample) + increase
+        assert 'db_pool_connections{state="idle"}' in after
+        assert 'catalog_cache_hits_total{cache="film"}' in after
+        assert (
+            'single_flight_requests_total{flight="film_show",result="shared"}' in after
+        )
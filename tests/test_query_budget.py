@@ -0,0 +1,114 @@
+import pytest
+from fastapi.testclient import TestClient
+from src.main import app
+from .create_functions import create_booking, create_film_show_with_dependencies
+
+# Round trips to Postgres per request, pure reads do not open transactions
+pytestmark = pytest.mark.postgres
+
+
+def test_list_budget(query_log):
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        create_booking(client, id_film_show)
+        for url in [
+            "/cinema/",
+            "/film/",
+            "/booking/",
+            "/film-show/",
+            f"/cinema/{id_cinema}/hall/",
+        ]:
+            with query_log.budget(1):
+                assert client.get(url).status_code == 200, url
+        url = f"/cinema/{id_cinema}/hall/{id_hall}/film-show/"
+        # The hall is loaded once, then it is taken from the catalog cache
+        with query_log.budget(2):
+            assert client.get(url).status_code == 200
+        with query_log.budget(1):
+            assert client.get(url, params={"limit": 1}).status_code == 200
+        with query_log.budget(1):
+            assert client.get(f"/cinema/{id_cinema}/schedule").status_code == 200
+
+
+def test_get_budget(query_log):
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        url = f"/cinema/{id_cinema}/hall/{id_hall}"
+        with query_log.budget(1):
+            assert client.get(url).status_code == 200
+        with query_log.budget(0):
+            assert client.get(url).status_code == 200
+        with query_log.budget(1):
+            assert client.get(f"/film-show/{id_film_show}").status_code == 200
+
+
+def test_update_budget(query_log):
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        with query_log.budget(1):
+            response = client.patch(
+                f"/cinema/{id_cinema}", json={"name": "Moon", "city": "Kazan"}
+            )
+            assert response.status_code == 200
+        with query_log.budget(1):
+            response = client.patch(f"/cinema/{id_cinema + 1}", json={"name": "Moon"})
+            assert response.status_code == 404
+        with query_log.budget(1):
+            response = client.patch(f"/film/{id_film}", json={"duration": 90})
+            assert response.status_code == 200
+
+
+def test_create_booking_budget(query_log):
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        # Film show checks and the insert are one statement
+        for status_code in [200, 400]:
+            with query_log.budget(1):
+                response, id_booking = create_booking(client, id_film_show)
+                assert response.status_code == status_code
+        with query_log.budget(1):
+            response, id_booking = create_booking(client, id_film_show + 1)
+            assert response.status_code == 404
+
+
+def test_delete_budget(query_log):
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        response, id_booking = create_booking(client, id_film_show)
+        # DELETE ... USING film_show returns the hall for the list versions
+        with query_log.budget(1):
+            assert client.delete(f"/booking/{id_booking}").status_code == 200
+        with query_log.budget(1):
+            assert client.delete(f"/booking/{id_booking}").status_code == 404
+        with query_log.budget(1):
+            assert client.delete(f"/film-show/{id_film_show}").status_code == 200
+        with query_log.budget(1):
+            assert client.delete(f"/film-show/{id_film_show}").status_code == 404
+
+
+def test_confirm_seat_hold_budget(query_log):
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        response = client.post(
+            "/seat-hold/",
+            json={"id_film_show": id_film_show, "places": [{"row": 1, "place": 1}]},
+        )
+        token = response.json()["token"]
+        url = f"/cinema/{id_cinema}/hall/{id_hall}/film-show/"
+        etag = client.get(url).headers["ETag"]
+        # Transaction of DELETE ... USING film_show and INSERT, no hall lookup
+        with query_log.budget(4):
+            assert client.post(f"/seat-hold/{token}/confirm").status_code == 200
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
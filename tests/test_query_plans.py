@@ -0,0 +1,154 @@
+import argparse
+import datetime
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from benchmarks.seed import seed, CITIES, GENRES
+from src import metrics
+from src.db import db
+from src.idempotency import sweep_idempotency_keys
+from src.main import app
+from src.routers.seat_hold import sweep_expired_seat_holds
+from .create_functions import create_film_show_with_dependencies, create_booking
+from .test_seat_hold import create_seat_hold
+
+# Tables with fewer rows are read with a sequential scan by design, and
+# an index scan filtering out more rows is as bad as a sequential one
+LARGE_TABLE_ROWS = 1000
+STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+def make_recording_cursor(queries):
+    class RecordingCursor(metrics.MetricsCursor):
+        async def async_execute(self, query, timeout, args, limit=0, many=False):
+            if not many:
+                queries.setdefault(query, tuple(args))
+            return await super().async_execute(query, timeout, args, limit, many)
+
+    return RecordingCursor
+
+
+def walk_plan(plan):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from walk_plan(child)
+
+
+async def full_scans(queries):
+    """
+    Последовательные чтения больших таблиц и отброшенные фильтром строки
+    в планах запросов. Чтения выполняются (EXPLAIN ANALYZE) в откатываемой
+    транзакции, изменения уже выполнены и повторно нарушили бы уникальность.
+    """
+    found = []
+    async with db.acquire() as gino_conn:
+        conn = gino_conn.raw_connection
+        tables = await conn.fetch("SELECT relname, reltuples FROM pg_class")
+        large = {name for name, rows in tables if rows >= LARGE_TABLE_ROWS}
+        for query, args in queries.items():
+            statement = query.lstrip().split(None, 1)[0].upper()
+            if statement not in STATEMENTS:
+                continue
+            options = "ANALYZE, FORMAT JSON" if statement == "SELECT" else "FORMAT JSON"
+            transaction = conn.transaction()
+            await transaction.start()
+            try:
+                plan = await conn.fetchval(f"EXPLAIN ({options}) {query}", *args)
+            finally:
+                await transaction.rollback()
+            for node in walk_plan(json.loads(plan)[0]["Plan"]):
+                if node.get("Relation Name") not in large:
+                    continue
+                if (
+                    node["Node Type"] == "Seq Scan"
+                    or node.get("Rows Removed by Filter", 0) >= LARGE_TABLE_ROWS
+                ):
+                    found.append((node["Relation Name"], node["Node Type"], query))
+    return found
+
+
+@pytest.mark.postgres
+def test_router_queries_use_indexes(monkeypatch):
+    queries = {}
+    monkeypatch.setattr(metrics, "MetricsCursor", make_recording_cursor(queries))
+    with TestClient(app) as client:
+        client.portal.call(
+            seed,
+            argparse.Namespace(
+                cinemas=1000,
+                halls_per_cinema=3,
+                films=200,
+                days=5,
+                bookings=150000,
+                seed=42,
+                reset=False,
+            ),
+        )
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        seeded_show = client.get(
+            "/film-show/", params={"start_date": str(tomorrow), "limit": 1}
+        ).json()[0]
+        queries.clear()
+
+        response = client.get("/cinema/", params={"city": CITIES[0], "limit": 2})
+        client.get(
+            "/cinema/",
+            params={"city": CITIES[0], "cursor": response.headers["X-Next-Cursor"]},
+        )
+        client.get(f"/cinema/{id_cinema}")
+        client.get(f"/cinema/{id_cinema}/hall/")
+        client.get(f"/cinema/{id_cinema}/hall/{id_hall}")
+        client.get(f"/cinema/{id_cinema}/hall/{id_hall}/film-show/")
+        client.get(f"/cinema/{id_cinema}/schedule", params={"date": str(tomorrow)})
+        client.get("/cinema-hall/", params={"id_cinema": id_cinema})
+        client.get(f"/cinema-hall/{id_hall}")
+        client.get("/film/", params={"genre": GENRES[0]})
+        client.get(f"/film/{id_film}")
+        client.get(
+            "/film-show/",
+            params={"start_date": str(tomorrow), "end_date": str(tomorrow)},
+        )
+        client.get("/film-show/", params={"id_hall": seeded_show["id_hall"]})
+        client.get("/film-show/", params={"id_film": seeded_show["id_film"]})
+        client.get(f"/film-show/{seeded_show['id']}")
+        client.get(f"/film-show/{seeded_show['id']}/seats")
+        client.post(
+            "/film-show/",
+            json={
+                "start_time": f"{tomorrow}T10:30:00.000Z",
+                "id_hall": seeded_show["id_hall"],
+                "id_film": seeded_show["id_film"],
+            },
+        )
+        client.get("/booking/", params={"id_film_show": seeded_show["id"]})
+        response, id_booking = create_booking(client, id_film_show, row=1, place=1)
+        client.post(
+            "/booking/",
+            json={"id_film_show": id_film_show, "row": 1, "place": 2},
+            headers={"Idempotency-Key": "query-plans"},
+        )
+        client.get(f"/booking/{id_booking}")
+        client.post(
+            "/booking/batch",
+            json={
+                "id_film_show": id_film_show,
+                "places": [{"row": 2, "place": 1}, {"row": 2, "place": 2}],
+            },
+        )
+        client.post(
+            "/booking/best-available", json={"id_film_show": id_film_show, "count": 3}
+        )
+        client.delete(f"/booking/{id_booking}")
+        response, token = create_seat_hold(client, id_film_show)
+        client.post(f"/seat-hold/{token}/confirm")
+        response, token = create_seat_hold(client, id_film_show, places=((6, 1),))
+        client.delete(f"/seat-hold/{token}")
+        client.portal.call(sweep_expired_seat_holds)
+        client.portal.call(sweep_idempotency_keys)
+
+        assert len(queries) > 20
+        assert client.portal.call(full_scans, queries) == []
@@ -0,0 +1,48 @@
+import pytest
+from fastapi.testclient import TestClient
+from src.db import db, create_constraints, create_triggers
+from src.main import app
+from .create_functions import create_booking, create_film_show_with_dependencies
+
+# Schema changes are made inside the test transaction and rolled back
+pytestmark = pytest.mark.postgres
+
+
+async def drop_film_show_counters():
+    await db.status(
+        db.text("ALTER TABLE film_show DROP COLUMN sold, DROP COLUMN capacity")
+    )
+
+
+def test_film_show_counters_added():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        create_booking(client, id_film_show)
+        # Table created before the counters
+        client.portal.call(drop_film_show_counters)
+        client.portal.call(create_triggers)
+        response = client.get(f"/film-show/{id_film_show}")
+        assert response.json()["sold"] == 1
+        assert response.json()["capacity"] == 400
+        create_booking(client, id_film_show, row=1, place=1)
+        assert client.get(f"/film-show/{id_film_show}").json()["sold"] == 2
+
+
+async def drop_film_show_exclusion():
+    await db.status(
+        db.text("ALTER TABLE film_show DROP CONSTRAINT film_show_excl_hall_time")
+    )
+    await create_constraints()
+    return await db.scalar(
+        db.text("SELECT 1 FROM pg_constraint WHERE conname = :name"),
+        name="film_show_excl_hall_time",
+    )
+
+
+def test_film_show_exclusion_added():
+    with TestClient(app) as client:
+        create_film_show_with_dependencies(client)
+        # Table created before the constraint
+        assert client.portal.call(drop_film_show_exclusion) == 1
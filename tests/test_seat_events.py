@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from src import seat_events
+from src.db import Booking, Cinema, CinemaHall, Film, FilmShow, init_db, close_db
+from src.main import app
+from src.routers.film_show import seat_events as film_show_seat_events
+from src.seat_events import RESET, seat_channels
+from src.seats import seat_maps
+from datetime import datetime, timedelta
+
+
+@pytest.mark.asyncio
+async def test_coalesce(monkeypatch):
+    monkeypatch.setattr(seat_events, "SEAT_EVENTS_WINDOW", 0.01)
+    with seat_channels.subscribe(1) as queue, seat_channels.subscribe(1) as other:
+        seat_channels.publish(1, 1, 1, True)
+        seat_channels.publish(1, 1, 1, False)
+        seat_channels.publish(1, 2, 2, True)
+        # No subscribers - nothing to do
+        seat_channels.publish(2, 1, 1, True)
+        event = await asyncio.wait_for(queue.get(), 1)
+        assert json.loads(event) == {"taken": [[2, 2]], "released": [[1, 1]]}
+        assert await asyncio.wait_for(other.get(), 1) == event
+        assert queue.empty()
+    assert seat_channels._channels == {}
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_reset(monkeypatch):
+    monkeypatch.setattr(seat_events, "SEAT_EVENTS_QUEUE_SIZE", 2)
+    with seat_channels.subscribe(1) as queue:
+        for place in range(1, 4):
+            seat_channels.publish(1, 1, place, True)
+            seat_channels._channels[1].flush()
+        assert queue.get_nowait() is RESET
+        assert queue.empty()
+
+
+@pytest.mark.commit
+@pytest.mark.postgres
+@pytest.mark.asyncio
+async def test_notify():
+    await init_db()
+    ready = asyncio.Event()
+    listener = asyncio.ensure_future(seat_events.run_seat_listener(ready))
+    try:
+        await asyncio.wait_for(ready.wait(), 5)
+        id_film_show = await create_film_show()
+        events = film_show_seat_events(id_film_show)
+        snapshot = await events.__anext__()
+        assert snapshot.startswith("event: snapshot\n")
+        assert json.loads(snapshot.split("data: ")[1])["seats"][0] == "0" * 20
+        # Booking made by another worker comes through LISTEN/NOTIFY
+        await Booking.create(id_film_show=id_film_show, row=1, place=2)
+        delta = await asyncio.wait_for(events.__anext__(), 5)
+        assert delta.startswith("event: delta\n")
+        assert json.loads(delta.split("data: ")[1]) == {
+            "taken": [[1, 2]],
+            "released": [],
+        }
+        assert (await seat_maps.get(id_film_show)).is_taken(1, 2)
+        await Booking.delete.where(Booking.id_film_show == id_film_show).gino.status()
+        delta = await asyncio.wait_for(events.__anext__(), 5)
+        assert json.loads(delta.split("data: ")[1])["released"] == [[1, 2]]
+        await events.aclose()
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+        await close_db()
+
+
+async def create_film_show():
+    cinema = await Cinema.create(name="Star", city="Moscow")
+    hall = await CinemaHall.create(
+        id_cinema=cinema.id, name="First", rows=20, places_in_row=20
+    )
+    film = await Film.create(
+        title="The Avengers",
+        genre="Fantastic",
+        cast="Robert Downey Jr.",
+        description="Big fight",
+        duration=120,
+    )
+    start_time = datetime.now() + timedelta(days=2)
+    film_show = await FilmShow.create(
+        show_date=start_time.date(),
+        start_time=start_time,
+        end_time=start_time + timedelta(minutes=120),
+        id_hall=hall.id,
+        id_film=film.id,
+    )
+    return film_show.id
+
+
+def test_events_not_found():
+    with TestClient(app) as client:
+        response = client.get("/film-show/99/seats/events")
+        assert response.status_code == 404
@@ -0,0 +1,177 @@
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from src.main import app
+from src.routers import seat_hold
+from .create_functions import create_film_show_with_dependencies, create_booking
+
+
+def create_seat_hold(client, id_film_show, places=((5, 1), (5, 2))):
+    response = client.post(
+        "/seat-hold/",
+        json={
+            "id_film_show": id_film_show,
+            "places": [{"row": row, "place": place} for row, place in places],
+        },
+    )
+    if response.status_code != 200:
+        return response, ""
+    return response, response.json()["token"]
+
+
+def test_create():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        response, token = create_seat_hold(client, id_film_show)
+        assert response.status_code == 200, response.json()
+        assert response.json()["id_film_show"] == id_film_show
+        assert response.json()["places"] == [
+            {"row": 5, "place": 1},
+            {"row": 5, "place": 2},
+        ]
+        # Held places are not available on the seat map and for booking
+        response = client.get(f"/film-show/{id_film_show}/seats")
+        assert response.json()["seats"][4].startswith("11")
+        response, id_booking = create_booking(client, id_film_show, row=5, place=1)
+        assert response.status_code == 400
+        response = client.post(
+            "/booking/batch",
+            json={
+                "id_film_show": id_film_show,
+                "places": [{"row": 5, "place": 2}, {"row": 5, "place": 3}],
+            },
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"]["places"] == [{"row": 5, "place": 2}]
+
+
+def test_create_held_places():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        create_seat_hold(client, id_film_show)
+        response, token = create_seat_hold(
+            client, id_film_show, places=((5, 2), (5, 3))
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"]["places"] == [{"row": 5, "place": 2}]
+
+
+def test_create_places_out_of_hall():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        response, token = create_seat_hold(
+            client, id_film_show, places=((1, 1), (500, 500))
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"] == {
+            "message": "No such place in the hall",
+            "places": [{"row": 500, "place": 500}],
+        }
+        # Place inside the hall is not held either
+        response, id_booking = create_booking(client, id_film_show, row=1, place=1)
+        assert response.status_code == 200
+
+
+def test_create_too_many_places():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        places = [(row, place) for row in range(1, 21) for place in range(1, 21)]
+        response, token = create_seat_hold(client, id_film_show, places=places)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Too many places in request"
+
+
+def test_create_busy_places():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        create_booking(client, id_film_show, row=5, place=2)
+        response, token = create_seat_hold(client, id_film_show)
+        assert response.status_code == 400
+        assert response.json()["detail"]["places"] == [{"row": 5, "place": 2}]
+
+
+def test_confirm():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        response, token = create_seat_hold(client, id_film_show)
+        response = client.post(f"/seat-hold/{token}/confirm")
+        assert response.status_code == 200, response.json()
+        assert sorted(
+            (booking["row"], booking["place"]) for booking in response.json()
+        ) == [(5, 1), (5, 2)]
+        response = client.get("/booking/")
+        assert len(response.json()) == 2
+        # Hold can be confirmed only once
+        response = client.post(f"/seat-hold/{token}/confirm")
+        assert response.status_code == 404
+
+
+def test_confirm_gone(monkeypatch):
+    monkeypatch.setattr(seat_hold, "SEAT_HOLD_TTL", 7 * 24 * 3600)
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        response, token = create_seat_hold(client, id_film_show)
+
+        class ShowStarted(datetime):
+            @classmethod
+            def now(cls):
+                return datetime.now() + timedelta(days=3)
+
+        # Hold is still alive, but the film show has already started
+        monkeypatch.setattr(seat_hold, "datetime", ShowStarted)
+        response = client.post(f"/seat-hold/{token}/confirm")
+        assert response.status_code == 400
+        assert response.json()["detail"] == "This film show already gone"
+        assert client.get("/booking/").json() == []
+
+
+def test_delete():
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        response, token = create_seat_hold(client, id_film_show)
+        response = client.delete(f"/seat-hold/{token}")
+        assert response.status_code == 200
+        response = client.get(f"/film-show/{id_film_show}/seats")
+        assert response.json()["seats"][4] == "0" * 20
+        response, id_booking = create_booking(client, id_film_show, row=5, place=1)
+        assert response.status_code == 200
+
+
+def test_delete_not_found():
+    with TestClient(app) as client:
+        response = client.delete("/seat-hold/unknown")
+        assert response.status_code == 404
+
+
+def test_expired(monkeypatch):
+    monkeypatch.setattr(seat_hold, "SEAT_HOLD_TTL", -1)
+    monkeypatch.setattr(seat_hold, "SEAT_HOLD_SWEEP_INTERVAL", 3600)
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        response, token = create_seat_hold(client, id_film_show)
+        # Expired hold can not be confirmed and does not block places
+        response = client.post(f"/seat-hold/{token}/confirm")
+        assert response.status_code == 404
+        response, id_booking = create_booking(client, id_film_show, row=5, place=1)
+        assert response.status_code == 200
+        # Sweeper removes expired holds and releases places
+        assert client.portal.call(seat_hold.sweep_expired_seat_holds) == 2
+        response = client.get(f"/film-show/{id_film_show}/seats")
+        assert response.json()["seats"][4] == "1" + "0" * 19
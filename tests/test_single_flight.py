@@ -0,0 +1,101 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from src.main import app
+from src.single_flight import SingleFlight, film_show_flight
+from src.storage import storage
+from .create_functions import create_film_show_with_dependencies
+
+
+@pytest.mark.asyncio
+async def test_concurrent_reads_share_load():
+    flight = SingleFlight("test", window=0)
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b"[]"
+
+    results = await asyncio.gather(*(flight.run(("a",), load) for _ in range(5)))
+    assert results == [b"[]"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"leader": 1, "shared": 4, "cached": 0}
+    # Finished load is not reused without a window
+    await flight.run(("a",), load)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_window():
+    flight = SingleFlight("test", window=0.05)
+    calls = []
+
+    async def load():
+        calls.append(1)
+        return len(calls)
+
+    assert await flight.run(("a",), load) == 1
+    assert await flight.run(("a",), load) == 1
+    assert await flight.run(("b",), load) == 2
+    await asyncio.sleep(0.06)
+    assert await flight.run(("a",), load) == 3
+    assert flight.stats() == {"leader": 3, "shared": 0, "cached": 1}
+
+
+@pytest.mark.asyncio
+async def test_error_is_shared():
+    flight = SingleFlight("test", window=1)
+
+    async def load():
+        await asyncio.sleep(0.01)
+        raise ValueError("failed")
+
+    results = await asyncio.gather(
+        flight.run(("a",), load), flight.run(("a",), load), return_exceptions=True
+    )
+    assert [type(result) for result in results] == [ValueError, ValueError]
+    # Errors are not cached
+    with pytest.raises(ValueError):
+        await flight.run(("a",), load)
+    assert flight.stats()["leader"] == 2
+
+
+def test_film_show_list_coalesced(monkeypatch):
+    with TestClient(app) as client:
+        id_cinema, id_hall, id_film, id_film_show = create_film_show_with_dependencies(
+            client
+        )
+        film_shows = storage._storage.film_shows
+        list_film_shows = film_shows.list
+        calls = []
+
+        async def slow_list(*args, **kwargs):
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return await list_film_shows(*args, **kwargs)
+
+        monkeypatch.setattr(film_shows, "list", slow_list)
+
+        async def get_all():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://test"
+            ) as async_client:
+                return await asyncio.gather(
+                    *(
+                        async_client.get(
+                            f"/cinema/{id_cinema}/hall/{id_hall}/film-show/"
+                        )
+                        for _ in range(5)
+                    )
+                )
+
+        stats = film_show_flight.stats()
+        responses = client.portal.call(get_all)
+        assert [response.status_code for response in responses] == [200] * 5
+        assert len({response.content for response in responses}) == 1
+        assert len(calls) == 1
+        assert film_show_flight.stats()["shared"] == stats["shared"] + 4
@@ -0,0 +1,142 @@
+import pytest
+from src.seats import seat_maps
+from src import storage as storage_module
+from src.storage import (
+    FilmShowGoneError,
+    FilmShowNotFoundError,
+    PlaceOutOfHallError,
+    PlacesBusyError,
+    PlacesHeldError,
+    ShowTimeBusyError,
+)
+from src.storage.base import CinemaRepository
+from src.storage.memory import MemoryStorage
+from datetime import datetime, timedelta
+
+
+async def create_film_show(storage, start_time=None):
+    cinema = await storage.cinemas.create(name="Star", city="Moscow")
+    hall = await storage.halls.create(
+        id_cinema=cinema.id, name="First", rows=20, places_in_row=20
+    )
+    film = await storage.films.create(
+        title="The Avengers",
+        genre="Fantastic",
+        cast="Robert Downey Jr.",
+        description="Big fight",
+        duration=120,
+    )
+    start_time = start_time or datetime.now() + timedelta(days=2)
+    return await storage.film_shows.create(
+        show_date=start_time.date(),
+        start_time=start_time,
+        end_time=start_time + timedelta(minutes=120),
+        id_hall=hall.id,
+        id_film=film.id,
+    )
+
+
+@pytest.mark.asyncio
+async def test_memory_show_time_overlap():
+    storage = MemoryStorage()
+    film_show = await create_film_show(storage)
+    values = dict(
+        show_date=film_show.show_date,
+        start_time=film_show.end_time,
+        end_time=film_show.end_time + timedelta(minutes=90),
+        id_hall=film_show.id_hall,
+        id_film=film_show.id_film,
+    )
+    with pytest.raises(ShowTimeBusyError):
+        await storage.film_shows.create(**values)
+    later = dict(values, start_time=values["end_time"] + timedelta(minutes=1))
+    later["end_time"] = later["start_time"] + timedelta(minutes=90)
+    # Batch is rejected as a whole, its shows overlap each other
+    with pytest.raises(ShowTimeBusyError):
+        await storage.film_shows.create_many([later, dict(later)])
+    assert len(await storage.film_shows.list()) == 1
+
+
+@pytest.mark.asyncio
+async def test_memory_bookings():
+    storage = MemoryStorage()
+    film_show = await create_film_show(storage)
+    await storage.bookings.create(film_show.id, 1, 1)
+    with pytest.raises(PlacesBusyError) as error:
+        await storage.bookings.create_many(film_show.id, [(1, 2), (1, 1)])
+    assert error.value.places == [(1, 1)]
+    now = datetime.now()
+    await storage.seat_holds.create("token", film_show.id, [(2, 1)], now, now)
+    # Expired hold does not stop a booking
+    booking_list = await storage.bookings.create_many(
+        film_show.id, [(1, 2), (2, 1)], held_at=now
+    )
+    assert [(booking.row, booking.place) for booking in booking_list] == [
+        (1, 2),
+        (2, 1),
+    ]
+    assert film_show.sold == 3 and film_show.capacity == 400
+    booking, id_hall = await storage.bookings.delete(booking_list[0].id)
+    assert (booking.id, id_hall) == (booking_list[0].id, film_show.id_hall)
+    assert sorted(await storage.bookings.places(film_show.id)) == [(1, 1), (2, 1)]
+    assert film_show.sold == 2
+
+
+@pytest.mark.asyncio
+async def test_memory_book():
+    storage = MemoryStorage()
+    film_show = await create_film_show(storage)
+    now = datetime.now()
+    booking, id_hall = await storage.bookings.book(film_show.id, 1, 1, now)
+    assert (booking.row, booking.place, id_hall) == (1, 1, film_show.id_hall)
+    with pytest.raises(PlacesBusyError):
+        await storage.bookings.book(film_show.id, 1, 1, now)
+    with pytest.raises(PlaceOutOfHallError):
+        await storage.bookings.book(film_show.id, 21, 1, now)
+    with pytest.raises(FilmShowGoneError):
+        await storage.bookings.book(film_show.id, 1, 2, film_show.start_time)
+    with pytest.raises(FilmShowNotFoundError):
+        await storage.bookings.book(film_show.id + 1, 1, 2, now)
+
+
+@pytest.mark.asyncio
+async def test_memory_seat_holds(monkeypatch):
+    storage = MemoryStorage()
+    # Seat maps are loaded from the active storage
+    monkeypatch.setattr(storage_module.storage, "_storage", storage)
+    film_show = await create_film_show(storage)
+    seat_map = await seat_maps.get(film_show.id)
+    now = datetime.now()
+    expires_at = now + timedelta(minutes=5)
+    await storage.seat_holds.create("first", film_show.id, [(3, 3)], expires_at, now)
+    assert seat_map.is_taken(3, 3)
+    with pytest.raises(PlacesHeldError) as error:
+        await storage.seat_holds.create(
+            "second", film_show.id, [(3, 3), (3, 4)], expires_at, now
+        )
+    assert error.value.places == [(3, 3)]
+    booking_list, id_halls = await storage.seat_holds.confirm("first", now)
+    assert id_halls == {film_show.id_hall}
+    assert [(booking.row, booking.place) for booking in booking_list] == [(3, 3)]
+    assert await storage.seat_holds.confirm("first", now) == ([], set())
+    await storage.seat_holds.create("third", film_show.id, [(4, 4)], now, now)
+    assert await storage.seat_holds.sweep(now, 10) == [(film_show.id, 4, 4)]
+    assert not seat_map.is_taken(4, 4)
+    assert seat_map.is_taken(3, 3)
+
+
+@pytest.mark.asyncio
+async def test_memory_hall_resize():
+    storage = MemoryStorage()
+    film_show = await create_film_show(storage)
+    await storage.halls.update(film_show.id_hall, rows=10)
+    assert film_show.capacity == 200
+
+
+def test_incomplete_repository():
+    class PartialCinemaRepository(CinemaRepository):
+        async def get(self, id_cinema):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialCinemaRepository()